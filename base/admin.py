@@ -1,7 +1,103 @@
 from django.contrib import admin
-from .models import Room, Reservation, TimeSlot
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from .models import Room, Reservation, ReservationSeries, ChatMessage, IdempotencyKey, TimeSlot, WaitlistEntry
+from .pagination import approximate_count
 
-# Register your models here
-admin.site.register(Room)
-admin.site.register(Reservation)
-admin.site.register(TimeSlot)
\ No newline at end of file
+# Changelists count at most this many rows; narrow further with filters,
+# search or the date hierarchy
+ADMIN_COUNT_LIMIT = 10000
+# Search terms shorter than this would match too much to be useful
+MIN_SEARCH_LENGTH = 3
+
+
+class CappedCountPaginator(Paginator):
+    """Paginator whose COUNT stops at ADMIN_COUNT_LIMIT instead of reading every row"""
+
+    @cached_property
+    def count(self):
+        return approximate_count(self.object_list, ADMIN_COUNT_LIMIT)[0]
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Defaults for changelists over large tables: no unfiltered COUNT(*),
+    capped page counts, and search only with prefix or exact lookups
+    (search_fields starting with '^' or '=') on terms of a useful length.
+    """
+    paginator = CappedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_search_results(self, request, queryset, search_term):
+        if len(search_term.strip()) < MIN_SEARCH_LENGTH:
+            return queryset, False
+        return super().get_search_results(request, queryset, search_term)
+
+
+@admin.register(Room)
+class RoomAdmin(admin.ModelAdmin):
+    list_display = ('name', 'capacity', 'has_projector', 'has_whiteboard', 'has_video_conference')
+    search_fields = ('name',)  # also backs the room autocomplete of the other admins
+
+
+@admin.register(TimeSlot)
+class TimeSlotAdmin(admin.ModelAdmin):
+    list_display = ('start_time', 'end_time', 'is_active')
+    list_editable = ('is_active',)
+
+
+@admin.register(Reservation)
+class ReservationAdmin(LargeTableAdmin):
+    list_display = ('title', 'room', 'user', 'date', 'start_time', 'end_time', 'reminder_sent')
+    list_select_related = ('room', 'user')
+    list_filter = ('room', 'reminder_sent')
+    date_hierarchy = 'date'  # leads reservation_day_bounds_idx
+    ordering = ('-date', '-start_time')
+    search_fields = ('=user__username', '^title')
+    search_help_text = 'Exact username or the start of a title'
+    autocomplete_fields = ('room',)
+    raw_id_fields = ('user', 'series')
+    readonly_fields = ('starts_at', 'ends_at', 'created', 'updated')
+
+
+@admin.register(ChatMessage)
+class ChatMessageAdmin(LargeTableAdmin):
+    list_display = ('__str__', 'reservation', 'timestamp')
+    list_select_related = ('user', 'reservation__room')
+    date_hierarchy = 'timestamp'  # chat_timestamp_idx
+    ordering = ('-timestamp',)
+    search_fields = ('=user__username', '=reservation__id')
+    search_help_text = 'Exact username or reservation id'
+    raw_id_fields = ('reservation', 'user')
+
+
+@admin.register(ReservationSeries)
+class ReservationSeriesAdmin(LargeTableAdmin):
+    list_display = ('title', 'room', 'user', 'frequency', 'starts_on', 'until', 'materialized_until')
+    list_select_related = ('room', 'user')
+    list_filter = ('frequency',)
+    search_fields = ('=user__username', '^title')
+    search_help_text = 'Exact username or the start of a title'
+    autocomplete_fields = ('room',)
+    raw_id_fields = ('user',)
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(LargeTableAdmin):
+    list_display = ('key', 'user', 'status_code', 'created')
+    list_select_related = ('user',)
+    search_fields = ('=key', '=user__username')
+    search_help_text = 'Exact key or username'
+    raw_id_fields = ('user',)
+
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(LargeTableAdmin):
+    list_display = ('title', 'room', 'user', 'date', 'start_time', 'status', 'created')
+    list_select_related = ('room', 'user')
+    list_filter = ('status', 'room')
+    search_fields = ('=user__username', '^title')
+    search_help_text = 'Exact username or the start of a title'
+    autocomplete_fields = ('room',)
+    raw_id_fields = ('user', 'reservation')
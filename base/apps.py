@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'base'
+
+    def ready(self):
+        from . import signals  # noqa: F401 - registers the model signal handlers
+        from . import timeslots  # noqa: F401 - registers the slot catalog warm-up
@@ -0,0 +1,102 @@
+# base/attendees.py
+from collections import defaultdict
+
+from django.db import connection
+
+from .freebusy import busy_index, overlap
+from .models import Attendee, Reservation
+
+# Emails per query, only where the database limits the bound parameters (SQLite)
+LOOKUP_CHUNK = (connection.features.max_query_params or 0) // 2 or None
+# Most emails one availability request may ask about
+MAX_ATTENDEE_LOOKUP = 5000
+
+
+def parse_emails(value):
+    """Lower-cased, de-duplicated addresses of a comma separated list"""
+    if isinstance(value, (list, tuple)):
+        value = ','.join(value)
+    emails = []
+    for email in (value or '').split(','):
+        email = email.strip().lower()
+        if email and email not in emails:
+            emails.append(email)
+    return emails
+
+
+def reservation_emails(reservation):
+    emails = parse_emails(reservation.participants_emails)
+    organizer = (reservation.user.email or '').strip().lower()
+    if organizer and organizer not in emails:
+        emails.append(organizer)
+    return emails
+
+
+def index_attendees(reservations, replace=False):
+    """Write the attendee rows of saved reservations with one insert"""
+    if replace:
+        Attendee.objects.filter(reservation_id__in=[reservation.id for reservation in reservations]).delete()
+    Attendee.objects.bulk_create([
+        Attendee(reservation_id=reservation.id, email=email)
+        for reservation in reservations
+        for email in reservation_emails(reservation)
+    ], ignore_conflicts=True)
+
+
+def attendee_conflicts(emails, dates, start_time, end_time, exclude=()):
+    """
+    Reservations that any of ``emails`` already attend on ``dates`` between
+    ``start_time`` and ``end_time``, as {email: [(date, start, end, room), ...]}.
+    Compared on the aware spans, so meetings across midnight count on both
+    days. A single indexed query, split only if the database limits its
+    parameters; it reads the span of all ``dates`` and keeps the overlaps.
+    """
+    emails = parse_emails(emails)
+    spans = [Reservation.span(day, start_time, end_time) for day in dates]
+    if not emails or not spans:
+        return {}
+    wanted = busy_index(spans)
+    chunk = LOOKUP_CHUNK or len(emails)
+    conflicts = defaultdict(list)
+    for offset in range(0, len(emails), chunk):
+        rows = Attendee.objects.filter(
+            email__in=emails[offset:offset + chunk],
+            reservation__starts_at__lt=max(end for _, end in spans),
+            reservation__ends_at__gt=min(start for start, _ in spans),
+        ).exclude(reservation_id__in=exclude).order_by(
+            'email', 'reservation__starts_at'
+        ).values_list(
+            'email', 'reservation__date', 'reservation__start_time', 'reservation__end_time',
+            'reservation__room__name', 'reservation__starts_at', 'reservation__ends_at',
+        )
+        for email, day, busy_start, busy_end, room_name, starts_at, ends_at in rows:
+            if overlap(wanted, starts_at, ends_at):
+                conflicts[email].append((day, busy_start, busy_end, room_name))
+    return dict(conflicts)
+
+
+def attendee_busy(emails, start, end):
+    """Aware (starts_at, ends_at) of every meeting any of ``emails`` attend between ``start`` and ``end``"""
+    emails = parse_emails(emails)
+    chunk = LOOKUP_CHUNK or len(emails) or 1
+    busy = []
+    for offset in range(0, len(emails), chunk):
+        busy.extend(Attendee.objects.filter(
+            email__in=emails[offset:offset + chunk],
+            reservation__starts_at__lt=end,
+            reservation__ends_at__gt=start,
+        ).values_list('reservation__starts_at', 'reservation__ends_at').distinct())
+    return busy
+
+
+def describe_conflicts(conflicts, limit=5):
+    """Short human readable list of who is busy where"""
+    parts = [
+        f"{email} ({room_name}, {day} {busy_start.strftime('%H:%M')}-{busy_end.strftime('%H:%M')})"
+        for email, busy in sorted(conflicts.items())
+        for day, busy_start, busy_end, room_name in busy[:1]
+    ]
+    shown = ', '.join(parts[:limit])
+    if len(parts) > limit:
+        shown += f" and {len(parts) - limit} more"
+    return shown
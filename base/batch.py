@@ -0,0 +1,132 @@
+# base/batch.py
+import hashlib
+import json
+import logging
+from datetime import date, datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .attendees import index_attendees
+from .counters import count_reservations
+from .importer import ImportResult, Lookups, RowError, build_row, sweep_conflicts
+from .models import IdempotencyKey, Reservation
+from .signals import bulk_reservations_changed
+from .utils import local_now
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 200
+# A retry with the same Idempotency-Key within this time gets the stored answer
+IDEMPOTENCY_TTL = timedelta(hours=24)
+
+
+def fingerprint(payload):
+    """Hash of a request body that ignores key order and whitespace"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def stored_response(user, key, request_hash):
+    """(status, body) recorded for an earlier request with this key, or None"""
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is None:
+        return None
+    if record.created < timezone.now() - IDEMPOTENCY_TTL:
+        record.delete()
+        return None
+    if record.fingerprint != request_hash:
+        return 422, {'error': 'This Idempotency-Key was already used for a different request'}
+    return record.status_code, record.response
+
+
+def parse_items(items, lookups, result):
+    """Rows of the batch items; ``line`` is the item's index"""
+    now = local_now()
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise RowError("Expected an object")
+            day = date.fromisoformat(str(item.get('date') or ''))
+            start_time = time.fromisoformat(str(item.get('start') or ''))
+            end_time = time.fromisoformat(str(item.get('end') or ''))
+            if datetime.combine(day, start_time) < now:
+                raise RowError("Cannot book a time in the past")
+            emails = item.get('participants_emails') or ''
+            if isinstance(emails, list):
+                emails = ', '.join(emails)
+            yield build_row(
+                lookups, index, str(item.get('room') or ''), day, start_time, end_time,
+                str(item.get('title') or '').strip(),
+                participant_count=item.get('participant_count'),
+                participants_emails=str(emails),
+                description=str(item.get('description') or ''),
+            )
+        except (RowError, ValueError, TypeError) as e:
+            result.error(index, str(e))
+
+
+def rejected(status, message, result):
+    result.errors.sort()
+    return status, {
+        'error': message,
+        'errors': [{'index': index, 'error': error} for index, error in result.errors],
+    }
+
+
+def book_batch(user, items, key=None, request_hash=None):
+    """
+    Check every item of the batch, then book all of them in one transaction
+    or none. Returns ``(status, body, replayed)``; with an idempotency ``key``
+    the answer to a successful batch is stored and replayed on retries.
+    """
+    if key:
+        stored = stored_response(user, key, request_hash)
+        if stored is not None:
+            return stored + (True,)
+
+    result = ImportResult()
+    rows = list(parse_items(items, Lookups(user), result))
+    if result.errors:
+        return rejected(400, 'Invalid items, nothing was booked', result) + (False,)
+
+    try:
+        with transaction.atomic():
+            rows = sweep_conflicts(rows, result, "Overlaps item {} of the same batch")
+            if result.errors:
+                return rejected(409, 'Some rooms are already booked, nothing was booked', result) + (False,)
+            created = Reservation.objects.bulk_create([
+                Reservation(
+                    room=row.room, user=user, title=row.title, description=row.description,
+                    date=row.date, start_time=row.start_time, end_time=row.end_time,
+                    participant_count=row.participant_count, participants_emails=row.participants_emails,
+                ).set_span()
+                for row in sorted(rows, key=lambda row: row.line)
+            ])
+            index_attendees(created)
+            count_reservations(created)
+            body = {'reservations': [
+                {
+                    'id': reservation.id,
+                    'room': reservation.room_id,
+                    'date': reservation.date.isoformat(),
+                    'start': reservation.start_time.strftime('%H:%M'),
+                    'end': reservation.end_time.strftime('%H:%M'),
+                    'title': reservation.title,
+                }
+                for reservation in created
+            ]}
+            if key:
+                IdempotencyKey.objects.filter(user=user, created__lt=timezone.now() - IDEMPOTENCY_TTL).delete()
+                IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=request_hash, status_code=201, response=body,
+                )
+            transaction.on_commit(lambda: bulk_reservations_changed(created))
+    except IntegrityError:
+        # A concurrent request took one of the slots, or the same key won the race
+        stored = stored_response(user, key, request_hash) if key else None
+        if stored is not None:
+            return stored + (True,)
+        return 409, {'error': 'Some rooms were booked meanwhile, nothing was booked', 'errors': []}, False
+
+    logger.info(f"Batch of {len(created)} reservations booked by {user.username}")
+    return 201, body, False
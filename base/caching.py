@@ -0,0 +1,154 @@
+# base/caching.py
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Namespaces bumped by the model signals in signals.py
+ROOMS = 'rooms'
+RESERVATIONS = 'reservations'
+TIMESLOTS = 'timeslots'
+
+MISSING = object()
+
+
+class TwoTierCache:
+    """
+    Small read-through cache for catalog data: a bounded in-process LRU (L1)
+    in front of the shared Django cache (L2, Redis in production).
+
+    Every namespace has a version counter in L2 that is part of each key, so
+    bumping it invalidates the whole namespace at once without deleting
+    anything. Processes re-read a namespace's version at most every
+    ``l1_ttl`` seconds; a bump made by this process is seen immediately,
+    other workers see it within ``l1_ttl``.
+    """
+
+    def __init__(self, max_entries=1024, l1_ttl=5):
+        self.max_entries = max_entries
+        self.l1_ttl = l1_ttl
+        self.local = OrderedDict()  # (namespace, version, key) -> value
+        self.versions = {}  # namespace -> (version, read at)
+        self.lock = threading.Lock()
+        self.counters = Counter()
+
+    def version(self, namespace):
+        now = time.monotonic()
+        cached = self.versions.get(namespace)
+        if cached and now - cached[1] < self.l1_ttl:
+            return cached[0]
+        version_key = f'ns_version:{namespace}'
+        version = cache.get(version_key)
+        if version is None:
+            # Seed with a timestamp so an evicted counter never restarts at a
+            # version whose entries are still in L2
+            cache.add(version_key, time.time_ns(), timeout=None)
+            version = cache.get(version_key)
+        self.versions[namespace] = (version, now)
+        return version
+
+    def get_or_set(self, namespace, key, default, timeout=None):
+        """Return the cached value of ``key``, computing it with ``default()`` on a miss"""
+        version = self.version(namespace)
+        local_key = (namespace, version, key)
+        with self.lock:
+            value = self.local.get(local_key, MISSING)
+            if value is not MISSING:
+                self.local.move_to_end(local_key)
+                self.counters['l1_hits'] += 1
+                return value
+
+        shared_key = f'{namespace}:{version}:{key}'
+        value = cache.get(shared_key, MISSING)
+        if value is MISSING:
+            self.counters['misses'] += 1
+            value = default()
+            cache.set(shared_key, value, timeout=timeout)
+        else:
+            self.counters['l2_hits'] += 1
+
+        with self.lock:
+            self.local[local_key] = value
+            self.local.move_to_end(local_key)
+            while len(self.local) > self.max_entries:
+                self.local.popitem(last=False)
+                self.counters['evictions'] += 1
+        return value
+
+    def get_or_set_many(self, namespace, keys, load, timeout=None):
+        """
+        Values of ``keys`` from the shared cache only, with a single lookup;
+        ``load(missing_keys)`` returns a dict for those it did not find. Meant
+        for entries too large or too many for the per-process L1.
+        """
+        version = self.version(namespace)
+        shared_keys = {f'{namespace}:{version}:{key}': key for key in keys}
+        values = {shared_keys[shared_key]: value for shared_key, value in cache.get_many(shared_keys).items()}
+        self.counters['l2_hits'] += len(values)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            self.counters['misses'] += len(missing)
+            loaded = load(missing)
+            cache.set_many({f'{namespace}:{version}:{key}': value for key, value in loaded.items()}, timeout=timeout)
+            values.update(loaded)
+        return values
+
+    def bump(self, namespace):
+        """Invalidate every entry of ``namespace`` in all processes"""
+        version_key = f'ns_version:{namespace}'
+        try:
+            version = cache.incr(version_key)
+        except ValueError:
+            cache.add(version_key, time.time_ns(), timeout=None)
+            version = cache.get(version_key)
+        self.versions[namespace] = (version, time.monotonic())
+        with self.lock:
+            for local_key in [k for k in self.local if k[0] == namespace]:
+                del self.local[local_key]
+
+    def stats(self):
+        """Hit/miss counters of this process since start (or the last reset)"""
+        lookups = self.counters['l1_hits'] + self.counters['l2_hits'] + self.counters['misses']
+        hits = lookups - self.counters['misses']
+        return {
+            **self.counters,
+            'entries': len(self.local),
+            'hit_ratio': hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        """Drop this process's L1 and counters (tests, debugging)"""
+        with self.lock:
+            self.local.clear()
+            self.versions.clear()
+            self.counters.clear()
+
+
+catalog_cache = TwoTierCache(
+    max_entries=getattr(settings, 'CATALOG_CACHE_L1_SIZE', 1024),
+    l1_ttl=getattr(settings, 'CATALOG_CACHE_L1_TTL', 5),
+)
+
+
+_warmups = []
+
+
+def warmup(func):
+    """Register a function that fills the catalog cache when a worker starts"""
+    _warmups.append(func)
+    return func
+
+
+def warm_up():
+    """Run the registered warm-up functions; a failing one is logged and skipped"""
+    for func in _warmups:
+        try:
+            func()
+        except Exception as e:
+            logger.error(f"Cache warm-up {func.__name__} failed: {str(e)}")
+    logger.info(f"Catalog cache warmed: {catalog_cache.stats()}")
@@ -1,13 +1,188 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
+import asyncio
 import json
+import random
+import time
+from urllib.parse import parse_qs
 from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from .eventlog import ReservationEventLog
 from .models import ChatMessage, Reservation
+from .roomstatus import ROOM_STATUS_GROUP
 
 User = get_user_model()
 
-class ChatConsumer(AsyncWebsocketConsumer):
+# Disposable UI state (typing indicators, cursors, raised hands) that is
+# broadcast to the group but never written to the database.
+EPHEMERAL_KINDS = ('typing', 'cursor', 'raise_hand')
+EPHEMERAL_MAX_PAYLOAD = 1024
+
+
+class EphemeralBuffer:
+    """Coalesces ephemeral state per group and flushes it at a fixed rate.
+
+    Every (sender, kind) pair keeps only its latest value until the next flush,
+    and each group gets at most one ``group_send`` per interval no matter how
+    many participants are typing or moving their cursor.
+    """
+
+    def __init__(self, max_rate):
+        self.interval = 1.0 / max_rate
+        self.pending = {}  # group name -> {(sender_id, kind): state}
+        self.flushers = {}  # group name -> scheduled flush task
+
+    def push(self, channel_layer, group, sender_id, username, kind, data):
+        self.pending.setdefault(group, {})[(sender_id, kind)] = {
+            'sender_id': sender_id,
+            'username': username,
+            'kind': kind,
+            'data': data,
+        }
+        if group not in self.flushers:
+            self.flushers[group] = asyncio.ensure_future(self._flush_later(channel_layer, group))
+
+    def discard_sender(self, group, sender_id):
+        """Drop anything a departing sender still has queued for the group."""
+        pending = self.pending.get(group)
+        if pending:
+            for key in [key for key in pending if key[0] == sender_id]:
+                del pending[key]
+
+    async def flush(self, channel_layer, group):
+        """Send whatever is queued for the group right away."""
+        flusher = self.flushers.pop(group, None)
+        if flusher:
+            flusher.cancel()
+        states = list(self.pending.pop(group, {}).values())
+        if states:
+            await channel_layer.group_send(group, {
+                'type': 'ephemeral_batch',
+                'states': states,
+            })
+
+    async def _flush_later(self, channel_layer, group):
+        # When flush() cancels us it has already taken the group's states and
+        # a newer push may have scheduled another flusher, so leave both alone.
+        await asyncio.sleep(self.interval)
+        if self.flushers.get(group) is asyncio.current_task():
+            del self.flushers[group]
+        states = list(self.pending.pop(group, {}).values())
+        if states:
+            await channel_layer.group_send(group, {
+                'type': 'ephemeral_batch',
+                'states': states,
+            })
+
+
+ephemeral_buffer = EphemeralBuffer(getattr(settings, 'EPHEMERAL_MAX_RATE', 10))
+
+
+class EphemeralStateMixin:
+    """Adds the ``ephemeral`` message type to a group-based consumer."""
+
+    async def handle_ephemeral(self, data):
+        kind = data.get('kind')
+        if kind not in EPHEMERAL_KINDS:
+            raise ValueError(f"Unknown ephemeral kind: {kind}")
+
+        payload = data.get('data')
+        if len(json.dumps(payload)) > EPHEMERAL_MAX_PAYLOAD:
+            raise ValueError("Ephemeral payload too large")
+
+        ephemeral_buffer.push(
+            self.channel_layer,
+            self.room_group_name,
+            str(self.user.id),
+            self.user.username,
+            kind,
+            payload,
+        )
+
+    async def ephemeral_batch(self, event):
+        """Forward other participants' coalesced state to the WebSocket"""
+        states = [state for state in event['states'] if state['sender_id'] != str(self.user.id)]
+        if states:
+            await self.send(text_data=json.dumps({
+                'type': 'ephemeral',
+                'states': states,
+            }))
+
+
+# Every realtime consumer listens on this group so a deploy can drain all
+# workers with a single broadcast (see the drain_realtime command).
+DRAIN_GROUP = 'realtime_drain'
+# WebSocket close code telling clients the server is restarting.
+CLOSE_SERVICE_RESTART = 1012
+# Shared cache key holding when drain_realtime last ran. It reaches workers
+# that have no socket in DRAIN_GROUP and so never get the broadcast.
+DRAIN_KEY = 'realtime:drain_requested_at'
+
+
+class DrainState:
+    """Process-wide drain flag, set once this worker is told to drain."""
+
+    def __init__(self):
+        self.draining = False
+        self.started = time.time()
+
+    async def check(self):
+        """Whether a drain was requested since this worker started."""
+        if not self.draining:
+            requested = await cache.aget(DRAIN_KEY)
+            self.draining = requested is not None and requested >= self.started
+        return self.draining
+
+
+drain_state = DrainState()
+
+
+class DrainableMixin:
+    """
+    Lets a consumer take part in a graceful drain: new sockets are refused,
+    open ones get a reconnect hint with a random delay inside the drain window
+    and are then closed at that moment, so clients come back spread over the
+    window instead of all in the same second.
+    """
+
+    refused = False
+
+    async def refuse_if_draining(self):
+        """Close a new socket when this worker is draining, returns True if so"""
+        self.refused = await drain_state.check()
+        if self.refused:
+            # Accept first: closing during the handshake is seen as a 403
+            # instead of the restart code the client reconnects on
+            await self.accept()
+            await self.close(code=CLOSE_SERVICE_RESTART)
+        return self.refused
+
+    async def join_drain_group(self):
+        await self.channel_layer.group_add(DRAIN_GROUP, self.channel_name)
+
+    async def leave_drain_group(self):
+        await self.channel_layer.group_discard(DRAIN_GROUP, self.channel_name)
+
+    async def server_drain(self, event):
+        """Hint the client to reconnect elsewhere and close after a random delay"""
+        drain_state.draining = True
+        delay = random.uniform(0, event['window'])
+        await self.send(text_data=json.dumps({
+            'type': 'reconnect',
+            'delay_ms': int(delay * 1000)
+        }))
+        # Nothing buffered for the group should be lost with the socket
+        await ephemeral_buffer.flush(self.channel_layer, self.room_group_name)
+        self.drain_task = asyncio.ensure_future(self.close_after(delay))
+
+    async def close_after(self, delay):
+        await asyncio.sleep(delay)
+        await self.close(code=CLOSE_SERVICE_RESTART)
+
+
+class ChatConsumer(DrainableMixin, EphemeralStateMixin, AsyncWebsocketConsumer):
     async def connect(self):
         # Extract reservation ID from URL
         self.reservation_id = self.scope['url_route']['kwargs']['reservation_id']
@@ -18,44 +193,59 @@ class ChatConsumer(AsyncWebsocketConsumer):
         # Get the current user
         self.user = self.scope["user"]
         
+        # A draining worker does not take new sockets
+        if await self.refuse_if_draining():
+            return
+        
+        # Every group event gets a per-reservation sequence number
+        self.event_log = ReservationEventLog(self.reservation_id)
+        # Live events up to this sequence were already sent by a replay
+        self.replayed_until = 0
+        
         # Add the channel to the group
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
+        await self.join_drain_group()
         
         # Accept the WebSocket connection
         await self.accept()
         
-        # Fetch and send previous messages
-        await self.send_previous_messages()
+        # A reconnecting client passes the last sequence it saw and only gets
+        # the gap, a fresh client gets the recent history
+        last_seq = self.get_last_seq_param()
+        if last_seq is None:
+            await self.send_previous_messages()
+        else:
+            await self.resume_from(last_seq)
         
         # Notify others that a user has joined
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_join',
-                'user_id': str(self.user.id),
-                'username': self.user.username
-            }
-        )
+        await self.publish({
+            'type': 'user_join',
+            'user_id': str(self.user.id),
+            'username': self.user.username
+        })
 
     async def disconnect(self, close_code):
+        if self.refused:
+            return
+        
+        ephemeral_buffer.discard_sender(self.room_group_name, str(self.user.id))
+
         # Notify others that a user has left
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_leave',
-                'user_id': str(self.user.id),
-                'username': self.user.username
-            }
-        )
+        await self.publish({
+            'type': 'user_leave',
+            'user_id': str(self.user.id),
+            'username': self.user.username
+        })
         
         # Remove the channel from the group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        await self.leave_drain_group()
 
     async def receive(self, text_data):
         try:
@@ -65,6 +255,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
             if data.get('type') == 'fetch_messages':
                 await self.send_previous_messages()
                 return
+
+            if data.get('type') == 'resume':
+                await self.resume_from(int(data.get('last_seq', 0)))
+                return
+
+            if data.get('type') == 'ephemeral':
+                await self.handle_ephemeral(data)
+                return
             
             # Handle chat message
             if 'message' in data:
@@ -72,20 +270,22 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 if not message:
                     raise ValueError("Empty message")
                 
-                # Save message to database
-                message_obj = await self.save_message(message)
-                
-                # Send message to room group
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
+                async with self.event_log.lock:
+                    # Save message to database with its place in the stream
+                    seq = await self.event_log.allocate()
+                    message_obj = await self.save_message(message, seq)
+                    
+                    # Send message to room group
+                    event = {
                         'type': 'chat_message',
                         'message': message,
                         'username': self.user.username,
                         'user_id': str(self.user.id),
-                        'timestamp': message_obj.timestamp.isoformat()
+                        'timestamp': message_obj.timestamp.isoformat(),
+                        'seq': seq
                     }
-                )
+                    await self.event_log.store(event)
+                    await self.channel_layer.group_send(self.room_group_name, event)
             
         except json.JSONDecodeError:
             await self.send_error("Invalid message format")
@@ -100,17 +300,71 @@ class ChatConsumer(AsyncWebsocketConsumer):
             # Get the reservation
             reservation = await self.get_reservation()
             
+            # Everything up to the current sequence is covered by the history
+            current = await self.event_log.current() or 0
+            
             # Fetch recent messages
             messages = await self.get_messages(reservation)
             
             # Send messages to the client
+            self.replayed_until = max(self.replayed_until, current)
             await self.send(text_data=json.dumps({
                 'type': 'fetch_messages',
-                'messages': messages
+                'messages': messages,
+                'seq': current
             }))
         except Exception as e:
             await self.send_error(f"Error fetching messages: {str(e)}")
 
+    async def resume_from(self, last_seq):
+        """Replay the events a reconnecting client missed after ``last_seq``"""
+        current = await self.event_log.current()
+        if current is None or last_seq > current:
+            # The log was reset since the client last saw it
+            await self.send_previous_messages()
+            return
+        
+        events = await self.event_log.since(last_seq, current)
+        if events is None:
+            # Too far behind for the log, replay the persisted chat instead
+            events = await self.get_messages_since(last_seq, current)
+        
+        # The markers tell the client which frames belong to the replay;
+        # anything up to the closing seq the replay could not find is gone
+        await self.send(text_data=json.dumps({'type': 'replay_start'}))
+        previous = self.replayed_until
+        self.replayed_until = last_seq
+        for event in events:
+            await getattr(self, event['type'])(event)
+        self.replayed_until = max(previous, current)
+        await self.send(text_data=json.dumps({
+            'type': 'replay_end',
+            'seq': self.replayed_until
+        }))
+
+    async def publish(self, event):
+        """Sequence an event, log it for replay and send it to the group"""
+        async with self.event_log.lock:
+            await self.event_log.append(event)
+            await self.channel_layer.group_send(self.room_group_name, event)
+
+    async def send_event(self, event, payload):
+        """Send a group event to the WebSocket unless a replay already did"""
+        seq = event.get('seq')
+        if seq is not None:
+            if seq <= self.replayed_until:
+                return
+            payload['seq'] = seq
+        await self.send(text_data=json.dumps(payload))
+
+    def get_last_seq_param(self):
+        """Read ``?last_seq=N`` from the connection URL"""
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            return int(params['last_seq'][0])
+        except (KeyError, ValueError):
+            return None
+
     async def send_error(self, message):
         """Send an error message to the client"""
         await self.send(text_data=json.dumps({
@@ -120,38 +374,39 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     async def chat_message(self, event):
         """Send a chat message to the WebSocket"""
-        await self.send(text_data=json.dumps({
+        await self.send_event(event, {
             'type': 'chat_message',
             'message': event['message'],
             'username': event['username'],
             'user_id': event['user_id'],
             'timestamp': event['timestamp']
-        }))
+        })
 
     async def user_join(self, event):
         """Send user join notification"""
-        await self.send(text_data=json.dumps({
+        await self.send_event(event, {
             'type': 'user_join',
             'username': event['username'],
             'user_id': event['user_id']
-        }))
+        })
 
     async def user_leave(self, event):
         """Send user leave notification"""
-        await self.send(text_data=json.dumps({
+        await self.send_event(event, {
             'type': 'user_leave',
             'username': event['username'],
             'user_id': event['user_id']
-        }))
+        })
 
     @database_sync_to_async
-    def save_message(self, message):
+    def save_message(self, message, sequence=None):
         """Save a message to the database"""
         reservation = Reservation.objects.get(id=self.reservation_id)
         return ChatMessage.objects.create(
             reservation=reservation,
             user=self.user,
-            message=message
+            message=message,
+            sequence=sequence
         )
 
     @database_sync_to_async
@@ -170,20 +425,43 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'message': message.message,
             'username': message.user.username,
             'userId': str(message.user.id),
-            'timestamp': message.timestamp.isoformat()
+            'timestamp': message.timestamp.isoformat(),
+            'seq': message.sequence
         } for message in reversed(messages)]  # Reverse to show oldest first
+
+    @database_sync_to_async
+    def get_messages_since(self, last_seq, current):
+        """Rebuild the chat events after ``last_seq`` from the database"""
+        messages = ChatMessage.objects.filter(
+            reservation_id=self.reservation_id,
+            sequence__gt=last_seq,
+            sequence__lte=current
+        ).select_related('user').order_by('sequence')
+        
+        return [{
+            'type': 'chat_message',
+            'message': message.message,
+            'username': message.user.username,
+            'user_id': str(message.user.id),
+            'timestamp': message.timestamp.isoformat(),
+            'seq': message.sequence
+        } for message in messages]
     
     
-class WebRTCSignalConsumer(AsyncWebsocketConsumer):
+class WebRTCSignalConsumer(DrainableMixin, EphemeralStateMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.reservation_id = self.scope['url_route']['kwargs']['reservation_id']
         self.room_group_name = f'webrtc_{self.reservation_id}'
         self.user = self.scope["user"]
         
+        if await self.refuse_if_draining():
+            return
+        
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
+        await self.join_drain_group()
         
         await self.accept()
         
@@ -198,6 +476,11 @@ class WebRTCSignalConsumer(AsyncWebsocketConsumer):
         )
 
     async def disconnect(self, close_code):
+        if self.refused:
+            return
+        
+        ephemeral_buffer.discard_sender(self.room_group_name, str(self.user.id))
+
         await self.channel_layer.group_send(
             self.room_group_name,
             {
@@ -211,13 +494,20 @@ class WebRTCSignalConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
+        await self.leave_drain_group()
 
     async def receive(self, text_data):
         data = json.loads(text_data)
         
         message_type = data.get('type')
         
-        if message_type == 'offer':
+        if message_type == 'ephemeral':
+            try:
+                await self.handle_ephemeral(data)
+            except ValueError as e:
+                await self.send(text_data=json.dumps({'type': 'error', 'message': str(e)}))
+
+        elif message_type == 'offer':
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
@@ -286,4 +576,35 @@ class WebRTCSignalConsumer(AsyncWebsocketConsumer):
             'candidate': event['candidate'],
             'sender_id': event['sender_id'],
             'receiver_id': event['receiver_id']
-        }))
\ No newline at end of file
+        }))
+
+
+class RoomStatusConsumer(DrainableMixin, AsyncWebsocketConsumer):
+    """Pushes room free/occupied changes to lobby screens and dashboards"""
+
+    async def connect(self):
+        self.room_group_name = ROOM_STATUS_GROUP
+        
+        if await self.refuse_if_draining():
+            return
+        
+        await self.channel_layer.group_add(
+            self.room_group_name,
+            self.channel_name
+        )
+        await self.join_drain_group()
+        
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if self.refused:
+            return
+        
+        await self.channel_layer.group_discard(
+            self.room_group_name,
+            self.channel_name
+        )
+        await self.leave_drain_group()
+
+    async def room_status(self, event):
+        await self.send(text_data=json.dumps(event))
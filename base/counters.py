@@ -0,0 +1,120 @@
+# base/counters.py
+import random
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Reservation, StatCounter
+
+# Every reservation counts once under each of its day, room and user keys
+# and once in the total
+TOTAL = 'reservations'
+# The total is spread over this many rows and summed on read, so that
+# concurrent bookings rarely wait on each other's row lock
+TOTAL_SHARDS = 16
+
+
+def total_key(shard):
+    return f'{TOTAL}:total:{shard}'
+
+
+TOTAL_KEYS = [total_key(shard) for shard in range(TOTAL_SHARDS)]
+
+
+def day_key(day):
+    return f'{TOTAL}:day:{day.isoformat()}'
+
+
+def room_key(room_id):
+    return f'{TOTAL}:room:{room_id}'
+
+
+def user_key(user_id):
+    return f'{TOTAL}:user:{user_id}'
+
+
+def reservation_keys(day, room_id, user_id):
+    return day_key(day), room_key(room_id), user_key(user_id)
+
+
+def counted(reservation):
+    """What a reservation is counted by: (date, room_id, user_id)"""
+    return reservation.date, reservation.room_id, reservation.user_id
+
+
+def count_changes(removed=(), added=()):
+    """
+    Move the counters for reservations taken away and added, each given as
+    counted() tuples. Call it inside the transaction that writes them: it
+    costs one INSERT for new keys and one UPDATE per distinct delta. The
+    total moves on one shard picked at random.
+    """
+    deltas = Counter()
+    for row in removed:
+        deltas.subtract(reservation_keys(*row))
+        deltas[TOTAL] -= 1
+    for row in added:
+        deltas.update(reservation_keys(*row))
+        deltas[TOTAL] += 1
+    shard = random.choice(TOTAL_KEYS)
+    deltas[shard] = deltas.pop(TOTAL, 0)
+
+    keys_by_delta = defaultdict(list)
+    for key, delta in deltas.items():
+        if delta:
+            keys_by_delta[delta].append(key)
+    # A shard can go below zero, so it may need creating for a decrement too
+    new_keys = [key for delta, keys in keys_by_delta.items() if delta > 0 or shard in keys for key in keys]
+    if new_keys:
+        StatCounter.objects.bulk_create([StatCounter(key=key) for key in new_keys], ignore_conflicts=True)
+    for delta, keys in keys_by_delta.items():
+        StatCounter.objects.filter(key__in=keys).update(value=F('value') + delta)
+
+
+def count_reservations(reservations):
+    """Count reservations written with bulk_create, which sends no post_save"""
+    count_changes(added=[counted(reservation) for reservation in reservations])
+
+
+def counter_values(*keys):
+    """Current values of ``keys`` with a single primary key lookup; 0 if never counted"""
+    lookup = set(keys) - {TOTAL}
+    if TOTAL in keys:
+        lookup.update(TOTAL_KEYS)
+    values = dict(StatCounter.objects.filter(key__in=lookup).values_list('key', 'value'))
+    values[TOTAL] = sum(values.get(key, 0) for key in TOTAL_KEYS)
+    return [values.get(key, 0) for key in keys]
+
+
+def rebuild_counters():
+    """
+    Recount every reservation counter from the table itself and return the
+    keys whose stored value was wrong, as {key: (stored, actual)}. Rows are
+    updated in place, so increments waiting on them are not lost.
+    """
+    with transaction.atomic():
+        # Locked first, so writers wait instead of counting into a stale total
+        counters = StatCounter.objects.filter(key__startswith=TOTAL)
+        stored = dict(counters.select_for_update().values_list('key', 'value'))
+        stored[TOTAL] = sum(stored.pop(key, 0) for key in TOTAL_KEYS)
+
+        reservations = Reservation.objects.order_by()
+        actual = {TOTAL: reservations.count()}
+        for field, key in (('date', day_key), ('room_id', room_key), ('user_id', user_key)):
+            for value, count in reservations.values_list(field).annotate(count=Count('id')):
+                actual[key(value)] = count
+
+        # The whole total goes on the first shard
+        rows = {**actual, **dict.fromkeys(TOTAL_KEYS, 0)}
+        rows[TOTAL_KEYS[0]] = rows.pop(TOTAL)
+        counters.exclude(value=0).update(value=0)
+        StatCounter.objects.bulk_create(
+            [StatCounter(key=key, value=value) for key, value in rows.items()],
+            update_conflicts=True, unique_fields=['key'], update_fields=['value'],
+        )
+    return {
+        key: (stored.get(key, 0), actual.get(key, 0))
+        for key in stored.keys() | actual.keys()
+        if stored.get(key, 0) != actual.get(key, 0)
+    }
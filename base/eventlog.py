@@ -0,0 +1,97 @@
+# base/eventlog.py
+import asyncio
+import weakref
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from .models import ChatMessage, Reservation
+
+# Number of recent group events kept per reservation for reconnect replay.
+LOG_SIZE = getattr(settings, 'CHAT_EVENT_LOG_SIZE', 500)
+# Seconds a logged event stays replayable.
+LOG_TTL = getattr(settings, 'CHAT_EVENT_LOG_TTL', 60 * 60)
+# Sequence numbers are reserved in the database this many at a time, so a
+# counter lost from the cache restarts above everything handed out.
+SEQ_BLOCK = 100
+
+# reservation id -> lock held while an event is sequenced and sent, shared by
+# the consumers of one worker and dropped with the last of them
+_send_locks = weakref.WeakValueDictionary()
+
+
+class ReservationEventLog:
+    """
+    Bounded, sequenced log of the group events of one reservation.
+
+    Sequence numbers come from an atomic counter in the cache and every event
+    is stored under its own key, so the log works the same with the in-memory
+    cache (single worker) and with Redis (many workers). Hold ``lock`` from
+    allocating a number until the event is sent so that a worker delivers
+    the events of a meeting in sequence order.
+    """
+
+    def __init__(self, reservation_id):
+        self.reservation_id = reservation_id
+        self.counter_key = f'chat_seq:{reservation_id}'
+        self.lock = _send_locks.setdefault(str(reservation_id), asyncio.Lock())
+
+    def event_key(self, seq):
+        return f'chat_event:{self.reservation_id}:{seq}'
+
+    async def append(self, event):
+        """Assign the next sequence number to ``event`` and store it."""
+        event['seq'] = await self.allocate()
+        await self.store(event)
+        return event['seq']
+
+    async def allocate(self):
+        """Reserve the next sequence number of the reservation."""
+        try:
+            seq = await cache.aincr(self.counter_key)
+        except ValueError:
+            # First event, or the counter was evicted: restart it above every
+            # number reserved so far so sequence numbers never go backwards.
+            await cache.aadd(self.counter_key, await self.persisted_max(), timeout=None)
+            seq = await cache.aincr(self.counter_key)
+        if seq % SEQ_BLOCK == 1:
+            # First number of a block: reserve the block before handing it out
+            await Reservation.objects.filter(
+                id=self.reservation_id, event_seq_reserved__lt=seq - 1 + SEQ_BLOCK
+            ).aupdate(event_seq_reserved=seq - 1 + SEQ_BLOCK)
+        return seq
+
+    async def store(self, event):
+        """Store an event that already carries its ``seq``."""
+        await cache.aset(self.event_key(event['seq']), event, timeout=LOG_TTL)
+
+    async def persisted_max(self):
+        """The highest number that may have been used, rounded up to a block."""
+        reserved = await Reservation.objects.filter(
+            id=self.reservation_id
+        ).values_list('event_seq_reserved', flat=True).afirst()
+        result = await ChatMessage.objects.filter(
+            reservation_id=self.reservation_id
+        ).aaggregate(last=Max('sequence'))
+        last = max(reserved or 0, result['last'] or 0)
+        return -(-last // SEQ_BLOCK) * SEQ_BLOCK
+
+    async def current(self):
+        return await cache.aget(self.counter_key)
+
+    async def since(self, last_seq, current):
+        """
+        Return the events in (``last_seq``, ``current``] in order, or None when
+        the log can no longer answer (gap too large or events expired) and the
+        caller has to fall back to the database.
+        """
+        if current - last_seq > LOG_SIZE:
+            return None
+        if last_seq >= current:
+            return []
+
+        keys = [self.event_key(seq) for seq in range(last_seq + 1, current + 1)]
+        found = await cache.aget_many(keys)
+        if len(found) != len(keys):
+            return None
+        return [found[key] for key in keys]
@@ -3,8 +3,11 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.db import models
-from .models import Room, Reservation , TimeSlot
-from datetime import datetime, timedelta
+from .models import Room, Reservation, ReservationSeries
+from .timeslots import slot_catalog
+from .utils import local_now
+from django.utils import timezone
+from datetime import timedelta
 
 # forms.py use to create forms for the application for registration, login, room creation, and reservation creation.
 
@@ -58,6 +61,22 @@ class ReservationForm(ModelForm): #
         }) #
     )
     
+    # تکرار رزرو (اختیاری): روزانه، هفتگی یا ماهانه تا یک تاریخ یا تعداد مشخص
+    repeat = forms.ChoiceField(
+        required=False,
+        choices=[('', 'Does not repeat')] + ReservationSeries.FREQUENCY_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    repeat_until = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+    repeat_count = forms.IntegerField(
+        required=False,
+        min_value=2,
+        widget=forms.NumberInput(attrs={'class': 'form-control'}),
+    )
+    
     class Meta: #
         model = Reservation #
         fields = ['title', 'description', 'date', 'participant_count', 'participants_emails'] #
@@ -71,13 +90,9 @@ class ReservationForm(ModelForm): #
     def __init__(self, *args, **kwargs): #
         super().__init__(*args, **kwargs) #
         
-        # دریافت اسلات‌های زمانی فعال از دیتابیس
-        active_slots = TimeSlot.objects.filter(is_active=True).order_by('start_time')
-        # ایجاد choices برای فیلد time_slot
+        # اسلات‌های زمانی فعال از کاتالوگ کش شده (بدون کوئری به دیتابیس)
         # مقدار ذخیره شده، رشته "HH:MM-HH:MM" خواهد بود
-        self.fields['time_slot'].choices = [
-            (slot.formatted_slot, str(slot)) for slot in active_slots
-        ]
+        self.fields['time_slot'].choices = slot_catalog().choices
         
         # اگر مقدار اولیه‌ای برای time_slot از طریق GET پارامتر ارسال شده باشد، آن را انتخاب کنید
         # این بخش برای زمانی است که کاربر از صفحه جزئیات اتاق یا تقویم روی یک اسلات خاص کلیک می‌کند
@@ -97,23 +112,88 @@ class ReservationForm(ModelForm): #
         room = self.initial.get('room') if hasattr(self, 'initial') and 'room' in self.initial else None #
         
         if date_cleaned and time_slot_str: #
-            try:
-                start_time_str, end_time_str = time_slot_str.split('-') #
-                start_time = datetime.strptime(start_time_str, '%H:%M').time() #
-                end_time = datetime.strptime(end_time_str, '%H:%M').time() #
-                
-                cleaned_data['start_time'] = start_time #
-                cleaned_data['end_time'] = end_time #
-                
-                today = datetime.now().date() #
-                current_time = datetime.now().time() #
-                
-                if date_cleaned < today or (date_cleaned == today and start_time < current_time): #
-                    raise forms.ValidationError('Cannot make reservations in the past') #
-            except ValueError:
+            slot = slot_catalog().get(time_slot_str)
+            if slot is None:
                 raise forms.ValidationError("Invalid time slot format.")
+            start_time, end_time = slot.start, slot.end #
+            
+            cleaned_data['start_time'] = start_time #
+            cleaned_data['end_time'] = end_time #
+            
+            today = timezone.localdate() #
+            current_time = local_now().time() #
+            
+            if date_cleaned < today or (date_cleaned == today and start_time < current_time): #
+                raise forms.ValidationError('Cannot make reservations in the past') #
                 
         if room and participant_count and participant_count > room.capacity: #
             raise forms.ValidationError(f'The number of participants ({participant_count}) exceeds the room capacity ({room.capacity}).') #
         
-        return cleaned_data #
\ No newline at end of file
+        repeat_until = cleaned_data.get('repeat_until')
+        if cleaned_data.get('repeat') and date_cleaned and repeat_until and repeat_until < date_cleaned:
+            raise forms.ValidationError('The repeat end date must not be before the first meeting.')
+        
+        return cleaned_data #
+
+class SeriesForm(ModelForm):
+    """Edit every upcoming occurrence of a recurring reservation"""
+    time_slot = forms.ChoiceField(
+        required=True,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+
+    class Meta:
+        model = ReservationSeries
+        fields = ['title', 'description', 'participant_count', 'participants_emails']
+        widgets = {
+            'title': forms.TextInput(attrs={'class': 'form-control'}),
+            'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
+            'participant_count': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
+            'participants_emails': forms.Textarea(attrs={'class': 'form-control', 'rows': 2}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['time_slot'].choices = slot_catalog().choices
+        self.fields['time_slot'].initial = (
+            f"{self.instance.start_time.strftime('%H:%M')}-{self.instance.end_time.strftime('%H:%M')}"
+        )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        slot = slot_catalog().get(cleaned_data.get('time_slot'))
+        if slot is not None:
+            cleaned_data['start_time'], cleaned_data['end_time'] = slot.start, slot.end
+        participant_count = cleaned_data.get('participant_count')
+        if participant_count and participant_count > self.instance.room.capacity:
+            raise forms.ValidationError(f'The number of participants ({participant_count}) exceeds the room capacity ({self.instance.room.capacity}).')
+        return cleaned_data
+
+class ReservationFilterForm(forms.Form):
+    """GET filters of the reservation lists; every field is optional"""
+    room = forms.TypedChoiceField(coerce=int, required=False, empty_value=None,
+                                  widget=forms.Select(attrs={'class': 'form-select'}))
+    user = forms.CharField(required=False, max_length=150,
+                           widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Username'}))
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['room'].choices = [('', 'All rooms')] + [(room.id, room.name) for room in Room.cached_list()]
+
+    def filter(self, queryset):
+        """Narrow ``queryset`` by the valid filters; invalid ones are ignored"""
+        if not self.is_bound:
+            return queryset
+        self.is_valid()  # leaves invalid fields out of cleaned_data
+        data = self.cleaned_data
+        if data.get('room'):
+            queryset = queryset.filter(room_id=data['room'])
+        if data.get('user'):
+            queryset = queryset.filter(user__username=data['user'])
+        if data.get('date_from'):
+            queryset = queryset.filter(date__gte=data['date_from'])
+        if data.get('date_to'):
+            queryset = queryset.filter(date__lte=data['date_to'])
+        return queryset
@@ -0,0 +1,83 @@
+# base/freebusy.py
+import bisect
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from .models import Reservation
+
+# Limits of one free/busy request
+MAX_FREEBUSY_ROOMS = 1000
+MAX_FREEBUSY_DAYS = 62
+
+
+def merge_intervals(intervals):
+    """Coalesce sorted (start, end) pairs that overlap or touch"""
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def busy_index(intervals):
+    """Sorted (start, end) pairs merged into parallel start and end lists for overlap()"""
+    merged = merge_intervals(sorted(intervals))
+    return [start for start, _ in merged], [end for _, end in merged]
+
+
+def overlap(index, start, end):
+    """The merged busy interval of ``busy_index()`` that [start, end) overlaps, or None"""
+    starts, ends = index
+    position = bisect.bisect_right(ends, start)
+    if position < len(starts) and starts[position] < end:
+        return starts[position], ends[position]
+    return None
+
+
+def busy_intervals(room_ids, start, end):
+    """
+    Merged busy intervals of each room between the datetimes ``start`` and
+    ``end``, clipped to that window, from a single range query.
+    """
+    rows = Reservation.objects.filter(
+        room_id__in=room_ids,
+        starts_at__lt=aware(end),
+        ends_at__gt=aware(start),
+    ).order_by('room_id', 'starts_at').values_list('room_id', 'starts_at', 'ends_at')
+
+    per_room = {room_id: [] for room_id in room_ids}
+    for room_id, starts_at, ends_at in rows:
+        busy_start = max(naive(starts_at), start)
+        busy_end = min(naive(ends_at), end)
+        if busy_start < busy_end:
+            per_room[room_id].append((busy_start, busy_end))
+
+    return {
+        room_id: [
+            [busy_start.isoformat(timespec='minutes'), busy_end.isoformat(timespec='minutes')]
+            for busy_start, busy_end in merge_intervals(intervals)
+        ]
+        for room_id, intervals in per_room.items()
+    }
+
+
+def parse_window(start_value, end_value):
+    """``start``/``end`` query values (dates or datetimes) to a datetime window"""
+    start = naive(datetime.fromisoformat(start_value))
+    end = naive(datetime.fromisoformat(end_value)) if end_value else start + timedelta(days=1)
+    if len(end_value or '') == 10:  # a bare end date includes that whole day
+        end += timedelta(days=1)
+    return start, end
+
+
+def naive(value):
+    # Windows are naive local times, like a reservation's date and times
+    return timezone.make_naive(value) if timezone.is_aware(value) else value
+
+
+def aware(value):
+    return timezone.make_aware(value) if timezone.is_naive(value) else value
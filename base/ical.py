@@ -0,0 +1,162 @@
+# base/ical.py
+import hashlib
+from datetime import timezone
+
+from django.core import signing
+from django.db.models import Count, Max, Q
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import Attendee, Reservation
+
+FEED_SALT = 'base.ical.user-feed'
+ROOM_FEED_SALT = 'base.ical.room-feed'
+CHUNK_SIZE = 500
+
+
+def escape_text(value):
+    """Escape a TEXT property value (RFC 5545 section 3.3.11)"""
+    return (
+        (value or '')
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def fold(line):
+    """Split a content line into CRLF-terminated lines of at most 75 octets"""
+    encoded = line.encode()
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74  # continuation lines start with a space
+        while cut and (encoded[cut] & 0xC0) == 0x80:  # never split a UTF-8 sequence
+            cut -= 1
+        parts.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+    parts.append(encoded.decode())
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def utc_stamp(moment):
+    return moment.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def reservation_event(reservation, domain):
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:reservation-{reservation.id}@{domain}',
+        f'DTSTAMP:{utc_stamp(reservation.updated)}',
+        f'LAST-MODIFIED:{utc_stamp(reservation.updated)}',
+        # From the aware span, so a meeting past midnight ends on the next day
+        f'DTSTART:{utc_stamp(reservation.starts_at)}',
+        f'DTEND:{utc_stamp(reservation.ends_at)}',
+        f'SUMMARY:{escape_text(reservation.title)}',
+        f'LOCATION:{escape_text(reservation.room.name)}',
+    ]
+    if reservation.description:
+        lines.append(f'DESCRIPTION:{escape_text(reservation.description)}')
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) for line in lines)
+
+
+def keyset(queryset, chunk_size=CHUNK_SIZE):
+    """Iterate a queryset in id order, one bounded query per chunk"""
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id).order_by('id')[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last_id = chunk[-1].id
+
+
+def iter_calendar(queryset, name, domain):
+    """Yield an iCalendar document event by event"""
+    yield fold('BEGIN:VCALENDAR')
+    yield fold('VERSION:2.0')
+    yield fold(f'PRODID:-//{domain}//Meeting Rooms//EN')
+    yield fold(f'X-WR-CALNAME:{escape_text(name)}')
+    events = queryset.select_related('room').only(
+        'id', 'title', 'description', 'starts_at', 'ends_at', 'updated',
+        'user_id', 'participants_emails', 'room__name',
+    )
+    for reservation in keyset(events):
+        yield reservation_event(reservation, domain)
+    yield fold('END:VCALENDAR')
+
+
+def feed_validators(queryset):
+    """
+    ETag and Last-Modified of a feed from one aggregate query. The count is
+    part of the ETag because a deleted reservation does not move Max(updated).
+    """
+    stats = queryset.aggregate(last_modified=Max('updated'), events=Count('id'))
+    last_modified = stats['last_modified']
+    etag = hashlib.md5(f"{last_modified and last_modified.isoformat()}:{stats['events']}".encode()).hexdigest()
+    return etag, last_modified
+
+
+def feed_response(request, queryset, name):
+    """Stream ``queryset`` as an .ics feed, or answer 304 if it is unchanged"""
+    etag, last_modified = feed_validators(queryset)
+    headers = {'ETag': quote_etag(etag)}
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified.timestamp())
+
+    not_modified = get_conditional_response(
+        request,
+        etag=headers['ETag'],
+        last_modified=last_modified and int(last_modified.timestamp()),
+    )
+    if not_modified is not None:
+        response = not_modified
+    else:
+        response = StreamingHttpResponse(
+            iter_calendar(queryset, name, request.get_host()),
+            content_type='text/calendar; charset=utf-8',
+        )
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def room_feed(room):
+    return Reservation.objects.filter(room=room)
+
+
+def user_feed(user):
+    """Reservations the user owns or is invited to by email"""
+    email = (user.email or '').strip().lower()
+    if not email:
+        return Reservation.objects.filter(user=user)
+    # Invitations come from the attendee index, not a text search of every row
+    invited = Attendee.objects.filter(email=email).values('reservation_id')
+    return Reservation.objects.filter(Q(user=user) | Q(id__in=invited))
+
+
+def user_feed_token(user):
+    """Secret path segment of a user's feed; calendar apps cannot log in"""
+    return signing.dumps(user.id, salt=FEED_SALT)
+
+
+def user_from_feed_token(token):
+    try:
+        return signing.loads(token, salt=FEED_SALT)
+    except signing.BadSignature:
+        return None
+
+
+def room_feed_token(room):
+    """Secret path segment of a room's feed, handed out to signed-in users"""
+    return signing.dumps(room.id, salt=ROOM_FEED_SALT)
+
+
+def room_from_feed_token(token):
+    try:
+        return signing.loads(token, salt=ROOM_FEED_SALT)
+    except signing.BadSignature:
+        return None
@@ -0,0 +1,305 @@
+# base/importer.py
+import bisect
+import csv
+import logging
+from collections import defaultdict, namedtuple
+from datetime import date, datetime, time, timezone as dt_timezone
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .attendees import index_attendees
+from .counters import count_reservations
+from .freebusy import busy_index, overlap
+from .models import Reservation, Room
+from .signals import bulk_reservations_changed
+
+logger = logging.getLogger(__name__)
+
+# Rows read, checked and inserted at a time
+BATCH_SIZE = 1000
+
+# One parsed booking; ``line`` is where it starts in the uploaded file
+Row = namedtuple('Row', [
+    'line', 'room', 'date', 'start_time', 'end_time', 'title',
+    'user', 'participant_count', 'participants_emails', 'description',
+])
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = []
+        self.errors = []  # (line, message)
+
+    def error(self, line, message):
+        self.errors.append((line, message))
+
+    def summary(self):
+        return f"{len(self.created)} reservations imported, {len(self.errors)} rows rejected"
+
+
+class RowError(ValueError):
+    pass
+
+
+class Lookups:
+    """Rooms and users referenced by an import, resolved without a query per row"""
+
+    def __init__(self, default_user):
+        self.default_user = default_user
+        self.rooms_by_id = {}
+        self.rooms_by_name = {}
+        for room in Room.cached_list():
+            self.rooms_by_id[str(room.id)] = room
+            self.rooms_by_name[room.name.strip().lower()] = room
+        self.users = {default_user.username: default_user}
+
+    def room(self, value):
+        value = (value or '').strip()
+        room = self.rooms_by_id.get(value) or self.rooms_by_name.get(value.lower())
+        if room is None:
+            raise RowError(f"Unknown room '{value}'")
+        return room
+
+    def load_users(self, usernames):
+        missing = set(usernames) - set(self.users)
+        for user in User.objects.filter(username__in=missing):
+            self.users[user.username] = user
+
+    def user(self, username):
+        if not username:
+            return self.default_user
+        if username not in self.users:
+            raise RowError(f"Unknown user '{username}'")
+        return self.users[username]
+
+
+def build_row(lookups, line, room, day, start_time, end_time, title, username=None,
+              participant_count=None, participants_emails='', description=''):
+    if not title:
+        raise RowError("Missing title")
+    if end_time <= start_time:
+        raise RowError("End time must be after start time")
+    room = lookups.room(room)
+    participant_count = int(participant_count or 1)
+    if participant_count < 1:
+        raise RowError("participant_count must be at least 1")
+    if participant_count > room.capacity:
+        raise RowError(f"{participant_count} participants exceed the capacity of {room.name} ({room.capacity})")
+    return Row(
+        line, room, day, start_time, end_time, title[:200], lookups.user(username),
+        participant_count, participants_emails or '', description or '',
+    )
+
+
+def batched(iterable, size):
+    """Lists of up to ``size`` items, read from ``iterable`` as they are needed"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def parse_csv(stream, lookups, result):
+    """
+    Rows of a CSV with the columns room (ID or name), date (YYYY-MM-DD),
+    start and end (HH:MM), title and optionally user, participant_count,
+    participants_emails and description. Read a batch at a time.
+    """
+    records = enumerate(csv.DictReader(stream), start=2)  # line 1 is the header
+    for batch in batched(records, BATCH_SIZE):
+        lookups.load_users({record.get('user') for _, record in batch if record.get('user')})
+        yield from parse_records(batch, lookups, result)
+
+
+def parse_records(records, lookups, result):
+    for line, record in records:
+        try:
+            yield build_row(
+                lookups, line,
+                record.get('room'),
+                date.fromisoformat((record.get('date') or '').strip()),
+                time.fromisoformat((record.get('start') or '').strip()),
+                time.fromisoformat((record.get('end') or '').strip()),
+                (record.get('title') or '').strip(),
+                (record.get('user') or '').strip(),
+                record.get('participant_count'),
+                record.get('participants_emails'),
+                record.get('description'),
+            )
+        except (RowError, ValueError) as e:
+            result.error(line, str(e))
+
+
+def unfold(stream):
+    """Content lines of an iCalendar stream with their starting line numbers"""
+    current, start = None, 0
+    for number, raw in enumerate(stream, start=1):
+        raw = raw.rstrip('\r\n')
+        if raw[:1] in (' ', '\t') and current is not None:
+            current += raw[1:]
+            continue
+        if current is not None:
+            yield start, current
+        current, start = raw, number
+    if current is not None:
+        yield start, current
+
+
+def unescape_text(value):
+    return (
+        value.replace('\\n', '\n').replace('\\N', '\n')
+        .replace('\\,', ',').replace('\\;', ';').replace('\\\\', '\\')
+    )
+
+
+def parse_ical_datetime(value):
+    moment = datetime.strptime(value.rstrip('Z'), '%Y%m%dT%H%M%S')
+    if value.endswith('Z'):
+        # Reservations keep naive local times
+        moment = timezone.make_naive(moment.replace(tzinfo=dt_timezone.utc))
+    return moment
+
+
+def parse_ical(stream, lookups, result):
+    """Rows of the VEVENTs of an iCalendar file; LOCATION names the room"""
+    event, event_line = None, 0
+    for line, content in unfold(stream):
+        name, _, value = content.partition(':')
+        name = name.split(';', 1)[0].upper()
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            event, event_line = {'ATTENDEE': []}, line
+        elif name == 'END' and value.upper() == 'VEVENT' and event is not None:
+            try:
+                starts = parse_ical_datetime(event['DTSTART'])
+                ends = parse_ical_datetime(event['DTEND'])
+                if starts.date() != ends.date():
+                    raise RowError("Events must start and end on the same day")
+                attendees = [address[7:] for address in event['ATTENDEE'] if address.lower().startswith('mailto:')]
+                yield build_row(
+                    lookups, event_line, unescape_text(event.get('LOCATION', '')),
+                    starts.date(), starts.time(), ends.time(),
+                    unescape_text(event.get('SUMMARY', '')).strip(),
+                    participant_count=max(1, len(attendees)),
+                    participants_emails=', '.join(attendees),
+                    description=unescape_text(event.get('DESCRIPTION', '')),
+                )
+            except KeyError as e:
+                result.error(event_line, f"Missing {e.args[0]}")
+            except (RowError, ValueError) as e:
+                result.error(event_line, str(e))
+            event = None
+        elif event is not None:
+            if name == 'ATTENDEE':
+                event['ATTENDEE'].append(value)
+            else:
+                event[name] = value
+
+
+def existing_busy(spans):
+    """Busy index of each room's existing bookings, from one range query"""
+    if not spans:
+        return {}
+    booked = Reservation.objects.filter(
+        room_id__in={row.room.id for row, _, _ in spans},
+        starts_at__lt=max(end for _, _, end in spans),
+        ends_at__gt=min(start for _, start, _ in spans),
+    ).values_list('room_id', 'starts_at', 'ends_at')
+
+    intervals = defaultdict(list)
+    for room_id, starts_at, ends_at in booked:
+        intervals[room_id].append((starts_at, ends_at))
+    return {room_id: busy_index(room_intervals) for room_id, room_intervals in intervals.items()}
+
+
+class AcceptedSpans:
+    """
+    Spans of the rows accepted so far, per room, so that later batches of a
+    file are checked against the earlier ones. They never overlap, so starts
+    and ends are both sorted.
+    """
+
+    def __init__(self):
+        self.rooms = defaultdict(lambda: ([], [], []))  # room_id -> (starts, ends, lines)
+
+    def line_overlapping(self, room_id, start, end):
+        starts, ends, lines = self.rooms[room_id]
+        position = bisect.bisect_right(ends, start)
+        if position < len(starts) and starts[position] < end:
+            return lines[position]
+        return None
+
+    def add(self, room_id, start, end, line):
+        starts, ends, lines = self.rooms[room_id]
+        position = bisect.bisect_left(starts, start)
+        starts.insert(position, start)
+        ends.insert(position, end)
+        lines.insert(position, line)
+
+
+def sweep_conflicts(rows, result, overlap_message="Overlaps row {} in the same file", accepted=None):
+    """
+    Drop rows that overlap an earlier-starting row of the same file, a row of
+    an earlier batch in ``accepted`` or an existing reservation, after sorting
+    by room and start. Returns the rest and adds them to ``accepted``.
+    """
+    if accepted is None:
+        accepted = AcceptedSpans()
+    spans = [(row, *Reservation.span(row.date, row.start_time, row.end_time)) for row in rows]
+    busy = existing_busy(spans)
+    kept = []
+    for row, start, end in sorted(spans, key=lambda span: (span[0].room.id, span[1], span[0].line)):
+        # Earlier rows first: once inserted they would also look like existing bookings
+        line = accepted.line_overlapping(row.room.id, start, end)
+        if line is not None:
+            result.error(row.line, overlap_message.format(line))
+            continue
+        taken = overlap(busy.get(row.room.id, ((), ())), start, end)
+        if taken:
+            taken_start, taken_end = (timezone.localtime(moment) for moment in taken)
+            result.error(row.line, (
+                f"{row.room.name} is already booked on {taken_start.date()} "
+                f"{taken_start.strftime('%H:%M')}-{taken_end.strftime('%H:%M')}"
+            ))
+            continue
+        accepted.add(row.room.id, start, end, row.line)
+        kept.append(row)
+    return kept
+
+
+def import_reservations(stream, user, file_format='csv', dry_run=False):
+    """
+    Parse, check and bulk insert a schedule; returns an ``ImportResult``.
+    The file is read, checked and inserted BATCH_SIZE rows at a time, all in
+    one transaction. IntegrityError means a booking made meanwhile took one
+    of the slots, and nothing was imported.
+    """
+    result = ImportResult()
+    lookups = Lookups(user)
+    parser = parse_ical if file_format == 'ics' else parse_csv
+    accepted = AcceptedSpans()
+
+    with transaction.atomic():
+        for rows in batched(parser(stream, lookups, result), BATCH_SIZE):
+            reservations = [
+                Reservation(
+                    room=row.room, user=row.user, title=row.title, description=row.description,
+                    date=row.date, start_time=row.start_time, end_time=row.end_time,
+                    participant_count=row.participant_count, participants_emails=row.participants_emails,
+                ).set_span()
+                for row in sweep_conflicts(rows, result, accepted=accepted)
+            ]
+            if reservations and not dry_run:
+                reservations = Reservation.objects.bulk_create(reservations)
+                index_attendees(reservations)
+                count_reservations(reservations)
+            result.created.extend(reservations)
+        if result.created and not dry_run:
+            transaction.on_commit(lambda: bulk_reservations_changed(result.created))
+    result.errors.sort()
+
+    if result.created and not dry_run:
+        logger.info(f"Imported reservations for {user.username}: {result.summary()}")
+    return result
+
@@ -0,0 +1,184 @@
+# base/layers.py
+import asyncio
+import bisect
+import hashlib
+import random
+import re
+
+from channels.layers import BaseChannelLayer
+from django.utils.module_loading import import_string
+
+# Group names end with the reservation they belong to (chat_12, webrtc_12),
+# so every group of one meeting lands on the same shard.
+RESERVATION_SUFFIX = re.compile(r'_(\d+)$')
+SHARD_CHANNEL = re.compile(r'^shard(\d+)\.(.+)$')
+
+
+class HashRing:
+    """
+    Consistent hash ring with virtual nodes. Adding a shard only moves the
+    keys that fall on its new points, about 1/N of them.
+    """
+
+    def __init__(self, names, vnodes=100):
+        points = sorted(
+            (self.hash(f'{name}#{vnode}'), index)
+            for index, name in enumerate(names)
+            for vnode in range(vnodes)
+        )
+        self.points = [point for point, index in points]
+        self.indexes = [index for point, index in points]
+
+    @staticmethod
+    def hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def get(self, key):
+        position = bisect.bisect(self.points, self.hash(key)) % len(self.points)
+        return self.indexes[position]
+
+
+class ShardedChannelLayer(BaseChannelLayer):
+    """
+    Channel layer that spreads groups over several backend layers (normally
+    one RedisChannelLayer per Redis instance) by consistent hashing of the
+    reservation ID in the group name.
+
+    A channel is created on a random home shard, which handles direct sends
+    to it. When it joins a group on another shard it gets an alias channel
+    there, and ``receive`` listens on the home channel and all aliases.
+    Group membership and group traffic therefore stay on the group's shard.
+
+    CONFIG takes ``shards``, a list of ``{'NAME', 'BACKEND', 'CONFIG'}``
+    dicts. Keep shard names stable: they place the points on the ring.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, shards, vnodes=100, expiry=60, capacity=100, channel_capacity=None):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.shards = [
+            import_string(shard['BACKEND'])(**shard.get('CONFIG', {}))
+            for shard in shards
+        ]
+        self.ring = HashRing(
+            [shard.get('NAME', f'shard{index}') for index, shard in enumerate(shards)],
+            vnodes=vnodes,
+        )
+        self.aliases = {}  # channel -> {shard index: channel name on that shard}
+        self.memberships = {}  # channel -> groups it joined through this process
+        self.listeners = {}  # channel -> {shard index: pending receive task}
+        self.rebind = {}  # channel -> event set when the channel gains an alias
+
+    # Placement
+
+    def shard_for_group(self, group):
+        match = RESERVATION_SUFFIX.search(group)
+        return self.ring.get(match.group(1) if match else group)
+
+    def split_channel(self, channel):
+        match = SHARD_CHANNEL.match(channel)
+        if not match:
+            raise TypeError(f"Channel {channel} was not created by a sharded layer")
+        return int(match.group(1)), match.group(2)
+
+    # Channel layer API
+
+    async def new_channel(self, prefix='specific'):
+        home = random.randrange(len(self.shards))
+        name = await self.shards[home].new_channel(prefix)
+        return f'shard{home}.{name}'
+
+    async def send(self, channel, message):
+        home, name = self.split_channel(channel)
+        await self.shards[home].send(name, message)
+
+    async def receive(self, channel):
+        while True:
+            # Looked up each time: forget() may have dropped them meanwhile
+            listeners = self.listeners.setdefault(channel, {})
+            rebind = self.rebind.setdefault(channel, asyncio.Event())
+            for index, name in self.bindings(channel):
+                if index not in listeners:
+                    listeners[index] = asyncio.ensure_future(self.shards[index].receive(name))
+            finished = [index for index, task in listeners.items() if task.done()]
+            for index in finished:
+                task = listeners.pop(index)
+                if not task.cancelled():
+                    return task.result()
+            if finished:
+                continue  # cancelled by forget(), listen again
+
+            rebound = asyncio.ensure_future(rebind.wait())
+            try:
+                await asyncio.wait([rebound, *listeners.values()], return_when=asyncio.FIRST_COMPLETED)
+            except asyncio.CancelledError:
+                # A timed-out receive keeps listening for the next call, a
+                # channel that left all its groups is done for good
+                if not self.memberships.get(channel):
+                    self.forget(channel)
+                raise
+            finally:
+                rebound.cancel()
+            rebind.clear()
+
+    def bindings(self, channel):
+        home, name = self.split_channel(channel)
+        yield home, name
+        yield from self.aliases.get(channel, {}).items()
+
+    def forget(self, channel):
+        """Stop listening for a channel whose consumer went away"""
+        for task in self.listeners.pop(channel, {}).values():
+            task.cancel()
+        self.rebind.pop(channel, None)
+        self.aliases.pop(channel, None)
+        self.memberships.pop(channel, None)
+
+    # Groups extension
+
+    async def child_channel(self, channel, index):
+        """The name ``channel`` has on shard ``index``, created on first use"""
+        home, name = self.split_channel(channel)
+        if index == home:
+            return name
+        aliases = self.aliases.setdefault(channel, {})
+        if index not in aliases:
+            aliases[index] = await self.shards[index].new_channel()
+            if channel in self.rebind:
+                self.rebind[channel].set()
+        return aliases[index]
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        index = self.shard_for_group(group)
+        name = await self.child_channel(channel, index)
+        self.memberships.setdefault(channel, set()).add(group)
+        await self.shards[index].group_add(group, name)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        index = self.shard_for_group(group)
+        name = await self.child_channel(channel, index)
+        groups = self.memberships.get(channel, set())
+        groups.discard(group)
+        await self.shards[index].group_discard(group, name)
+        if not groups:
+            # Left its last group; a receive still running listens again
+            self.forget(channel)
+
+    async def group_send(self, group, message):
+        self.require_valid_group_name(group)
+        await self.shards[self.shard_for_group(group)].group_send(group, message)
+
+    # Flush extension
+
+    async def flush(self):
+        for shard in self.shards:
+            await shard.flush()
+        self.aliases = {}
+        self.memberships = {}
+
+    async def close(self):
+        for shard in self.shards:
+            await shard.close()
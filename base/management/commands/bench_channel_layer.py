@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from base.layers import ShardedChannelLayer
+
+
+class Command(BaseCommand):
+    help = "Compare group fan-out throughput of the sharded channel layer for different shard counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+        parser.add_argument('--groups', type=int, default=200, help="Number of meetings")
+        parser.add_argument('--members', type=int, default=5, help="Sockets per meeting")
+        parser.add_argument('--messages', type=int, default=20, help="Messages sent to each meeting")
+        parser.add_argument(
+            '--redis',
+            action='append',
+            default=[],
+            metavar='HOST:PORT',
+            help="Use a local redis-server per shard instead of the in-memory stand-in (repeat once per shard)",
+        )
+
+    def handle(self, *args, **options):
+        for count in options['shards']:
+            if options['redis'] and len(options['redis']) < count:
+                self.stderr.write(f"Skipping {count} shards: only {len(options['redis'])} --redis hosts given")
+                continue
+            layer = ShardedChannelLayer(shards=self.shard_configs(count, options['redis']), capacity=options['messages'] + 10)
+            delivered, elapsed = asyncio.run(self.run(layer, options))
+            self.stdout.write(
+                f"{count} shard(s): {delivered} messages delivered in {elapsed:.2f}s "
+                f"({delivered / elapsed:,.0f} msg/s)"
+            )
+
+    def shard_configs(self, count, redis_hosts):
+        if not redis_hosts:
+            return [
+                {'NAME': f'memory-{index}', 'BACKEND': 'channels.layers.InMemoryChannelLayer'}
+                for index in range(count)
+            ]
+        configs = []
+        for address in redis_hosts[:count]:
+            host, port = address.rsplit(':', 1)
+            configs.append({
+                'NAME': f'redis-{port}',
+                'BACKEND': 'channels_redis.core.RedisChannelLayer',
+                'CONFIG': {'hosts': [(host, int(port))]},
+            })
+        return configs
+
+    async def run(self, layer, options):
+        members = {}
+        for group_index in range(options['groups']):
+            group = f'chat_{group_index}'
+            members[group] = [await layer.new_channel() for _ in range(options['members'])]
+            for channel in members[group]:
+                await layer.group_add(group, channel)
+
+        async def send_all(group):
+            for number in range(options['messages']):
+                await layer.group_send(group, {'type': 'chat_message', 'number': number})
+
+        async def receive_all(channel):
+            for _ in range(options['messages']):
+                await layer.receive(channel)
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(send_all(group) for group in members),
+            *(receive_all(channel) for channels in members.values() for channel in channels),
+        )
+        elapsed = time.perf_counter() - started
+
+        for channels in members.values():
+            for channel in channels:
+                layer.forget(channel)
+        await layer.flush()
+        await layer.close()
+        return options['groups'] * options['members'] * options['messages'], elapsed
@@ -0,0 +1,171 @@
+import asyncio
+import statistics
+import time
+import tracemalloc
+from datetime import date, time as clock
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from base.models import Room, Reservation
+from base.routing import websocket_urlpatterns
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test WebSocket fan-out: K meetings with N participants each send chat, "
+        "whiteboard and signaling traffic at fixed rates. Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meetings', type=int, default=10, help="Concurrent meetings (K)")
+        parser.add_argument('--participants', type=int, default=5, help="Participants per meeting (N)")
+        parser.add_argument('--duration', type=float, default=5, help="Seconds of traffic")
+        parser.add_argument('--chat-rate', type=float, default=0.5, help="Chat messages per second per participant")
+        parser.add_argument(
+            '--whiteboard-rate',
+            type=float,
+            default=10,
+            help="Whiteboard pointer updates per second per participant (sent as ephemeral cursor state)",
+        )
+        parser.add_argument('--signal-rate', type=float, default=2, help="ICE candidates per second per participant")
+        parser.add_argument('--redis', metavar='HOST:PORT', help="Use a local Redis channel layer instead of the in-memory one")
+
+    def handle(self, *args, **options):
+        if options['redis']:
+            host, port = options['redis'].rsplit(':', 1)
+            layers = {'default': {
+                'BACKEND': 'channels_redis.core.RedisChannelLayer',
+                'CONFIG': {'hosts': [(host, int(port))]},
+            }}
+            caches = {'default': {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                'LOCATION': f'redis://{host}:{port}/1',
+            }}
+        else:
+            layers = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': 1000}}}
+            caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+        with override_settings(CHANNEL_LAYERS=layers, CACHES=caches):
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                meetings = self.create_meetings(options['meetings'], options['participants'])
+                stats = asyncio.run(self.run(meetings, options))
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.report(stats, options)
+
+    def create_meetings(self, count, participants):
+        users = [
+            User.objects.create_user(username=f'bench{index}', password='bench-password')
+            for index in range(participants)
+        ]
+        meetings = []
+        for index in range(count):
+            room = Room.objects.create(name=f'Bench Room {index}', capacity=participants)
+            reservation = Reservation.objects.create(
+                room=room, user=users[0], title=f'Bench meeting {index}', date=date.today(),
+                start_time=clock(0, 0), end_time=clock(23, 59), participant_count=participants,
+            )
+            meetings.append((reservation, users))
+        return meetings
+
+    async def run(self, meetings, options):
+        application = URLRouter(websocket_urlpatterns)
+        latencies = {'chat': [], 'whiteboard': [], 'signaling': []}
+        sent = {'chat': 0, 'whiteboard': 0, 'signaling': 0}
+
+        tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        sockets = []
+        for reservation, users in meetings:
+            for user in users:
+                chat = WebsocketCommunicator(application, f'/ws/chat/{reservation.id}/')
+                signal = WebsocketCommunicator(application, f'/ws/webrtc/{reservation.id}/')
+                for communicator in (chat, signal):
+                    communicator.scope['user'] = user
+                    connected, _ = await communicator.connect(timeout=10)
+                    if not connected:
+                        raise RuntimeError(f"Could not connect {communicator.scope['path']}")
+                sockets.append((chat, signal))
+        memory_per_connection = (tracemalloc.get_traced_memory()[0] - memory_before) / (len(sockets) * 2)
+        tracemalloc.stop()
+
+        async def receive(communicator):
+            while True:
+                frame = await communicator.receive_json_from(timeout=3600)
+                now = time.perf_counter()
+                if frame['type'] == 'chat_message' and frame['message'].startswith('bench:'):
+                    latencies['chat'].append(now - float(frame['message'][6:]))
+                elif frame['type'] == 'ephemeral':
+                    latencies['whiteboard'].extend(now - state['data']['sent_at'] for state in frame['states'])
+                elif frame['type'] == 'ice_candidate':
+                    latencies['signaling'].append(now - frame['candidate']['sent_at'])
+
+        async def send(communicator, kind, rate, build):
+            if rate <= 0:
+                return
+            interval = 1 / rate
+            deadline = time.perf_counter() + options['duration']
+            while time.perf_counter() < deadline:
+                await communicator.send_json_to(build(time.perf_counter()))
+                sent[kind] += 1
+                await asyncio.sleep(interval)
+
+        receivers = [asyncio.ensure_future(receive(c)) for pair in sockets for c in pair]
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            sender
+            for chat, signal in sockets
+            for sender in (
+                send(chat, 'chat', options['chat_rate'], lambda t: {'message': f'bench:{t}'}),
+                send(chat, 'whiteboard', options['whiteboard_rate'], lambda t: {
+                    'type': 'ephemeral', 'kind': 'cursor', 'data': {'sent_at': t},
+                }),
+                send(signal, 'signaling', options['signal_rate'], lambda t: {
+                    'type': 'ice_candidate', 'candidate': {'sent_at': t}, 'receiver_id': None,
+                }),
+            )
+        ))
+        # Let in-flight messages land before stopping the clock
+        await asyncio.sleep(0.5)
+        elapsed = time.perf_counter() - started
+
+        for receiver in receivers:
+            receiver.cancel()
+        for chat, signal in sockets:
+            await chat.disconnect()
+            await signal.disconnect()
+
+        return {
+            'connections': len(sockets) * 2,
+            'elapsed': elapsed,
+            'sent': sent,
+            'latencies': latencies,
+            'memory_per_connection': memory_per_connection,
+        }
+
+    def report(self, stats, options):
+        delivered = sum(len(values) for values in stats['latencies'].values())
+        self.stdout.write(
+            f"{options['meetings']} meetings x {options['participants']} participants, "
+            f"{stats['connections']} sockets, {stats['elapsed']:.1f}s"
+        )
+        self.stdout.write(f"Delivered {delivered} messages ({delivered / stats['elapsed']:,.0f} msg/s)")
+        for kind, values in stats['latencies'].items():
+            if not values:
+                self.stdout.write(f"  {kind:<10} sent {stats['sent'][kind]:>6}, nothing delivered")
+                continue
+            values.sort()
+            p50 = statistics.median(values) * 1000
+            p99 = values[min(len(values) - 1, int(len(values) * 0.99))] * 1000
+            self.stdout.write(
+                f"  {kind:<10} sent {stats['sent'][kind]:>6}, delivered {len(values):>7}, "
+                f"p50 {p50:.1f} ms, p99 {p99:.1f} ms"
+            )
+        self.stdout.write(f"Memory per connection: {stats['memory_per_connection'] / 1024:.1f} KiB")
@@ -0,0 +1,32 @@
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from base.consumers import DRAIN_GROUP, DRAIN_KEY
+
+
+class Command(BaseCommand):
+    help = "Drain every realtime WebSocket before a deploy: refuse new sockets and close open ones spread over a window"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window',
+            type=float,
+            default=getattr(settings, 'REALTIME_DRAIN_WINDOW', 30),
+            help="Seconds over which connections are closed and clients reconnect",
+        )
+
+    def handle(self, *args, **options):
+        window = options['window']
+        # Every worker started before now refuses new sockets, including the
+        # ones without an open socket to receive the broadcast below
+        cache.set(DRAIN_KEY, time.time(), timeout=None)
+        async_to_sync(get_channel_layer().group_send)(DRAIN_GROUP, {
+            'type': 'server_drain',
+            'window': window,
+        })
+        self.stdout.write(self.style.SUCCESS(f"Drain requested, connections will close over {window:g}s"))
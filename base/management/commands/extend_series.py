@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.utils import timezone
+
+from base.models import ReservationSeries
+from base.recurrence import extend_series, horizon
+
+
+class Command(BaseCommand):
+    help = "Store the occurrences of recurring reservations that came within the booking horizon"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Horizon in days, defaults to RECURRENCE_HORIZON_DAYS")
+
+    def handle(self, *args, **options):
+        through = horizon()
+        if options['days'] is not None:
+            through = timezone.localdate() + timedelta(days=options['days'])
+
+        # Series that are still open and not yet stored up to the horizon
+        pending = ReservationSeries.objects.filter(materialized_until__lt=through).filter(
+            Q(until__isnull=True) | Q(until__gt=F('materialized_until'))
+        ).select_related('room')
+
+        created = 0
+        for series in pending.iterator():
+            if series.is_finished():
+                continue
+            occurrences, skipped = extend_series(series, through)
+            created += len(occurrences)
+            for day in skipped:
+                self.stdout.write(self.style.WARNING(f"  series {series.id}: {day} already booked, skipped"))
+        self.stdout.write(self.style.SUCCESS(f"{created} occurrences added through {through}"))
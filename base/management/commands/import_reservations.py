@@ -0,0 +1,37 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from base.importer import import_reservations
+
+
+class Command(BaseCommand):
+    help = "Import a schedule of reservations from a CSV or iCalendar file, skipping rows that conflict"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV (room,date,start,end,title,...) or .ics file")
+        parser.add_argument('--user', required=True, help="Username that owns rows without a user column")
+        parser.add_argument('--format', choices=['csv', 'ics'], help="Defaults to the file extension")
+        parser.add_argument('--dry-run', action='store_true', help="Check the file without saving anything")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user '{options['user']}'")
+        file_format = options['format'] or ('ics' if options['path'].lower().endswith('.ics') else 'csv')
+
+        started = time.perf_counter()
+        with open(options['path'], newline='', encoding='utf-8-sig') as stream:
+            try:
+                result = import_reservations(stream, user, file_format, dry_run=options['dry_run'])
+            except IntegrityError:
+                raise CommandError("A booking made during the import took one of its slots; nothing was imported")
+        elapsed = time.perf_counter() - started
+
+        for line, message in result.errors:
+            self.stdout.write(self.style.WARNING(f"  line {line}: {message}"))
+        prefix = "Dry run: " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(f"{prefix}{result.summary()} in {elapsed:.2f}s"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from base.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Recount the reservation counters from the reservations table and report any that had drifted"
+
+    def handle(self, *args, **options):
+        drifted = rebuild_counters()
+        for key, (stored, actual) in sorted(drifted.items()):
+            self.stdout.write(self.style.WARNING(f"  {key}: {stored} -> {actual}"))
+        self.stdout.write(self.style.SUCCESS(f"Counters rebuilt, {len(drifted)} corrected"))
@@ -0,0 +1,13 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from base.scheduler import BoundaryScheduler
+
+
+class Command(BaseCommand):
+    help = "Refresh and push room status exactly when reservations start or end (run as a single worker)"
+
+    def handle(self, *args, **options):
+        self.stdout.write("Status scheduler running")
+        asyncio.run(BoundaryScheduler().run())
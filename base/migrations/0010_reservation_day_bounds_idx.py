@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0009_chatmessage_sequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['date', 'start_time', 'end_time', 'room'], name='reservation_day_bounds_idx'),
+        ),
+    ]
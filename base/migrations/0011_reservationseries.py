@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0010_reservation_day_bounds_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('participant_count', models.IntegerField(default=1)),
+                ('participants_emails', models.TextField(blank=True, null=True)),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly')], max_length=10)),
+                ('interval', models.PositiveSmallIntegerField(default=1, help_text='Repeat every N days/weeks/months')),
+                ('starts_on', models.DateField()),
+                ('until', models.DateField(blank=True, help_text='Last possible date of the series', null=True)),
+                ('occurrence_count', models.PositiveIntegerField(blank=True, help_text='Number of occurrences', null=True)),
+                ('materialized_until', models.DateField(blank=True, help_text='Occurrences exist up to this date', null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='base.room')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'reservation series',
+            },
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='series',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='base.reservationseries'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def index_existing_attendees(apps, schema_editor):
+    Reservation = apps.get_model('base', 'Reservation')
+    Attendee = apps.get_model('base', 'Attendee')
+    batch = []
+    for reservation in Reservation.objects.select_related('user').iterator():
+        emails = []
+        for email in (reservation.participants_emails or '').split(',') + [reservation.user.email or '']:
+            email = email.strip().lower()
+            if email and email not in emails:
+                emails.append(email)
+        batch.extend(Attendee(reservation_id=reservation.id, email=email) for email in emails)
+        if len(batch) >= 1000:
+            Attendee.objects.bulk_create(batch)
+            batch = []
+    Attendee.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0012_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Attendee',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.CharField(max_length=254)),
+                ('reservation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendees', to='base.reservation')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['email', 'reservation'], name='attendee_email_idx')],
+                'constraints': [models.UniqueConstraint(fields=('reservation', 'email'), name='unique_attendee')],
+            },
+        ),
+        migrations.RunPython(index_existing_attendees, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_spans(apps, schema_editor):
+    # Existing rows hold wall-clock times of settings.TIME_ZONE
+    Reservation = apps.get_model('base', 'Reservation')
+    tz = timezone.get_default_timezone()
+    batch = []
+    for reservation in Reservation.objects.only('date', 'start_time', 'end_time').iterator():
+        end_day = reservation.date if reservation.end_time > reservation.start_time else reservation.date + timedelta(days=1)
+        reservation.starts_at = timezone.make_aware(datetime.combine(reservation.date, reservation.start_time), tz)
+        reservation.ends_at = timezone.make_aware(datetime.combine(end_day, reservation.end_time), tz)
+        batch.append(reservation)
+        if len(batch) >= 1000:
+            Reservation.objects.bulk_update(batch, ['starts_at', 'ends_at'])
+            batch = []
+    Reservation.objects.bulk_update(batch, ['starts_at', 'ends_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0014_waitlistentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='starts_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='ends_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_spans, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='reservation',
+            name='starts_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='ends_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['room', 'starts_at', 'ends_at'], name='reservation_room_span_idx'),
+        ),
+    ]
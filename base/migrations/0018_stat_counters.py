@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:33
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_reservations(apps, schema_editor):
+    Reservation = apps.get_model('base', 'Reservation')
+    StatCounter = apps.get_model('base', 'StatCounter')
+    reservations = Reservation.objects.order_by()
+    counters = [StatCounter(key='reservations', value=reservations.count())]
+    for field, prefix in (('date', 'day'), ('room_id', 'room'), ('user_id', 'user')):
+        for value, count in reservations.values_list(field).annotate(count=Count('id')):
+            key = value.isoformat() if field == 'date' else value
+            counters.append(StatCounter(key=f'reservations:{prefix}:{key}', value=count))
+    StatCounter.objects.bulk_create(counters, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0017_chat_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_existing_reservations, migrations.RunPython.noop),
+    ]
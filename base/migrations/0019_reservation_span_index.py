@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0018_stat_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['starts_at', 'ends_at'], name='reservation_span_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:20
+
+from django.db import migrations
+from django.db.models import Sum
+
+# counters.TOTAL_SHARDS when this migration was written
+TOTAL_SHARDS = 16
+
+
+def shard_total(apps, schema_editor):
+    StatCounter = apps.get_model('base', 'StatCounter')
+    total = StatCounter.objects.filter(key='reservations').values_list('value', flat=True).first() or 0
+    StatCounter.objects.filter(key='reservations').delete()
+    StatCounter.objects.bulk_create([
+        StatCounter(key=f'reservations:total:{shard}', value=total if shard == 0 else 0)
+        for shard in range(TOTAL_SHARDS)
+    ])
+
+
+def unshard_total(apps, schema_editor):
+    StatCounter = apps.get_model('base', 'StatCounter')
+    shards = StatCounter.objects.filter(key__startswith='reservations:total:')
+    total = shards.aggregate(total=Sum('value'))['total'] or 0
+    shards.delete()
+    StatCounter.objects.create(key='reservations', value=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0019_reservation_span_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(shard_total, unshard_total),
+    ]
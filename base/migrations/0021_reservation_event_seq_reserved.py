@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0020_shard_reservation_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='event_seq_reserved',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
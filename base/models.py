@@ -1,6 +1,13 @@
-from django.db import models
+import copy
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from datetime import datetime, timedelta
+from django.core.cache import cache
+from django.utils import timezone
+from .caching import ROOMS, catalog_cache, warmup
+from .utils import aware, day_bounds
+from datetime import date, datetime, time, timedelta
+from dateutil.rrule import DAILY, MONTHLY, WEEKLY, rrule
 # در models.py در کلاس Reservation
 
 
@@ -20,69 +27,120 @@ class Room(models.Model):
     
     def __str__(self): # this function is used to return a string representation of the object , for example when we want to print the object
         return self.name
+
+    @classmethod
+    def cached_list(cls):
+        """
+        All rooms from the catalog cache, refreshed whenever a room changes.
+        The process-local tier shares its instances between requests, so each
+        caller gets its own copies to annotate.
+        """
+        rooms = catalog_cache.get_or_set(ROOMS, 'all', lambda: list(cls.objects.all()))
+        return [copy.copy(room) for room in rooms]
     
     def is_available(self, date, start_time, end_time): # this function check if the room is available for the specified time slot
         """Check if room is available for the specified time slot"""
-        overlapping = self.reservation_set.filter(
-            date=date,
-        ).filter(
-            models.Q(start_time__lt=end_time, end_time__gt=start_time)
-        )
+        starts_at, ends_at = Reservation.span(date, start_time, end_time)
+        overlapping = self.reservation_set.filter(starts_at__lt=ends_at, ends_at__gt=starts_at)
         return not overlapping.exists()
     
     def get_current_status(self): # this function returns the current status of the room (occupied/free)
         """Returns the current status of the room (occupied/free)"""
-        now = datetime.now()
-        today = now.date()
-        current_time = now.time()
+        # Kept in the cache until the room's next start/end boundary and
+        # refreshed by the status scheduler, so a read is a single lookup
+        status = cache.get(self.status_cache_key(self.id))
+        if status is None:
+            status = self.refresh_current_status()
+        return status
+
+    @staticmethod
+    def status_cache_key(room_id):
+        return f'room_status:{room_id}'
+
+    @classmethod
+    def attach_current_status(cls, rooms):
+        """Set ``current_status`` on each room with a single cache round trip"""
+        cached = cache.get_many([cls.status_cache_key(room.id) for room in rooms])
+        for room in rooms:
+            room.current_status = cached.get(cls.status_cache_key(room.id)) or room.refresh_current_status()
+
+    def refresh_current_status(self):
+        """Recompute the status and cache it until it can next change"""
+        # Range scans on the (room, starts_at, ends_at) index
+        now = timezone.now()
+        _, midnight = day_bounds(timezone.localdate(now))
         
         active_reservation = self.reservation_set.filter(
-            date=today,
-            start_time__lte=current_time,
-            end_time__gt=current_time
-        ).first()
+            starts_at__lte=now,
+            ends_at__gt=now
+        ).order_by('starts_at').first()
         
         if active_reservation:
-            return {
+            # A meeting running past midnight is followed by the next day's
+            _, horizon = day_bounds(timezone.localdate(active_reservation.ends_at))
+            next_reservation = self.reservation_set.filter(
+                starts_at__gte=active_reservation.ends_at,
+                starts_at__lt=max(midnight, horizon)
+            ).order_by('starts_at').first()
+            status = {
                 'status': 'occupied',
-                'reservation': active_reservation
+                'reservation': active_reservation,
+                'next_reservation': next_reservation
             }
+            expires = active_reservation.ends_at
         else:
-            return {
+            next_reservation = self.reservation_set.filter(
+                starts_at__gt=now,
+                starts_at__lt=midnight
+            ).order_by('starts_at').first()
+            status = {
                 'status': 'free',
-                'next_reservation': self.reservation_set.filter(
-                    date=today,
-                    start_time__gt=current_time
-                ).order_by('start_time').first()
+                'next_reservation': next_reservation
             }
+            expires = next_reservation.starts_at if next_reservation else midnight
+        
+        status['expires'] = expires # when this status can next change (aware)
+        cache.set(self.status_cache_key(self.id), status, timeout=max(1, (expires - now).total_seconds()))
+        return status
     
     def get_available_time_slots(self, date): #
         """Returns available time slots for a given date based on defined TimeSlot model."""
-        # دریافت تمام اسلات‌های زمانی فعال از دیتابیس
-        all_defined_slots = TimeSlot.objects.filter(is_active=True).order_by('start_time')
+        from .timeslots import slot_catalog
+
+        # اسلات‌های زمانی فعال از کاتالوگ کش شده در پروسه
+        catalog = slot_catalog()
         
-        if not all_defined_slots.exists():
+        if not catalog.slots:
             return [] # اگر هیچ اسلات زمانی تعریف نشده باشد
 
-        # Get all reservations for this room on the given date
-        reservations_for_date = self.reservation_set.filter(date=date) #
-        booked_slots_ranges = [(res.start_time, res.end_time) for res in reservations_for_date] #
+        # Reservations overlapping the day (one index range scan), as minute offsets
+        day_start, day_end = day_bounds(date)
+        booked_slots_ranges = [
+            (
+                max(0, (res_start - day_start).total_seconds() // 60),
+                min(24 * 60, (res_end - day_start).total_seconds() // 60),
+            )
+            for res_start, res_end in self.reservation_set.filter(
+                starts_at__lt=day_end, ends_at__gt=day_start
+            ).values_list('starts_at', 'ends_at')
+        ]
         
         available_slots_list = []
-        for slot in all_defined_slots:
-            slot_start, slot_end = slot.start_time, slot.end_time
+        for slot in catalog.slots:
             is_slot_available = True
             for res_start, res_end in booked_slots_ranges: #
                 # Check for overlap
-                if res_start < slot_end and res_end > slot_start: #
+                if res_start < slot.end_minute and res_end > slot.start_minute: #
                     is_slot_available = False #
                     break #
             if is_slot_available: #
                 # می‌توانید فرمت مورد نیازتان را برگردانید. اینجا (start_time, end_time) برگردانده شده.
-                available_slots_list.append((slot_start, slot_end)) #
+                available_slots_list.append((slot.start, slot.end)) #
         
         return available_slots_list #
 
+warmup(Room.cached_list)
+
 class Reservation(models.Model):
     participant_count = models.IntegerField(default=1, help_text="Number of participants")
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
@@ -95,11 +153,32 @@ class Reservation(models.Model):
     participants_emails = models.TextField(null=True, blank=True, 
                                           help_text="Enter email addresses separated by commas")
     reminder_sent = models.BooleanField(default=False) # this field is used to track if a reminder has been sent for this reservation
+    # The same meeting as aware datetimes, derived from date/start_time/end_time
+    # (local wall-clock times in settings.TIME_ZONE) by set_span(). Range queries
+    # use these; an end_time before start_time ends on the next day.
+    starts_at = models.DateTimeField(editable=False)
+    ends_at = models.DateTimeField(editable=False)
+    series = models.ForeignKey('ReservationSeries', on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name='occurrences') # set for occurrences of a recurring reservation
+    # Highest realtime event sequence that may already have been handed out
+    # for this meeting, kept by base/eventlog.py to restart its cache counter
+    event_seq_reserved = models.PositiveBigIntegerField(default=0, editable=False)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['date', 'start_time']
+        indexes = [
+            # Covers the status scheduler's "boundaries of the day" query
+            models.Index(fields=['date', 'start_time', 'end_time', 'room'], name='reservation_day_bounds_idx'),
+            models.Index(fields=['room', 'starts_at', 'ends_at'], name='reservation_room_span_idx'),
+            # Overlap checks across all rooms (timeline)
+            models.Index(fields=['starts_at', 'ends_at'], name='reservation_span_idx'),
+            # My reservations / profile: a user's bookings by day
+            models.Index(fields=['user', 'date', 'start_time'], name='reservation_user_date_idx'),
+            # Reminder run: tomorrow's bookings not reminded yet
+            models.Index(fields=['date', 'reminder_sent'], name='reservation_reminder_idx'),
+        ]
         # Add a constraint to prevent overlapping reservations
         constraints = [
             models.UniqueConstraint(
@@ -111,13 +190,60 @@ class Reservation(models.Model):
     def __str__(self):
         return f"{self.title} - {self.room.name} ({self.date})"
     
+    @staticmethod
+    def span(day, start_time, end_time):
+        """Aware (starts_at, ends_at) of a local date and wall-clock times"""
+        starts_at = aware(day, start_time)
+        ends_at = aware(day if end_time > start_time else day + timedelta(days=1), end_time)
+        return starts_at, ends_at
+    
+    def set_span(self):
+        """Fill starts_at/ends_at; save() does this, bulk_create callers must"""
+        self.starts_at, self.ends_at = self.span(self.date, self.start_time, self.end_time)
+        return self
+    
+    # The signal receivers compare an edit against the stored values of
+    # these, which instances remember when loaded or saved
+    TRACKED_FIELDS = ('date', 'room_id', 'user_id', 'participants_emails', 'starts_at', 'ends_at')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_stored()
+        return instance
+
+    def _remember_stored(self, fields=None):
+        """Note the tracked values now in the database; ``fields`` limits it to those written or read"""
+        if fields is not None:
+            fields = {self._meta.get_field(name).attname for name in fields}
+        self._stored = {
+            **getattr(self, '_stored', {}),
+            **{name: self.__dict__[name] for name in self.TRACKED_FIELDS
+               if name in self.__dict__ and (fields is None or name in fields)},
+        }
+
+    def stored(self, name, default=None):
+        """The database value of a tracked field, or ``default`` if this instance never saw it"""
+        return getattr(self, '_stored', {}).get(name, default)
+
+    def save(self, *args, **kwargs):
+        self.set_span()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'date', 'start_time', 'end_time'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'starts_at', 'ends_at'}
+        # The post_save receivers update the counters; commit them with the row
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+        self._remember_stored(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._remember_stored(fields)
+    
 
     def is_active(self): # this function checks if the reservation is currently active
         """Check if reservation is currently active"""
-        now = datetime.now()
-        reservation_start = datetime.combine(self.date, self.start_time)
-        reservation_end = datetime.combine(self.date, self.end_time)
-        return reservation_start <= now <= reservation_end
+        return self.starts_at <= timezone.now() <= self.ends_at
     
     def get_participant_list(self): # this function returns a list of participant emails
         """Returns list of participant emails"""
@@ -133,6 +259,58 @@ class Reservation(models.Model):
         return emails
 
 
+class ReservationSeries(models.Model):
+    """A recurring reservation; its occurrences are expanded up to a horizon"""
+    FREQUENCIES = {'daily': DAILY, 'weekly': WEEKLY, 'monthly': MONTHLY}
+    FREQUENCY_CHOICES = [('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly')]
+
+    room = models.ForeignKey(Room, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    title = models.CharField(max_length=200)
+    description = models.TextField(null=True, blank=True)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    participant_count = models.IntegerField(default=1)
+    participants_emails = models.TextField(null=True, blank=True)
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES)
+    interval = models.PositiveSmallIntegerField(default=1, help_text="Repeat every N days/weeks/months")
+    starts_on = models.DateField()
+    until = models.DateField(null=True, blank=True, help_text="Last possible date of the series")
+    occurrence_count = models.PositiveIntegerField(null=True, blank=True, help_text="Number of occurrences")
+    materialized_until = models.DateField(null=True, blank=True, help_text="Occurrences exist up to this date")
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'reservation series'
+
+    def __str__(self):
+        return f"{self.title} ({self.get_frequency_display().lower()} from {self.starts_on})"
+
+    def rule(self):
+        return rrule(
+            self.FREQUENCIES[self.frequency],
+            interval=self.interval,
+            dtstart=datetime.combine(self.starts_on, time.min),
+            until=datetime.combine(self.until, time.min) if self.until else None,
+            count=self.occurrence_count,
+        )
+
+    def dates_between(self, after, through):
+        """Occurrence dates after ``after`` (None for the start) up to ``through``, lazily"""
+        for moment in self.rule():
+            day = moment.date()
+            if day > through:
+                return
+            if after is None or day > after:
+                yield day
+
+    def is_finished(self):
+        """True once every occurrence has been expanded"""
+        if self.materialized_until is None:
+            return False
+        return next(self.dates_between(self.materialized_until, date.max), None) is None
+
 class WhiteboardData(models.Model):
     reservation = models.ForeignKey('Reservation', on_delete=models.CASCADE)
     data = models.TextField()
@@ -147,9 +325,17 @@ class ChatMessage(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     message = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
+    sequence = models.PositiveBigIntegerField(null=True, blank=True) # position in the reservation's realtime event stream
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['reservation', 'sequence'], name='chat_reservation_seq_idx'),
+            # Latest messages of a meeting
+            models.Index(fields=['reservation', 'timestamp'], name='chat_reservation_time_idx'),
+            # Admin changelist: newest messages and the date hierarchy
+            models.Index(fields=['timestamp'], name='chat_timestamp_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username}: {self.message[:20]}"
@@ -172,3 +358,86 @@ class TimeSlot(models.Model):
     @property
     def formatted_slot(self):
         return f"{self.start_time.strftime('%H:%M')}-{self.end_time.strftime('%H:%M')}"
+
+
+class IdempotencyKey(models.Model):
+    """Stored outcome of an API request, replayed when a client retries it"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64) # sha256 of the request body
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.key}"
+
+
+class Attendee(models.Model):
+    """An invitee or the organizer of a reservation, indexed by email for conflict checks"""
+    reservation = models.ForeignKey(Reservation, on_delete=models.CASCADE, related_name='attendees')
+    email = models.CharField(max_length=254) # lower-cased
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['email', 'reservation'], name='attendee_email_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['reservation', 'email'], name='unique_attendee'),
+        ]
+
+    def __str__(self):
+        return f"{self.email} ({self.reservation_id})"
+
+
+class WaitlistEntry(models.Model):
+    """A user waiting for a booked room and time; promoted in FIFO order when it frees up"""
+    WAITING = 'waiting'
+    PROMOTED = 'promoted'
+    STATUS_CHOICES = [(WAITING, 'Waiting'), (PROMOTED, 'Promoted')]
+
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='waitlist')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    title = models.CharField(max_length=200)
+    participant_count = models.PositiveIntegerField(default=1)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=WAITING)
+    reservation = models.ForeignKey(Reservation, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created', 'id']
+        verbose_name_plural = 'waitlist entries'
+        indexes = [
+            # FIFO queue of one room and day
+            models.Index(fields=['room', 'date', 'status', 'created'], name='waitlist_queue_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'room', 'date', 'start_time'],
+                condition=models.Q(status='waiting'),
+                name='unique_waiting_entry',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} waiting for {self.room.name} ({self.date} {self.start_time.strftime('%H:%M')})"
+
+
+class StatCounter(models.Model):
+    """
+    A row count kept up to date as reservations are written, so dashboards
+    read one row instead of counting the table. Maintained by base/counters.py.
+    """
+    key = models.CharField(max_length=64, primary_key=True) # e.g. 'reservations:day:2026-01-31'
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
@@ -0,0 +1,144 @@
+# base/pagination.py
+import logging
+
+from django.db.models import Q
+from django.utils.encoding import force_bytes
+from django.utils.http import urlencode, urlsafe_base64_decode, urlsafe_base64_encode
+
+logger = logging.getLogger(__name__)
+
+PER_PAGE = 10
+# Totals are counted up to here and shown as "1000+" beyond it
+COUNT_LIMIT = 1000
+CURSOR_SEPARATOR = '|'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    """
+    One page of a keyset-paginated queryset. Iterates like a Paginator page,
+    but links to its neighbours by cursor instead of by page number.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, total=None, total_capped=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+        self.total_capped = total_capped
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def parse_ordering(ordering):
+    """('-date', 'start_time', 'id') -> [('date', True), ('start_time', False), ('id', False)]"""
+    return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+
+def encode_cursor(obj, fields):
+    values = [str(getattr(obj, name)) for name, _ in fields]
+    return urlsafe_base64_encode(force_bytes(CURSOR_SEPARATOR.join(values)))
+
+
+def decode_cursor(cursor, model, fields):
+    try:
+        values = urlsafe_base64_decode(cursor).decode().split(CURSOR_SEPARATOR)
+        if len(values) != len(fields):
+            raise InvalidCursor(cursor)
+        return [model._meta.get_field(name).to_python(value) for (name, _), value in zip(fields, values)]
+    except InvalidCursor:
+        raise
+    except Exception as e:
+        raise InvalidCursor(cursor) from e
+
+
+def seek(fields, values, forward=True):
+    """
+    Rows strictly after ``values`` in the order of ``fields``, or strictly
+    before them when not ``forward``. The expanded form of the row comparison
+    (a, b, c) > (x, y, z), led by a plain range on the first column so the
+    database can start the index walk at the cursor instead of filtering.
+    """
+    def op(descending, inclusive=False):
+        return ('lt' if descending == forward else 'gt') + ('e' if inclusive else '')
+
+    (name, descending), value = fields[-1], values[-1]
+    condition = Q(**{f'{name}__{op(descending)}': value})
+    for (name, descending), value in reversed(list(zip(fields[:-1], values[:-1]))):
+        condition = Q(**{f'{name}__{op(descending)}': value}) | (Q(**{name: value}) & condition)
+
+    name, descending = fields[0]
+    return Q(**{f'{name}__{op(descending, inclusive=True)}': values[0]}) & condition
+
+
+def approximate_count(queryset, limit=COUNT_LIMIT):
+    """Count at most ``limit`` rows; returns (count, capped)"""
+    count = queryset.order_by()[:limit + 1].count()
+    return min(count, limit), count > limit
+
+
+def keyset_page(queryset, ordering, after=None, before=None, per_page=PER_PAGE, count_limit=None):
+    """
+    The page of ``queryset`` following the ``after`` cursor, or preceding the
+    ``before`` cursor, in ``ordering``. The ordering must end in a unique
+    field such as 'id' and name only non-null fields of the model itself.
+
+    Every page costs one LIMIT query that seeks from the cursor, so deep pages
+    are as cheap as the first. A total is only counted with ``count_limit``,
+    and then only up to it. An unreadable cursor gives the first page.
+    """
+    fields = parse_ordering(ordering)
+    model = queryset.model
+    forward = not before
+    cursor = before or after
+    if cursor:
+        try:
+            seeking = queryset.filter(seek(fields, decode_cursor(cursor, model, fields), forward))
+        except InvalidCursor:
+            logger.warning(f"Ignoring invalid pagination cursor {cursor!r}")
+            cursor, forward = None, True
+            seeking = queryset
+    else:
+        seeking = queryset
+
+    if forward:
+        order = ordering
+    else:
+        order = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+    rows = list(seeking.order_by(*order)[:per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    has_next = more if forward else True
+    has_previous = bool(cursor) if forward else more
+    page = KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1], fields) if rows and has_next else None,
+        previous_cursor=encode_cursor(rows[0], fields) if rows and has_previous else None,
+    )
+    if count_limit:
+        page.total, page.total_capped = approximate_count(queryset, count_limit)
+    return page
+
+
+def filter_query(request, *names):
+    """The query string of ``names`` from the request, for page links to carry"""
+    return urlencode([(name, request.GET[name]) for name in names if request.GET.get(name)])
@@ -0,0 +1,178 @@
+# base/recommend.py
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .attendees import attendee_busy
+from .caching import RESERVATIONS, catalog_cache
+from .models import Reservation, Room
+from .timeslots import slot_catalog
+from .utils import day_bounds, local_now
+
+# Availability is kept as one int per room (and one for all invitees) with a
+# bit for every minute of the window: bit ``day * MINUTES_PER_DAY + minute``
+# is set when that minute is taken. Whole windows are then intersected with a
+# handful of big-int operations instead of looping over candidate times.
+MINUTES_PER_DAY = 24 * 60
+MAX_RECOMMEND_DAYS = 31
+MAX_RECOMMENDATIONS = 50
+
+EQUIPMENT = {
+    'projector': 'has_projector',
+    'whiteboard': 'has_whiteboard',
+    'video_conference': 'has_video_conference',
+}
+
+
+def minute_of_day(value):
+    return value.hour * 60 + value.minute + (value.second > 0)
+
+
+def span_days(starts_at, ends_at):
+    """The local days an aware span touches"""
+    day = timezone.localdate(starts_at)
+    last = timezone.localdate(ends_at - timedelta(microseconds=1))
+    while day <= last:
+        yield day
+        day += timedelta(days=1)
+
+
+def day_bits(day, starts_at, ends_at):
+    """Busy bits of ``day`` for an aware span, clipped to the day"""
+    day_start, day_end = day_bounds(day)
+    start = 0
+    if starts_at > day_start:
+        local_start = timezone.localtime(starts_at)
+        start = local_start.hour * 60 + local_start.minute
+    end = MINUTES_PER_DAY if ends_at >= day_end else minute_of_day(timezone.localtime(ends_at))
+    return ((1 << (end - start)) - 1) << start if end > start else 0
+
+
+def window_bits(first_day, last_day, spans):
+    """Bitmap of the window from aware (starts_at, ends_at) spans, shifting each day once"""
+    days = {}
+    for starts_at, ends_at in spans:
+        for day in span_days(starts_at, ends_at):
+            if first_day <= day <= last_day:
+                days[day] = days.get(day, 0) | day_bits(day, starts_at, ends_at)
+    bits = 0
+    for day, busy in days.items():
+        bits |= busy << ((day - first_day).days * MINUTES_PER_DAY)
+    return bits
+
+
+def room_day_bits(days):
+    """
+    {day: {room_id: busy bits of the day}} for rooms with bookings. Cached
+    per day, shared by every window that covers it and kept out of the L1;
+    a day of 500 rooms is well under 100 KB.
+    """
+    def load(missing):
+        loaded = {day: {} for day in missing}
+        # One range over the missing days; bookings across midnight mark both
+        for room_id, starts_at, ends_at in Reservation.objects.filter(
+            starts_at__lt=day_bounds(max(missing))[1],
+            ends_at__gt=day_bounds(min(missing))[0],
+        ).values_list('room_id', 'starts_at', 'ends_at'):
+            for day in span_days(starts_at, ends_at):
+                if day in loaded:
+                    loaded[day][room_id] = loaded[day].get(room_id, 0) | day_bits(day, starts_at, ends_at)
+        return loaded
+    return catalog_cache.get_or_set_many(RESERVATIONS, days, load)
+
+
+def room_bitmaps(first_day, last_day):
+    """Busy bitmap of the window for every room with a booking in it"""
+    days = [first_day + timedelta(days=index) for index in range((last_day - first_day).days + 1)]
+    per_day = room_day_bits(days)
+    bitmaps = {}
+    for index, day in enumerate(days):
+        offset = index * MINUTES_PER_DAY
+        for room_id, bits in per_day[day].items():
+            bitmaps[room_id] = bitmaps.get(room_id, 0) | bits << offset
+    return bitmaps
+
+
+def free_runs(free, length):
+    """Bits where ``length`` consecutive free minutes start"""
+    span = 1
+    while span < length:
+        step = min(span, length - span)
+        free &= free >> step
+        span += step
+    return free
+
+
+def candidate_starts(first_day, days, duration, now):
+    """Bits of every time slot start from which the meeting fits in its day and is not past"""
+    starts = 0
+    slots = slot_catalog().slots
+    for index in range(days):
+        day = first_day + timedelta(days=index)
+        for slot in slots:
+            if slot.start_minute + duration > MINUTES_PER_DAY:
+                continue
+            if datetime.combine(day, slot.start) < now:
+                continue
+            starts |= 1 << (index * MINUTES_PER_DAY + slot.start_minute)
+    return starts
+
+
+def earliest(bits, limit):
+    positions = []
+    while bits and len(positions) < limit:
+        lowest = bits & -bits
+        positions.append(lowest.bit_length() - 1)
+        bits ^= lowest
+    return positions
+
+
+def recommend_slots(first_day, last_day, duration, emails=(), min_capacity=1, equipment=(), limit=10, now=None):
+    """
+    The ``limit`` earliest (room, start) pairs from ``first_day`` to
+    ``last_day`` where a room with the capacity and equipment and every
+    invitee are free for ``duration`` minutes, starting on a time slot
+    boundary. Ties go to the smallest room that fits.
+    """
+    now = now or local_now()
+    days = (last_day - first_day).days + 1
+    rooms = [
+        room for room in Room.cached_list()
+        if room.capacity >= min_capacity and all(getattr(room, EQUIPMENT[name]) for name in equipment)
+    ]
+    starts = candidate_starts(first_day, days, duration, now)
+    if not rooms or not starts:
+        return []
+
+    window = (1 << (days * MINUTES_PER_DAY)) - 1
+    window_start, _ = day_bounds(first_day)
+    _, window_end = day_bounds(last_day)
+    people = window_bits(first_day, last_day, attendee_busy(emails, window_start, window_end)) if emails else 0
+    # Starts that suit every invitee; rooms can only narrow this down
+    open_starts = free_runs(window & ~people, duration) & starts
+    if not open_starts:
+        return []
+
+    room_busy = room_bitmaps(first_day, last_day)
+    candidates = []
+    for room in rooms:
+        busy = room_busy.get(room.id)
+        feasible = open_starts & free_runs(window & ~busy, duration) if busy else open_starts
+        for position in earliest(feasible, limit):
+            candidates.append((position, room.capacity, room.name, room))
+    candidates.sort(key=lambda candidate: candidate[:3])
+
+    recommendations = []
+    for position, _, _, room in candidates[:limit]:
+        day = first_day + timedelta(days=position // MINUTES_PER_DAY)
+        minute = position % MINUTES_PER_DAY
+        start = datetime.combine(day, time(minute // 60, minute % 60))
+        recommendations.append({
+            'room': room.id,
+            'name': room.name,
+            'capacity': room.capacity,
+            'date': day.isoformat(),
+            'start': start.strftime('%H:%M'),
+            'end': (start + timedelta(minutes=duration)).strftime('%H:%M'),
+        })
+    return recommendations
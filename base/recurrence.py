@@ -0,0 +1,172 @@
+# base/recurrence.py
+import logging
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from .attendees import index_attendees
+from .counters import count_changes, count_reservations
+from .freebusy import busy_index, overlap
+from .models import Reservation, ReservationSeries
+from .signals import bulk_reservations_changed, delete_reservations
+
+logger = logging.getLogger(__name__)
+
+# Occurrences are stored this many days ahead; `manage.py extend_series`
+# adds the next ones as the horizon moves.
+HORIZON_DAYS = getattr(settings, 'RECURRENCE_HORIZON_DAYS', 180)
+MAX_OCCURRENCES = 500
+
+# Fields copied from the series to each of its occurrences
+SHARED_FIELDS = ('room', 'user', 'title', 'description', 'start_time', 'end_time',
+                 'participant_count', 'participants_emails')
+
+
+class SeriesConflict(Exception):
+    def __init__(self, dates):
+        self.dates = sorted(dates)
+        super().__init__(f"Room already booked on {self.display()}")
+
+    def display(self, limit=5):
+        shown = ', '.join(day.isoformat() for day in self.dates[:limit])
+        if len(self.dates) > limit:
+            shown += f" and {len(self.dates) - limit} more"
+        return shown
+
+
+def horizon():
+    return timezone.localdate() + timedelta(days=HORIZON_DAYS)
+
+
+def conflicting_dates(room, dates, start_time, end_time, series=None):
+    """The dates on which the room is already taken at that time, from one range query"""
+    if not dates:
+        return set()
+    spans = {day: Reservation.span(day, start_time, end_time) for day in dates}
+    taken = Reservation.objects.filter(
+        room=room,
+        starts_at__lt=max(end for _, end in spans.values()),
+        ends_at__gt=min(start for start, _ in spans.values()),
+    )
+    if series is not None:
+        taken = taken.exclude(series=series)
+    busy = busy_index(taken.values_list('starts_at', 'ends_at'))
+    return {day for day, (start, end) in spans.items() if overlap(busy, start, end)}
+
+
+def build_occurrences(series, dates):
+    return [
+        Reservation(series=series, date=day, **{field: getattr(series, field) for field in SHARED_FIELDS}).set_span()
+        for day in dates
+    ]
+
+
+def create_series(reservation, frequency, until=None, count=None, interval=1):
+    """
+    Book the unsaved ``reservation`` as the first of a recurring series and
+    store its occurrences up to the horizon. Raises SeriesConflict, booking
+    nothing, if any occurrence clashes with an existing reservation.
+    """
+    series = ReservationSeries(
+        frequency=frequency, interval=interval, starts_on=reservation.date,
+        until=until, occurrence_count=count,
+        **{field: getattr(reservation, field) for field in SHARED_FIELDS},
+    )
+    through = max(horizon(), reservation.date)
+    dates = list(islice(series.dates_between(None, through), MAX_OCCURRENCES))
+
+    with transaction.atomic():
+        conflicts = conflicting_dates(series.room, dates, series.start_time, series.end_time)
+        if conflicts:
+            raise SeriesConflict(conflicts)
+        series.materialized_until = dates[-1] if len(dates) == MAX_OCCURRENCES else through
+        series.save()
+        occurrences = Reservation.objects.bulk_create(build_occurrences(series, dates))
+        index_attendees(occurrences)
+        count_reservations(occurrences)
+        transaction.on_commit(lambda: bulk_reservations_changed(occurrences))
+    return series, occurrences
+
+
+def extend_series(series, through=None):
+    """
+    Store the occurrences that came within the horizon since the last run.
+    Dates taken by other bookings in the meantime are skipped and returned.
+    """
+    through = through or horizon()
+    dates = list(islice(series.dates_between(series.materialized_until, through), MAX_OCCURRENCES))
+    with transaction.atomic():
+        skipped = conflicting_dates(series.room, dates, series.start_time, series.end_time, series)
+        occurrences = Reservation.objects.bulk_create(
+            build_occurrences(series, [day for day in dates if day not in skipped])
+        )
+        index_attendees(occurrences)
+        count_reservations(occurrences)
+        series.materialized_until = dates[-1] if len(dates) == MAX_OCCURRENCES else through
+        series.save(update_fields=['materialized_until', 'updated'])
+        transaction.on_commit(lambda: bulk_reservations_changed(occurrences))
+    if skipped:
+        logger.warning(f"Series {series.id}: skipped occurrences on {SeriesConflict(skipped).display()}")
+    return occurrences, sorted(skipped)
+
+
+def update_series(series, **changes):
+    """
+    Apply ``changes`` to the series and all of its upcoming occurrences with
+    a single UPDATE. New times are checked against other bookings first; a
+    change of room or user reads the occurrences once to move their counters.
+    """
+    upcoming = series.occurrences.filter(date__gte=timezone.localdate())
+    with transaction.atomic():
+        start_time = changes.get('start_time', series.start_time)
+        end_time = changes.get('end_time', series.end_time)
+        if (start_time, end_time) != (series.start_time, series.end_time):
+            dates = list(upcoming.values_list('date', flat=True))
+            conflicts = conflicting_dates(series.room, dates, start_time, end_time, series)
+            if conflicts:
+                raise SeriesConflict(conflicts)
+
+            if dates:
+                # Each date has its own aware span, still set by the one UPDATE
+                spans = {day: Reservation.span(day, start_time, end_time) for day in dates}
+                changes['starts_at'] = Case(*[When(date=day, then=Value(span[0])) for day, span in spans.items()])
+                changes['ends_at'] = Case(*[When(date=day, then=Value(span[1])) for day, span in spans.items()])
+
+        for field, value in changes.items():
+            if field not in ('starts_at', 'ends_at'):
+                setattr(series, field, value)
+        series.save()
+        moved = list(upcoming.values_list('date', 'room_id', 'user_id')) if {'room', 'user'} & set(changes) else []
+        upcoming.update(updated=series.updated, **changes)
+        if moved:
+            count_changes(removed=moved, added=[(day, series.room_id, series.user_id) for day, _, _ in moved])
+        if 'participants_emails' in changes:
+            index_attendees(list(upcoming.select_related('user')), replace=True)
+        today = timezone.localdate()
+        todays = list(upcoming.filter(date=today))
+        left = {room_id for day, room_id, _ in moved if day == today}
+        transaction.on_commit(lambda: bulk_reservations_changed(todays, rooms=left))
+
+
+def cancel_series(series):
+    """
+    Delete every upcoming occurrence as one batch: a SELECT, the cascades
+    and a DELETE, with counters and caches updated once for all of them.
+    Past meetings are kept and the series ends; it is removed when nothing
+    of it is left.
+    """
+    today = timezone.localdate()
+    with transaction.atomic():
+        deleted = delete_reservations(Reservation.objects.filter(series=series, date__gte=today))
+        if series.occurrences.exists():
+            series.until = today - timedelta(days=1)
+            series.materialized_until = series.until
+            series.occurrence_count = None
+            series.save()
+        else:
+            series.delete()
+    return deleted
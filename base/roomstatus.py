@@ -0,0 +1,67 @@
+# base/roomstatus.py
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from .models import Room
+
+logger = logging.getLogger(__name__)
+
+# Lobby screens, the home page and the admin dashboard listen on this group
+# (over ws/rooms/ or the SSE fallback) for room free/occupied changes.
+ROOM_STATUS_GROUP = 'room_status'
+
+
+def reservation_summary(reservation):
+    if reservation is None:
+        return None
+    return {
+        'id': reservation.id,
+        'title': reservation.title,
+        'start': reservation.start_time.strftime('%H:%M'),
+        'end': reservation.end_time.strftime('%H:%M'),
+    }
+
+
+def room_status_event(room):
+    """Build the ``room_status`` group event for a room's current state"""
+    current_status = room.get_current_status()
+    return {
+        'type': 'room_status',
+        'room_id': room.id,
+        'status': current_status['status'],
+        'reservation': reservation_summary(current_status.get('reservation')),
+        'next_reservation': reservation_summary(current_status.get('next_reservation')),
+    }
+
+
+# Cached room markup in home.html ({% cache ... room_card room.id user.is_authenticated %})
+# and admin_dashboard.html ({% cache ... room_row room.id %})
+ROOM_FRAGMENTS = (
+    ('room_card', (True,)),
+    ('room_card', (False,)),
+    ('room_row', ()),
+)
+
+
+def invalidate_room_fragments(room_id):
+    """Drop the cached room card and dashboard row of a room"""
+    cache.delete_many([
+        make_template_fragment_key(name, [room_id, *vary_on])
+        for name, vary_on in ROOM_FRAGMENTS
+    ])
+
+
+def broadcast_room_status(room_id):
+    """Push a room's current status to every open status subscriber"""
+    room = Room.objects.filter(id=room_id).first()
+    if room is None:
+        return
+    try:
+        async_to_sync(get_channel_layer().group_send)(ROOM_STATUS_GROUP, room_status_event(room))
+    except Exception as e:
+        # Status push is best effort, it must never break a booking
+        logger.error(f"Could not push status of room {room_id}: {str(e)}")
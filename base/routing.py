@@ -5,5 +5,6 @@ websocket_urlpatterns = [
     #re_path(r'ws/whiteboard/(?P<room_id>\w+)/$', consumers.WhiteboardConsumer.as_asgi()),
     re_path(r'ws/chat/(?P<reservation_id>\d+)/$', consumers.ChatConsumer.as_asgi()),
     re_path(r'ws/webrtc/(?P<reservation_id>\d+)/$', consumers.WebRTCSignalConsumer.as_asgi()),
+    re_path(r'ws/rooms/$', consumers.RoomStatusConsumer.as_asgi()),
 
 ]
\ No newline at end of file
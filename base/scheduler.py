@@ -0,0 +1,133 @@
+# base/scheduler.py
+import asyncio
+import heapq
+import logging
+from datetime import datetime
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.utils import timezone
+
+from .models import Reservation, Room
+from .roomstatus import broadcast_room_status, invalidate_room_fragments
+from .utils import day_bounds
+
+logger = logging.getLogger(__name__)
+
+# Reservation signals tell the running scheduler about new boundaries here
+SCHEDULER_GROUP = 'status_scheduler'
+
+
+class BoundaryScheduler:
+    """
+    Keeps a min-heap of the start/end times of the reservations overlapping
+    today, as aware datetimes, so a meeting running past midnight is
+    scheduled on both days. When a boundary passes, the rooms it belongs to
+    get their cached status refreshed and pushed to status subscribers,
+    instead of every request recomputing it.
+
+    Cancelled reservations are not removed from the heap; their boundaries
+    simply refresh a status that did not change.
+    """
+
+    def __init__(self):
+        self.day = None
+        self.window = None  # aware bounds of self.day
+        self.heap = []  # (when, room_id)
+        self.wake = asyncio.Event()
+
+    def load(self, day):
+        """Load the boundaries of every booking overlapping ``day`` with one range query"""
+        self.day = day
+        self.window = day_bounds(day)
+        self.heap = []
+        rows = Reservation.objects.filter(
+            starts_at__lt=self.window[1], ends_at__gt=self.window[0],
+        ).values_list('room_id', 'starts_at', 'ends_at')
+        for room_id, starts_at, ends_at in rows:
+            self.add(room_id, starts_at, ends_at)
+
+    def add(self, room_id, starts_at, ends_at):
+        """Schedule the future boundaries of a booking from ``starts_at`` to ``ends_at``"""
+        now = timezone.now()
+        earliest = self.heap[0][0] if self.heap else None
+        for when in (starts_at, ends_at):
+            if when > now:
+                heapq.heappush(self.heap, (when, room_id))
+        if self.heap and self.heap[0][0] != earliest:
+            self.wake.set()
+
+    def covers(self, starts_at, ends_at):
+        """Whether a booking overlaps the loaded day"""
+        return self.window is not None and starts_at < self.window[1] and ends_at > self.window[0]
+
+    def pop_due(self, now):
+        """Return the rooms whose boundaries have passed"""
+        rooms = set()
+        while self.heap and self.heap[0][0] <= now:
+            rooms.add(heapq.heappop(self.heap)[1])
+        return rooms
+
+    def next_wakeup(self, now):
+        _, midnight = day_bounds(timezone.localdate(now))
+        if self.heap:
+            return min(self.heap[0][0], midnight)
+        return midnight
+
+    async def run(self):
+        listener = asyncio.ensure_future(self.listen())
+        try:
+            while True:
+                now = timezone.now()
+                if self.day != timezone.localdate(now):
+                    await database_sync_to_async(self.load)(timezone.localdate(now))
+                for room_id in self.pop_due(now):
+                    await database_sync_to_async(refresh_room_status)(room_id)
+
+                timeout = (self.next_wakeup(now) - timezone.now()).total_seconds()
+                try:
+                    await asyncio.wait_for(self.wake.wait(), max(0, timeout))
+                except asyncio.TimeoutError:
+                    pass
+                self.wake.clear()
+        finally:
+            listener.cancel()
+
+    async def listen(self):
+        """Add boundaries announced by reservation signals in other processes"""
+        channel_layer = get_channel_layer()
+        channel = await channel_layer.new_channel()
+        await channel_layer.group_add(SCHEDULER_GROUP, channel)
+        try:
+            while True:
+                message = await channel_layer.receive(channel)
+                starts_at = datetime.fromisoformat(message['starts_at'])
+                ends_at = datetime.fromisoformat(message['ends_at'])
+                if self.covers(starts_at, ends_at):
+                    self.add(message['room_id'], starts_at, ends_at)
+        finally:
+            await channel_layer.group_discard(SCHEDULER_GROUP, channel)
+
+
+def refresh_room_status(room_id):
+    """Materialize a room's status at a boundary and push it to subscribers"""
+    room = Room.objects.filter(id=room_id).first()
+    if room is None:
+        return
+    room.refresh_current_status()
+    invalidate_room_fragments(room_id)
+    broadcast_room_status(room_id)
+
+
+def schedule_reservation(reservation):
+    """Tell the running scheduler about a reservation's start and end"""
+    try:
+        async_to_sync(get_channel_layer().group_send)(SCHEDULER_GROUP, {
+            'type': 'reservation.scheduled',
+            'room_id': reservation.room_id,
+            'starts_at': reservation.starts_at.isoformat(),
+            'ends_at': reservation.ends_at.isoformat(),
+        })
+    except Exception as e:
+        logger.error(f"Could not schedule status boundaries of reservation {reservation.id}: {str(e)}")
@@ -0,0 +1,196 @@
+# base/signals.py
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models.deletion import Collector
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .attendees import index_attendees
+from .caching import RESERVATIONS, ROOMS, TIMESLOTS, catalog_cache
+from .counters import count_changes, counted
+from .models import Reservation, Room, TimeSlot
+from .roomstatus import broadcast_room_status, invalidate_room_fragments
+from .scheduler import schedule_reservation
+from .utils import day_bounds
+
+# Set while delete_reservations() handles a whole batch itself
+_batch_delete = ContextVar('reservation_batch_delete', default=False)
+
+
+def overlaps_today(starts_at, ends_at):
+    """Whether a booking over these aware times can change a room's status today"""
+    day_start, day_end = day_bounds(timezone.localdate())
+    return starts_at < day_end and ends_at > day_start
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def push_room_status(sender, instance, **kwargs):
+    """A reservation created, moved or cancelled for today can change a room's status"""
+    if _batch_delete.get():
+        return
+    # Moving a booking off today frees its old room, so both places count
+    places = {
+        (instance.starts_at, instance.ends_at, instance.room_id),
+        (
+            instance.stored('starts_at', instance.starts_at),
+            instance.stored('ends_at', instance.ends_at),
+            instance.stored('room_id', instance.room_id),
+        ),
+    }
+    room_ids = {room_id for starts_at, ends_at, room_id in places if overlaps_today(starts_at, ends_at)}
+    if not room_ids:
+        return
+    for room_id in room_ids:
+        cache.delete(Room.status_cache_key(room_id))
+        invalidate_room_fragments(room_id)
+
+    def after_commit():
+        # Drop anything re-cached from before the commit, then push the change
+        for room_id in room_ids:
+            cache.delete(Room.status_cache_key(room_id))
+            invalidate_room_fragments(room_id)
+            broadcast_room_status(room_id)
+        if 'created' in kwargs and overlaps_today(instance.starts_at, instance.ends_at):  # saved, not deleted
+            schedule_reservation(instance)
+
+    transaction.on_commit(after_commit)
+
+
+# Stands in for a stored value the instance never saw
+UNKNOWN = object()
+
+
+def changed(instance, *names):
+    """Whether a save may change any of the tracked ``names``; unknown counts as changed"""
+    return any(instance.stored(name, UNKNOWN) != getattr(instance, name) for name in names)
+
+
+# The attendee index lists participants_emails and the organizer's address
+ATTENDEE_FIELDS = {'participants_emails', 'user', 'user_id'}
+
+
+@receiver(post_save, sender=Reservation)
+def index_reservation_attendees(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Keep the attendee index in step with participants_emails and the organizer"""
+    if raw:
+        return
+    if created:
+        index_attendees([instance])
+        return
+    if update_fields is not None and not ATTENDEE_FIELDS & set(update_fields):
+        return
+    if changed(instance, 'participants_emails', 'user_id'):
+        index_attendees([instance], replace=True)
+
+
+# An edit touching these moves the reservation to other counters
+COUNTED_FIELDS = {'date', 'room', 'room_id', 'user', 'user_id'}
+
+
+@receiver(pre_save, sender=Reservation)
+def remember_counted(sender, instance, raw=False, update_fields=None, **kwargs):
+    """What an edited reservation was counted by before it changes, from its stored values"""
+    instance._counted = None
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not COUNTED_FIELDS & set(update_fields):
+        return
+    stored = tuple(instance.stored(name, UNKNOWN) for name in ('date', 'room_id', 'user_id'))
+    if UNKNOWN in stored:
+        # Built with a pk rather than loaded, so only the row knows
+        stored = Reservation.objects.filter(pk=instance.pk).values_list('date', 'room_id', 'user_id').first()
+    instance._counted = stored
+
+
+@receiver(post_save, sender=Reservation)
+def count_saved_reservation(sender, instance, created, raw=False, **kwargs):
+    """Runs inside Reservation.save()'s transaction; fixtures need rebuild_counters"""
+    if raw:
+        return
+    if created:
+        count_changes(added=[counted(instance)])
+    elif instance._counted and instance._counted != counted(instance):
+        count_changes(removed=[instance._counted], added=[counted(instance)])
+
+
+@receiver(post_delete, sender=Reservation)
+def uncount_deleted_reservation(sender, instance, **kwargs):
+    """Runs inside the deletion's transaction, also for QuerySet.delete() and cascades"""
+    if _batch_delete.get():
+        return
+    count_changes(removed=[counted(instance)])
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_room_card(sender, instance, **kwargs):
+    """Room edits change the cached card and dashboard row"""
+    room_id = instance.id
+    invalidate_room_fragments(room_id)
+    transaction.on_commit(lambda: invalidate_room_fragments(room_id))
+
+
+CATALOG_NAMESPACES = {Room: ROOMS, Reservation: RESERVATIONS, TimeSlot: TIMESLOTS}
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+@receiver(post_save, sender=TimeSlot)
+@receiver(post_delete, sender=TimeSlot)
+def bump_catalog_namespace(sender, **kwargs):
+    """Any change invalidates the model's namespace in the catalog cache"""
+    if sender is Reservation and _batch_delete.get():
+        return
+    namespace = CATALOG_NAMESPACES[sender]
+    catalog_cache.bump(namespace)
+    # Again after commit, in case another worker re-cached the old rows
+    transaction.on_commit(lambda: catalog_cache.bump(namespace))
+
+
+def bulk_reservations_changed(reservations, rooms=()):
+    """
+    Do what the Reservation signals above would for rows written with
+    bulk_create or QuerySet.update, which send no signals, or deleted by
+    delete_reservations(). Runs after the commit; callers index attendees
+    and move the counters themselves, inside the transaction. ``rooms`` are
+    further rooms whose status today may have changed.
+    """
+    catalog_cache.bump(RESERVATIONS)
+    todays = [
+        reservation for reservation in reservations
+        if overlaps_today(reservation.starts_at, reservation.ends_at)
+    ]
+    for reservation in todays:
+        schedule_reservation(reservation)
+    for room_id in {reservation.room_id for reservation in todays} | set(rooms):
+        cache.delete(Room.status_cache_key(room_id))
+        invalidate_room_fragments(room_id)
+        broadcast_room_status(room_id)
+
+
+def delete_reservations(reservations):
+    """
+    Delete saved reservations and what cascades from them as one batch. The
+    per-row receivers stay quiet; counters move once for all rows and caches
+    are refreshed once after the commit. Returns the number deleted.
+    """
+    reservations = list(reservations)
+    if not reservations:
+        return 0
+    collector = Collector(using=router.db_for_write(Reservation))
+    collector.collect(reservations)
+    with transaction.atomic():
+        token = _batch_delete.set(True)
+        try:
+            _, deleted = collector.delete()
+        finally:
+            _batch_delete.reset(token)
+        count_changes(removed=[counted(reservation) for reservation in reservations])
+        transaction.on_commit(lambda: bulk_reservations_changed(reservations))
+    return deleted.get(Reservation._meta.label, 0)
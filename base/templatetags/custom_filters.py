@@ -1,4 +1,5 @@
 from django import template
+from django.utils import timezone
 
 register = template.Library()
 
@@ -10,4 +11,12 @@ def get_item(dictionary, key):
     """
     if dictionary is None:
         return None
-    return dictionary.get(key) 
\ No newline at end of file
+    return dictionary.get(key) 
+
+@register.filter
+def seconds_until(moment):
+    """
+    Returns the whole seconds from now until an aware datetime, at least 1.
+    Usage: {% cache room.current_status.expires|seconds_until room_card room.id %}
+    """
+    return max(1, int((moment - timezone.now()).total_seconds()))
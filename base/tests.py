@@ -3,20 +3,63 @@ from django.test import TestCase
 # Create your tests here.
 # this file check a some method and view 
 
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core import mail
+from django.core.cache import cache
 from datetime import date, time, datetime, timedelta
-from .models import Room, Reservation, ChatMessage
+from .models import Room, Reservation, ReservationSeries, Attendee, ChatMessage, StatCounter, TimeSlot, WaitlistEntry
 from .forms import ReservationForm, UserCreateForm
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
 from channels.testing import WebsocketCommunicator
 from channels.db import database_sync_to_async
-from .consumers import ChatConsumer
+from .consumers import ChatConsumer, DRAIN_GROUP, DRAIN_KEY, EphemeralBuffer, drain_state
+from .layers import HashRing
+from .scheduler import BoundaryScheduler
+from .routing import websocket_urlpatterns
+from .timeslots import invalidate_slot_catalog
+from .eventlog import ReservationEventLog
+from .caching import RESERVATIONS, TwoTierCache, catalog_cache, warm_up
+from .ical import fold, keyset, room_feed_token, user_feed_token
+from .importer import import_reservations
+from .freebusy import busy_intervals
+from .timeline import build_timeline
+from .attendees import attendee_conflicts
+from .recommend import free_runs, recommend_slots, room_bitmaps
+from .utils import aware, local_now
+from .waitlist import promote_waitlist
+from .pagination import keyset_page
+from .counters import TOTAL, TOTAL_KEYS, counter_values, day_key, rebuild_counters, room_key, total_key, user_key
+from .views import ADMIN_RESERVATION_ORDER, send_reservation_reminders
+from asgiref.sync import async_to_sync
+import re
+import unittest
+from django.utils import timezone
+from .recurrence import SeriesConflict, cancel_series, conflicting_dates, create_series, extend_series, update_series
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+import io
+import tempfile
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
+import asyncio
 import json
+from unittest import mock
+
+
+def skip_near_midnight(test):
+    """Skip a test that books now +/- 30 minutes when that would cross midnight"""
+    now = local_now()
+    if now.time() < time(0, 30) or now.time() > time(23, 29):
+        test.skipTest("too close to midnight")
+    return now
+
 
 class RoomModelTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username='testuser', password='testpass123')
         self.room = Room.objects.create(name="Test Room", capacity=10)
 
@@ -41,7 +84,7 @@ class RoomModelTests(TestCase):
 
     def test_get_current_status(self):
         """Test Room.get_current_status method"""
-        now = datetime.now()
+        now = skip_near_midnight(self)
         today = now.date()
         current_time = now.time()
 
@@ -104,7 +147,7 @@ class ReservationModelTests(TestCase):
 
     def test_is_active(self):
         """Test Reservation.is_active method"""
-        now = datetime.now()
+        now = skip_near_midnight(self)
         today = now.date()
         reservation = Reservation.objects.create(
             room=self.room,
@@ -203,6 +246,7 @@ class UserCreateFormTests(TestCase):
 
 class ViewTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(username='testuser', password='testpass123', email='test@example.com')
         self.room = Room.objects.create(name="Test Room", capacity=10)
@@ -301,4 +345,1772 @@ class ChatConsumerTests(TestCase):
         self.assertTrue(message_exists)
 
         await communicator.disconnect()
-              
\ No newline at end of file
+              
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class EphemeralStateTests(TransactionTestCase):
+    async def connect_user(self, user, reservation):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/chat/{reservation.id}/")
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await self.drain(communicator)
+        return communicator
+
+    async def drain(self, communicator):
+        # Drop the history frame and the join notifications
+        while not await communicator.receive_nothing(timeout=0.2):
+            await communicator.receive_json_from()
+
+    async def test_ephemeral_state_is_coalesced_and_not_persisted(self):
+        """Only the latest state per sender is broadcast and nothing is saved"""
+        host = await database_sync_to_async(User.objects.create_user)(username='host', password='testpass123')
+        guest = await database_sync_to_async(User.objects.create_user)(username='guest', password='testpass123')
+        room = await database_sync_to_async(Room.objects.create)(name="Test Room", capacity=10)
+        reservation = await database_sync_to_async(Reservation.objects.create)(
+            room=room, user=host, title="Standup", date=date(2025, 5, 24),
+            start_time=time(10, 0), end_time=time(11, 0), participant_count=2
+        )
+        host_socket = await self.connect_user(host, reservation)
+        guest_socket = await self.connect_user(guest, reservation)
+        await self.drain(host_socket)
+
+        for x in range(20):
+            await host_socket.send_json_to({'type': 'ephemeral', 'kind': 'cursor', 'data': {'x': x}})
+
+        response = await guest_socket.receive_json_from(timeout=1)
+        self.assertEqual(response['type'], 'ephemeral')
+        self.assertEqual(response['states'], [{
+            'sender_id': str(host.id), 'username': 'host', 'kind': 'cursor', 'data': {'x': 19},
+        }])
+        # The sender does not get its own state echoed back
+        self.assertTrue(await host_socket.receive_nothing(timeout=0.3))
+
+        count = await database_sync_to_async(ChatMessage.objects.count)()
+        self.assertEqual(count, 0)
+
+        await host_socket.send_json_to({'type': 'ephemeral', 'kind': 'shout', 'data': {}})
+        response = await host_socket.receive_json_from()
+        self.assertEqual(response['type'], 'error')
+
+        await host_socket.disconnect()
+        await guest_socket.disconnect()
+
+    async def test_cancelled_flusher_keeps_newer_state(self):
+        """A flusher cancelled by flush() leaves state pushed afterwards queued"""
+        sent = []
+
+        class Layer:
+            async def group_send(self, group, message):
+                sent.append([state['data'] for state in message['states']])
+
+        layer = Layer()
+        buffer = EphemeralBuffer(max_rate=50)
+        buffer.push(layer, 'meeting', '1', 'host', 'cursor', {'x': 1})
+        cancelled = buffer.flushers['meeting']
+        await asyncio.sleep(0)  # let the flusher start waiting
+        await buffer.flush(layer, 'meeting')
+        buffer.push(layer, 'meeting', '1', 'host', 'cursor', {'x': 2})
+        await asyncio.sleep(0)
+
+        self.assertTrue(cancelled.cancelled())
+        self.assertIsNot(buffer.flushers['meeting'], cancelled)
+        await buffer.flushers['meeting']
+        self.assertEqual(sent, [[{'x': 1}], [{'x': 2}]])
+        self.assertEqual(buffer.flushers, {})
+        self.assertEqual(buffer.pending, {})
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatResumeTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.host = User.objects.create_user(username='host', password='testpass123')
+        self.guest = User.objects.create_user(username='guest', password='testpass123')
+        room = Room.objects.create(name="Test Room", capacity=10)
+        self.reservation = Reservation.objects.create(
+            room=room, user=self.host, title="Standup", date=date(2025, 5, 24),
+            start_time=time(10, 0), end_time=time(11, 0), participant_count=2
+        )
+
+    async def connect_user(self, user, query=''):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/chat/{self.reservation.id}/{query}")
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive_all(self, communicator):
+        frames = []
+        while not await communicator.receive_nothing(timeout=0.2):
+            frames.append(await communicator.receive_json_from())
+        return frames
+
+    async def miss_two_messages(self):
+        """Connect the host, drop it and let the guest chat while it is away"""
+        host_socket = await self.connect_user(self.host)
+        frames = await self.receive_all(host_socket)
+        last_seq = max(frame['seq'] for frame in frames)
+        await host_socket.disconnect()
+
+        guest_socket = await self.connect_user(self.guest)
+        for text in ('first', 'second'):
+            await guest_socket.send_json_to({'type': 'chat_message', 'message': text})
+        await self.receive_all(guest_socket)
+        await guest_socket.disconnect()
+        return last_seq
+
+    async def test_reconnect_replays_only_the_gap(self):
+        """A client resuming from a sequence only receives what it missed"""
+        last_seq = await self.miss_two_messages()
+
+        host_socket = await self.connect_user(self.host, f'?last_seq={last_seq}')
+        frames = await self.receive_all(host_socket)
+        await host_socket.disconnect()
+
+        self.assertNotIn('fetch_messages', [frame['type'] for frame in frames])
+        self.assertEqual([frame['message'] for frame in frames if frame['type'] == 'chat_message'], ['first', 'second'])
+        # The replay is bracketed so the client can tell it from live events
+        types = [frame['type'] for frame in frames]
+        self.assertEqual(types[0], 'replay_start')
+        self.assertLess(types.index('chat_message'), types.index('replay_end'))
+        seqs = [frame['seq'] for frame in frames if 'seq' in frame]
+        self.assertEqual(seqs, sorted(seqs))
+        self.assertTrue(all(seq > last_seq for seq in seqs))
+
+    async def test_evicted_counter_never_reuses_a_sequence(self):
+        """Losing the cached counter restarts it above every number handed out"""
+        host_socket = await self.connect_user(self.host)
+        guest_socket = await self.connect_user(self.guest)
+        frames = await self.receive_all(host_socket)
+        seen = max(frame['seq'] for frame in frames)
+        # Only join events so far, nothing that is stored with the chat
+        self.assertFalse(await ChatMessage.objects.filter(reservation=self.reservation).aexists())
+
+        await cache.adelete(f'chat_seq:{self.reservation.id}')
+        await guest_socket.send_json_to({'type': 'chat_message', 'message': 'after'})
+        frames = await self.receive_all(host_socket)
+        await host_socket.disconnect()
+        await guest_socket.disconnect()
+
+        self.assertGreater(frames[0]['seq'], seen)
+
+    async def test_concurrent_events_are_sent_in_sequence_order(self):
+        """A slow sender holds back later events of the meeting until it has sent"""
+        host_socket = await self.connect_user(self.host)
+        guest_socket = await self.connect_user(self.guest)
+        await self.receive_all(host_socket)
+        await self.receive_all(guest_socket)
+
+        original = ReservationEventLog.store
+        release = asyncio.Event()
+
+        async def store(event_log, event):
+            if event.get('message') == 'slow':
+                await release.wait()
+            await original(event_log, event)
+
+        with mock.patch.object(ReservationEventLog, 'store', store):
+            await host_socket.send_json_to({'type': 'chat_message', 'message': 'slow'})
+            await guest_socket.send_json_to({'type': 'chat_message', 'message': 'fast'})
+            self.assertTrue(await host_socket.receive_nothing(timeout=0.3))
+            release.set()
+            frames = await self.receive_all(host_socket)
+        await host_socket.disconnect()
+        await guest_socket.disconnect()
+
+        self.assertEqual([frame['message'] for frame in frames], ['slow', 'fast'])
+        self.assertEqual(frames[1]['seq'], frames[0]['seq'] + 1)
+
+    async def test_reconnect_falls_back_to_database(self):
+        """When the gap is larger than the log the chat is replayed from the database"""
+        last_seq = await self.miss_two_messages()
+
+        with mock.patch('base.eventlog.LOG_SIZE', 1):
+            host_socket = await self.connect_user(self.host, f'?last_seq={last_seq}')
+            frames = await self.receive_all(host_socket)
+            await host_socket.disconnect()
+
+        self.assertEqual([frame['message'] for frame in frames if frame['type'] == 'chat_message'], ['first', 'second'])
+        self.assertNotIn('fetch_messages', [frame['type'] for frame in frames])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class DrainTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='host', password='testpass123')
+        room = Room.objects.create(name="Test Room", capacity=10)
+        self.reservation = Reservation.objects.create(
+            room=room, user=self.user, title="Standup", date=date(2025, 5, 24),
+            start_time=time(10, 0), end_time=time(11, 0), participant_count=2
+        )
+
+    def tearDown(self):
+        drain_state.draining = False
+        cache.delete(DRAIN_KEY)
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/chat/{self.reservation.id}/")
+        communicator.scope['user'] = self.user
+        connected, _ = await communicator.connect()
+        return connected, communicator
+
+    async def wait_for_close(self, communicator, started):
+        hinted = False
+        while True:
+            frame = await communicator.receive_output(timeout=2)
+            if frame['type'] == 'websocket.send':
+                hinted = hinted or json.loads(frame['text'])['type'] == 'reconnect'
+            elif frame['type'] == 'websocket.close':
+                self.assertTrue(hinted)
+                return frame, asyncio.get_running_loop().time() - started
+
+    async def test_drain_spreads_closes_over_window(self):
+        """Open sockets get a reconnect hint and are closed spread over the window"""
+        sockets = []
+        for _ in range(8):
+            connected, communicator = await self.connect()
+            self.assertTrue(connected)
+            sockets.append(communicator)
+
+        window = 0.8
+        delays = [window * i / 7 for i in range(8)]
+        started = asyncio.get_running_loop().time()
+        with mock.patch('base.consumers.random.uniform', side_effect=delays):
+            await get_channel_layer().group_send(DRAIN_GROUP, {'type': 'server_drain', 'window': window})
+            results = await asyncio.gather(*(self.wait_for_close(s, started) for s in sockets))
+
+        close_times = sorted(elapsed for frame, elapsed in results)
+        self.assertTrue(all(frame['code'] == 1012 for frame, elapsed in results))
+        self.assertLess(close_times[-1], window + 0.5)
+        self.assertGreater(close_times[-1] - close_times[0], window / 2)
+
+        # The worker now refuses new sockets
+        await self.assert_refused()
+
+    async def assert_refused(self):
+        """The socket is accepted and closed with the restart code, not rejected"""
+        connected, communicator = await self.connect()
+        self.assertTrue(connected)
+        frame = await communicator.receive_output(timeout=1)
+        self.assertEqual(frame, {'type': 'websocket.close', 'code': 1012})
+
+    async def test_drain_command_reaches_workers_without_sockets(self):
+        """An idle worker gets no broadcast but still refuses after the command"""
+        await database_sync_to_async(call_command)('drain_realtime', window=0, stdout=io.StringIO())
+        await self.assert_refused()
+
+        # A worker started after the drain takes sockets again
+        drain_state.draining = False
+        with mock.patch.object(drain_state, 'started', drain_state.started + 3600):
+            connected, communicator = await self.connect()
+            self.assertTrue(connected)
+            await communicator.disconnect()
+
+
+class BenchRealtimeTests(TransactionTestCase):
+    def test_bench_reports_latency_and_memory(self):
+        """A tiny run prints p50/p99 per kind of traffic and memory per connection"""
+        out = io.StringIO()
+        # The test database stands in for the throwaway one the command creates
+        with mock.patch.object(connection.creation, 'create_test_db'), \
+                mock.patch.object(connection.creation, 'destroy_test_db'):
+            call_command(
+                'bench_realtime', meetings=1, participants=2, duration=0.2,
+                chat_rate=10, whiteboard_rate=10, signal_rate=10, stdout=out,
+            )
+
+        report = out.getvalue()
+        self.assertIn("1 meetings x 2 participants, 4 sockets", report)
+        for kind in ('chat', 'whiteboard', 'signaling'):
+            self.assertRegex(report, rf"{kind} +sent +\d+, delivered +\d+, p50 [\d.]+ ms, p99 [\d.]+ ms")
+        self.assertRegex(report, r"Memory per connection: [\d.]+ KiB")
+
+
+SHARDED_MEMORY_LAYERS = {
+    'default': {
+        'BACKEND': 'base.layers.ShardedChannelLayer',
+        'CONFIG': {
+            'shards': [
+                {'NAME': f'memory-{index}', 'BACKEND': 'channels.layers.InMemoryChannelLayer'}
+                for index in range(4)
+            ],
+        },
+    },
+}
+
+
+class HashRingTests(TestCase):
+    def test_adding_a_shard_moves_a_fraction_of_groups(self):
+        """Growing from 3 to 4 shards only moves roughly a quarter of the keys"""
+        before = HashRing(['a', 'b', 'c'])
+        after = HashRing(['a', 'b', 'c', 'd'])
+        keys = [str(reservation_id) for reservation_id in range(2000)]
+        moved = [key for key in keys if before.get(key) != after.get(key)]
+        self.assertLess(len(moved) / len(keys), 0.35)
+        # Keys only ever move to the new shard
+        self.assertTrue(all(after.get(key) == 3 for key in moved))
+
+
+@override_settings(CHANNEL_LAYERS=SHARDED_MEMORY_LAYERS)
+class ShardedChannelLayerTests(TransactionTestCase):
+    async def test_groups_of_a_meeting_share_a_shard(self):
+        layer = get_channel_layer()
+        self.assertEqual(layer.shard_for_group('chat_42'), layer.shard_for_group('webrtc_42'))
+        self.assertEqual(len({layer.shard_for_group(f'chat_{i}') for i in range(100)}), 4)
+
+    async def test_channel_receives_from_groups_on_every_shard(self):
+        """A channel joined to groups on different shards gets messages from all of them"""
+        layer = get_channel_layer()
+        groups = {}
+        for reservation_id in range(100):
+            groups.setdefault(layer.shard_for_group(f'chat_{reservation_id}'), f'chat_{reservation_id}')
+        channel = await layer.new_channel()
+        for group in groups.values():
+            await layer.group_add(group, channel)
+
+        for group in groups.values():
+            await layer.group_send(group, {'type': 'chat_message', 'group': group})
+        await layer.send(channel, {'type': 'direct'})
+
+        received = [await asyncio.wait_for(layer.receive(channel), 1) for _ in range(len(groups) + 1)]
+        self.assertEqual(sorted(message.get('group', '') for message in received), sorted(['', *groups.values()]))
+
+        await layer.group_discard(groups[0], channel)
+        await layer.group_send(groups[0], {'type': 'chat_message'})
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(layer.receive(channel), 0.2)
+
+    async def test_closed_status_streams_leave_nothing_behind(self):
+        """A client dropping the SSE stream releases its listeners, aliases and memberships"""
+        layer = get_channel_layer()
+        def state():
+            return [set(table) for table in (layer.listeners, layer.memberships, layer.aliases, layer.rebind)]
+        before = state()
+        for _ in range(5):
+            response = await self.async_client.get(reverse('room-status-stream'))
+            stream = aiter(response.streaming_content)
+            await anext(stream)
+            waiting = asyncio.ensure_future(anext(stream))
+            await asyncio.sleep(0.05)
+            waiting.cancel()  # what the server does when the client goes away
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            await stream.aclose()
+        self.assertEqual(state(), before)
+        self.assertFalse(any(shard.groups.get('room_status') for shard in layer.shards))
+
+    async def test_chat_over_sharded_layer(self):
+        user = await database_sync_to_async(User.objects.create_user)(username='host', password='testpass123')
+        room = await database_sync_to_async(Room.objects.create)(name="Test Room", capacity=10)
+        reservation = await database_sync_to_async(Reservation.objects.create)(
+            room=room, user=user, title="Standup", date=date(2025, 5, 24),
+            start_time=time(10, 0), end_time=time(11, 0), participant_count=2
+        )
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/chat/{reservation.id}/")
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.send_json_to({'type': 'chat_message', 'message': 'Hello'})
+        frames = []
+        while not await communicator.receive_nothing(timeout=0.2):
+            frames.append(await communicator.receive_json_from())
+        self.assertIn('Hello', [frame.get('message') for frame in frames])
+        await communicator.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class RoomStatusPushTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='host', password='testpass123')
+        self.room = Room.objects.create(name="Test Room", capacity=10)
+
+    def book_now(self, now):
+        return Reservation.objects.create(
+            room=self.room, user=self.user, title="Standup", date=now.date(),
+            start_time=(now - timedelta(minutes=30)).time(), end_time=(now + timedelta(minutes=30)).time(),
+            participant_count=2
+        )
+
+    async def test_status_pushed_on_create_and_cancel(self):
+        """Status subscribers get one event per change instead of polling"""
+        now = skip_near_midnight(self)
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/rooms/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        reservation = await database_sync_to_async(self.book_now)(now)
+        event = await communicator.receive_json_from()
+        self.assertEqual(event['room_id'], self.room.id)
+        self.assertEqual(event['status'], 'occupied')
+        self.assertEqual(event['reservation']['title'], 'Standup')
+
+        await database_sync_to_async(reservation.delete)()
+        event = await communicator.receive_json_from()
+        self.assertEqual(event['status'], 'free')
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.disconnect()
+
+    async def test_status_stream_fallback(self):
+        """The SSE stream carries the same events"""
+        now = skip_near_midnight(self)
+        response = await self.async_client.get(reverse('room-status-stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.1)
+        await database_sync_to_async(self.book_now)(now)
+        chunk = (await asyncio.wait_for(pending, 2)).decode()
+        self.assertTrue(chunk.startswith('event: room_status\n'))
+        self.assertEqual(json.loads(chunk.split('data: ', 1)[1])['status'], 'occupied')
+        await stream.aclose()
+
+
+class StatusSchedulerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='host', password='testpass123')
+        self.room = Room.objects.create(name="Test Room", capacity=10)
+
+    def test_status_read_is_cached_until_changed(self):
+        """Repeated status reads do not touch the database"""
+        now = skip_near_midnight(self)
+        self.assertEqual(self.room.get_current_status()['status'], 'free')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.room.get_current_status()['status'], 'free')
+
+        Reservation.objects.create(
+            room=self.room, user=self.user, title="Standup", date=now.date(),
+            start_time=(now - timedelta(minutes=30)).time(), end_time=(now + timedelta(minutes=30)).time(),
+            participant_count=2
+        )
+        self.assertEqual(self.room.get_current_status()['status'], 'occupied')
+
+    def test_moving_a_booking_refreshes_the_room_it_left(self):
+        """Status is refreshed for the old room and day of an edited booking, not just the new ones"""
+        other_room = Room.objects.create(name="Other Room", capacity=10)
+        today = timezone.localdate()
+        reservation = Reservation.objects.create(
+            room=self.room, user=self.user, title="Standup", date=today,
+            start_time=time(10, 0), end_time=time(11, 0), participant_count=2
+        )
+        reservation = Reservation.objects.get(pk=reservation.pk)
+        room_key, other_key = Room.status_cache_key(self.room.id), Room.status_cache_key(other_room.id)
+
+        cache.set_many({room_key: 'stale', other_key: 'stale'})
+        reservation.room = other_room
+        reservation.save()
+        self.assertIsNone(cache.get(room_key))
+        self.assertIsNone(cache.get(other_key))
+
+        cache.set_many({room_key: 'stale', other_key: 'stale'})
+        reservation.date = today + timedelta(days=1)
+        reservation.save(update_fields=['date'])
+        self.assertEqual(cache.get(room_key), 'stale')
+        self.assertIsNone(cache.get(other_key))
+
+        # Now stored for tomorrow, so further edits leave today's statuses alone
+        cache.set(other_key, 'stale')
+        reservation.title = "Planning"
+        reservation.save()
+        self.assertEqual(cache.get(other_key), 'stale')
+
+    def test_heap_orders_boundaries(self):
+        """Boundaries come out of the heap in time order and past ones are skipped"""
+        other_room = Room.objects.create(name="Other Room", capacity=10)
+        tomorrow = date.today() + timedelta(days=1)
+        for room, start, end in ((self.room, 10, 11), (other_room, 9, 10), (self.room, 14, 15)):
+            Reservation.objects.create(
+                room=room, user=self.user, title="Meeting", date=tomorrow,
+                start_time=time(start, 0), end_time=time(end, 0), participant_count=2
+            )
+
+        scheduler = BoundaryScheduler()
+        scheduler.load(tomorrow)
+        self.assertEqual(len(scheduler.heap), 6)
+        self.assertEqual(scheduler.next_wakeup(aware(tomorrow, time(8, 0))), aware(tomorrow, time(9, 0)))
+        self.assertEqual(scheduler.pop_due(aware(tomorrow, time(9, 30))), {other_room.id})
+        self.assertEqual(scheduler.pop_due(aware(tomorrow, time(11, 0))), {self.room.id, other_room.id})
+        self.assertEqual(len(scheduler.heap), 2)
+
+        # Boundaries already in the past are never scheduled
+        yesterday = date.today() - timedelta(days=1)
+        scheduler.load(yesterday)
+        scheduler.add(self.room.id, aware(yesterday, time(9, 0)), aware(yesterday, time(10, 0)))
+        self.assertEqual(scheduler.heap, [])
+
+    def test_overnight_booking_ends_on_the_next_day(self):
+        """A meeting past midnight is scheduled on both days it touches"""
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        Reservation.objects.create(
+            room=self.room, user=self.user, title="Launch", date=tomorrow,
+            start_time=time(23, 0), end_time=time(1, 0), participant_count=2
+        )
+        ends = aware(tomorrow + timedelta(days=1), time(1, 0))
+        scheduler = BoundaryScheduler()
+        scheduler.load(tomorrow)
+        self.assertEqual(sorted(scheduler.heap), [(aware(tomorrow, time(23, 0)), self.room.id), (ends, self.room.id)])
+        # The next day's load still has the end
+        scheduler.load(tomorrow + timedelta(days=1))
+        self.assertIn((ends, self.room.id), scheduler.heap)
+
+
+class KioskTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='host', password='testpass123')
+        self.room = Room.objects.create(name="Test Room", capacity=10)
+        self.url = reverse('room-kiosk', args=[self.room.id])
+
+    def test_kiosk_cached_until_next_boundary(self):
+        """The kiosk feed is fresh until midnight for a room with no bookings left"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'free')
+        self.assertIsNone(response.json()['next'])
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('Expires', response)
+        self.assertNotIn('Set-Cookie', response)
+
+        midnight = datetime.combine(date.today() + timedelta(days=1), time.min)
+        self.assertEqual(response.json()['until'], midnight.strftime('%Y-%m-%dT%H:%M'))
+
+        # Repeat polls come from the status cache and revalidate with a 304
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+    def test_kiosk_shows_now_and_next(self):
+        """A new booking changes the payload and its ETag"""
+        now = skip_near_midnight(self)
+        first = self.client.get(self.url)
+        Reservation.objects.create(
+            room=self.room, user=self.user, title="Standup", date=now.date(),
+            start_time=(now - timedelta(minutes=30)).time(), end_time=(now + timedelta(minutes=30)).time(),
+            participant_count=2
+        )
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.json()['status'], 'occupied')
+        self.assertEqual(response.json()['now']['title'], "Standup")
+
+    def test_kiosk_unknown_room(self):
+        self.assertEqual(self.client.get(reverse('room-kiosk', args=[9999])).status_code, 404)
+
+
+class RoomCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='host', password='testpass123')
+        self.room = Room.objects.create(name="Test Room", capacity=10)
+
+    def test_room_card_cached_until_invalidated(self):
+        """Room cards are served from the cache until the room or its bookings change"""
+        now = skip_near_midnight(self)
+        self.assertContains(self.client.get(reverse('home')), "Test Room")
+
+        # Bypasses signals, so the cached card is still shown
+        Room.objects.filter(id=self.room.id).update(name="Renamed Room")
+        self.assertContains(self.client.get(reverse('home')), "Test Room")
+
+        self.room.name = "Renamed Room"
+        self.room.save()
+        self.assertContains(self.client.get(reverse('home')), "Renamed Room")
+
+        Reservation.objects.create(
+            room=self.room, user=self.user, title="Standup", date=now.date(),
+            start_time=(now - timedelta(minutes=30)).time(), end_time=(now + timedelta(minutes=30)).time(),
+            participant_count=2
+        )
+        self.assertContains(self.client.get(reverse('home')), "Occupied")
+
+    def test_warm_home_page_skips_status_queries(self):
+        """With warm caches the home page makes no queries"""
+        self.client.get(reverse('home'))
+        Room.objects.create(name="Other Room", capacity=4)
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('home'))
+
+
+class TimeSlotCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.room = Room.objects.create(name="Test Room", capacity=10)
+        self.slot = TimeSlot.objects.create(start_time=time(10, 0), end_time=time(11, 0))
+        TimeSlot.objects.create(start_time=time(11, 0), end_time=time(12, 0))
+        self.client.login(username='testuser', password='testpass123')
+
+    def tearDown(self):
+        # The rolled back slots must not outlive the test in this process
+        invalidate_slot_catalog()
+
+    def test_reservation_page_skips_time_slot_queries(self):
+        """A warm catalog serves the form and room pages without TimeSlot queries"""
+        self.client.get(reverse('create-reservation', args=[self.room.id]))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('create-reservation', args=[self.room.id]))
+            self.client.get(reverse('room-detail', args=[self.room.id]))
+        self.assertContains(response, '10:00 - 11:00')
+        self.assertFalse([query for query in queries if 'base_timeslot' in query['sql']])
+
+    def test_catalog_follows_time_slot_changes(self):
+        """Saving a TimeSlot rebuilds the catalog"""
+        form = ReservationForm()
+        self.assertEqual(form.fields['time_slot'].choices, [('10:00-11:00', '10:00 - 11:00'), ('11:00-12:00', '11:00 - 12:00')])
+
+        self.slot.is_active = False
+        self.slot.save()
+        self.assertEqual(ReservationForm().fields['time_slot'].choices, [('11:00-12:00', '11:00 - 12:00')])
+        self.assertEqual(self.room.get_available_time_slots(date(2025, 5, 24)), [(time(11, 0), time(12, 0))])
+
+
+class TwoTierCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalog_cache.clear()
+
+    def test_tiers_and_lru_eviction(self):
+        """Values come from L1, then L2 for another process, and old entries are evicted"""
+        loads = []
+        def load(value):
+            loads.append(value)
+            return value
+
+        worker = TwoTierCache(max_entries=2, l1_ttl=60)
+        self.assertEqual(worker.get_or_set('test', 'a', lambda: load(1)), 1)
+        self.assertEqual(worker.get_or_set('test', 'a', lambda: load(2)), 1)
+        self.assertEqual(TwoTierCache().get_or_set('test', 'a', lambda: load(3)), 1)
+        self.assertEqual(loads, [1])
+
+        worker.get_or_set('test', 'b', lambda: 'b')
+        worker.get_or_set('test', 'c', lambda: 'c')
+        stats = worker.stats()
+        self.assertEqual((stats['l1_hits'], stats['misses'], stats['evictions'], stats['entries']), (1, 3, 1, 2))
+
+    def test_bump_invalidates_namespace(self):
+        """A bump reaches other processes once their version check expires"""
+        worker = TwoTierCache(l1_ttl=60)
+        other = TwoTierCache(l1_ttl=0)
+        worker.get_or_set('test', 'a', lambda: 'old')
+        other.get_or_set('test', 'a', lambda: 'old')
+
+        worker.bump('test')
+        self.assertEqual(worker.get_or_set('test', 'a', lambda: 'new'), 'new')
+        self.assertEqual(other.get_or_set('test', 'a', lambda: 'newer'), 'new')
+
+    def test_room_changes_bump_rooms_namespace(self):
+        """Room signals refresh the cached room list, warm-up fills it"""
+        Room.objects.create(name="Test Room", capacity=10)
+        warm_up()
+        with self.assertNumQueries(0):
+            self.assertEqual([room.name for room in Room.cached_list()], ["Test Room"])
+
+        Room.objects.create(name="Other Room", capacity=4)
+        self.assertEqual([room.name for room in Room.cached_list()], ["Other Room", "Test Room"])
+
+    def test_cached_rooms_are_not_shared_between_callers(self):
+        """Status attached for one request never shows up on another request's rooms"""
+        Room.objects.create(name="Test Room", capacity=10)
+        worker = TwoTierCache(l1_ttl=60)
+        with mock.patch('base.models.catalog_cache', worker):
+            first = Room.cached_list()
+            Room.attach_current_status(first)
+            second = Room.cached_list()
+        self.assertEqual(first[0].current_status['status'], 'free')
+        self.assertFalse(hasattr(second[0], 'current_status'))
+        self.assertEqual(second[0], first[0])
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+        self.room = Room.objects.create(name="A Room", capacity=10)
+        self.other_room = Room.objects.create(name="B Room", capacity=10)
+        self.day = date(2025, 5, 24)
+        for room, day, start, end in (
+            (self.other_room, self.day, time(9, 0), time(10, 0)),
+            (self.room, self.day, time(10, 30), time(11, 0)),
+            (self.room, self.day + timedelta(days=1), time(8, 0), time(9, 15)),
+        ):
+            Reservation.objects.create(
+                room=room, user=self.staff, title="Meeting", date=day,
+                start_time=start, end_time=end, participant_count=2
+            )
+        self.client.login(username='admin', password='testpass123')
+        self.url = reverse('room-timeline')
+
+    def test_timeline_columns(self):
+        """Every room's reservations come back as parallel arrays"""
+        data = self.client.get(self.url, {'date': '2025-05-24', 'days': 2}).json()
+        self.assertEqual(data['rooms'], {'id': [self.room.id, self.other_room.id], 'name': ["A Room", "B Room"]})
+        reservations = data['reservations']
+        self.assertEqual(reservations['room'], [0, 1, 0])
+        self.assertEqual(reservations['day'], [0, 0, 1])
+        self.assertEqual(reservations['start'], [630, 540, 480])
+        self.assertEqual(reservations['end'], [660, 600, 555])
+        self.assertEqual(len(reservations['id']), 3)
+
+        self.assertEqual(self.client.get(self.url, {'date': 'tomorrow'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'days': 90}).status_code, 400)
+
+    def test_timeline_etag(self):
+        """An unchanged timeline is revalidated without querying reservations"""
+        response = self.client.get(self.url, {'date': '2025-05-24'})
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(self.url, {'date': '2025-05-24'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertFalse([query for query in queries if 'base_reservation' in query['sql']])
+
+        Reservation.objects.create(
+            room=self.room, user=self.staff, title="Late", date=self.day,
+            start_time=time(17, 0), end_time=time(18, 0), participant_count=2
+        )
+        changed = self.client.get(self.url, {'date': '2025-05-24'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(len(changed.json()['reservations']['id']), 3)
+
+    def test_timeline_requires_staff(self):
+        User.objects.create_user(username='member', password='testpass123')
+        self.client.login(username='member', password='testpass123')
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+
+class FreeBusyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.room = Room.objects.create(name="Test Room", capacity=10)
+        self.other_room = Room.objects.create(name="Other Room", capacity=10)
+        for room, start, end in (
+            (self.room, time(9, 0), time(10, 0)),
+            (self.room, time(10, 0), time(11, 0)),  # adjacent
+            (self.room, time(10, 30), time(12, 0)),  # overlapping
+            (self.room, time(14, 0), time(15, 0)),
+            (self.other_room, time(7, 0), time(9, 30)),
+        ):
+            Reservation.objects.create(
+                room=room, user=self.user, title="Meeting", date=date(2025, 5, 24),
+                start_time=start, end_time=end, participant_count=2
+            )
+        self.url = reverse('room-freebusy')
+
+    def test_busy_intervals_are_merged_and_clipped(self):
+        """Touching and overlapping bookings become one interval, clipped to the window"""
+        response = self.client.get(self.url, {
+            'rooms': f'{self.room.id},{self.other_room.id},9999',
+            'start': '2025-05-24T08:00', 'end': '2025-05-24T14:30',
+        })
+        self.assertEqual(response.json()['busy'], {
+            str(self.room.id): [['2025-05-24T09:00', '2025-05-24T12:00'], ['2025-05-24T14:00', '2025-05-24T14:30']],
+            str(self.other_room.id): [['2025-05-24T08:00', '2025-05-24T09:30']],
+            '9999': [],
+        })
+
+    def test_freebusy_cached_per_room_set_and_window(self):
+        """Repeat polls are served from the cache until a reservation changes"""
+        params = {'rooms': f'{self.other_room.id},{self.room.id}', 'start': '2025-05-24'}
+        first = self.client.get(self.url, params)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url, params).content, first.content)
+            self.assertEqual(self.client.get(self.url, params, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        Reservation.objects.filter(room=self.other_room).delete()
+        self.assertEqual(self.client.get(self.url, params).json()['busy'][str(self.other_room.id)], [])
+
+    def test_freebusy_rejects_bad_requests(self):
+        self.assertEqual(self.client.get(self.url, {'rooms': 'a', 'start': '2025-05-24'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'rooms': '1'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'rooms': '1', 'start': '2025-05-24', 'end': '2025-12-24'}).status_code, 400)
+
+
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='host', email='host@example.com', password='testpass123')
+        self.guest = User.objects.create_user(username='guest', email='guest@example.com', password='testpass123')
+        self.room = Room.objects.create(name="Test Room", capacity=10)
+        self.planning = Reservation.objects.create(
+            room=self.room, user=self.user, title="Planning; Q3, budget", date=date(2025, 5, 24),
+            start_time=time(9, 0), end_time=time(10, 0), participant_count=2,
+            participants_emails='guest@example.com'
+        )
+        Reservation.objects.create(
+            room=self.room, user=self.user, title="Other guests", date=date(2025, 5, 25),
+            start_time=time(9, 0), end_time=time(10, 0), participant_count=2,
+            participants_emails='firstguest@example.com'
+        )
+
+    def feed(self, url, **headers):
+        response = self.client.get(url, **headers)
+        return response, b''.join(response.streaming_content).decode() if response.streaming else ''
+
+    def test_room_feed(self):
+        """The room feed streams every reservation as an escaped VEVENT"""
+        response, body = self.feed(reverse('room-calendar-feed', args=[room_feed_token(self.room)]))
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+        self.assertIn('SUMMARY:Planning\\; Q3\\, budget\r\n', body)
+        self.assertIn('DTSTART:20250524T090000Z\r\n', body)
+
+    @override_settings(TIME_ZONE='Asia/Tehran')
+    def test_event_times_are_utc_and_overnight_ends_next_day(self):
+        """DTSTART/DTEND come from the aware span, written in UTC"""
+        Reservation.objects.create(
+            room=self.room, user=self.user, title="Launch", date=date(2025, 5, 26),
+            start_time=time(23, 0), end_time=time(1, 0), participant_count=2
+        )
+        _, body = self.feed(reverse('room-calendar-feed', args=[room_feed_token(self.room)]))
+        self.assertIn('DTSTART:20250526T193000Z\r\nDTEND:20250526T213000Z\r\n', body)
+
+    def test_room_feed_needs_its_token(self):
+        """Without the signed token nobody can read a room's meetings"""
+        self.assertEqual(self.client.get(f'/room/{self.room.id}/calendar.ics').status_code, 404)
+        self.assertEqual(self.client.get(reverse('room-calendar-feed', args=['forged'])).status_code, 404)
+        other_salt = reverse('room-calendar-feed', args=[user_feed_token(self.user)])
+        self.assertEqual(self.client.get(other_salt).status_code, 404)
+
+        self.client.login(username='host', password='testpass123')
+        response = self.client.get(reverse('room-calendar', args=[self.room.id]))
+        # Tokens carry a timestamp, so follow the one the page hands out
+        feed_url = response.context['calendar_feed_url']
+        self.assertContains(response, feed_url)
+        self.assertEqual(self.feed(feed_url)[0].status_code, 200)
+
+    def test_unchanged_feed_is_not_modified(self):
+        """ETag and Last-Modified revalidate until a reservation changes or goes away"""
+        url = reverse('room-calendar-feed', args=[room_feed_token(self.room)])
+        response, _ = self.feed(url)
+        self.assertEqual(self.feed(url, HTTP_IF_NONE_MATCH=response['ETag'])[0].status_code, 304)
+        self.assertEqual(self.feed(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])[0].status_code, 304)
+
+        self.planning.delete()
+        changed, body = self.feed(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+
+    def test_user_feed(self):
+        """A user's feed holds their own and invited meetings, behind a signed token"""
+        _, body = self.feed(reverse('user-calendar-feed', args=[user_feed_token(self.guest)]))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        self.assertIn('Planning', body)
+
+        _, body = self.feed(reverse('user-calendar-feed', args=[user_feed_token(self.user)]))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+
+        self.assertEqual(self.client.get(reverse('user-calendar-feed', args=['forged'])).status_code, 404)
+
+    def test_keyset_and_folding(self):
+        """Feeds read bounded chunks and keep content lines within 75 octets"""
+        with self.assertNumQueries(2):
+            self.assertEqual(len(list(keyset(Reservation.objects.all(), chunk_size=2))), 2)
+        folded = fold('DESCRIPTION:' + 'é' * 80)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in folded.split('\r\n')))
+        self.assertEqual(folded.replace('\r\n ', ''), 'DESCRIPTION:' + 'é' * 80 + '\r\n')
+
+
+class ReservationImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+        self.member = User.objects.create_user(username='member', password='testpass123')
+        self.room = Room.objects.create(name="Test Room", capacity=10)
+        self.other_room = Room.objects.create(name="Other Room", capacity=4)
+        Reservation.objects.create(
+            room=self.room, user=self.member, title="Existing", date=date(2025, 9, 1),
+            start_time=time(9, 0), end_time=time(10, 0), participant_count=2
+        )
+
+    def test_csv_import_with_conflicts(self):
+        """Rows overlapping existing bookings or earlier rows are reported, the rest inserted"""
+        schedule = io.StringIO(
+            "room,date,start,end,title,user,participant_count\n"
+            f"{self.room.id},2025-09-01,09:30,10:30,Clashes with existing,,\n"
+            "Test Room,2025-09-01,10:00,11:00,Lecture,member,5\n"
+            "test room,2025-09-01,10:30,11:30,Clashes with lecture,,\n"
+            "Other Room,2025-09-01,10:30,11:30,Seminar,,3\n"
+            "Other Room,2025-09-02,10:00,11:00,Too big,,9\n"
+            "Nowhere,2025-09-02,10:00,11:00,Lost,,\n"
+            "Test Room,2025-09-02,11:00,10:00,Backwards,,\n"
+        )
+        with CaptureQueriesContext(connection) as queries:
+            result = import_reservations(schedule, self.staff)
+        # One conflict query and one insert, however many rows
+        reservation_queries = [query['sql'].split()[0] for query in queries if 'base_reservation' in query['sql']]
+        self.assertEqual(reservation_queries, ['SELECT', 'INSERT'])
+
+        self.assertEqual([line for line, message in result.errors], [2, 4, 6, 7, 8])
+        self.assertIn("already booked on 2025-09-01 09:00-10:00", result.errors[0][1])
+        self.assertEqual(result.errors[1][1], "Overlaps row 3 in the same file")
+        self.assertEqual(
+            sorted(Reservation.objects.filter(date=date(2025, 9, 1)).values_list('title', 'user__username')),
+            [('Existing', 'member'), ('Lecture', 'member'), ('Seminar', 'admin')],
+        )
+
+    def test_large_file_is_read_in_batches(self):
+        """Each batch costs one conflict query and an insert of what it adds, and is checked against the earlier ones"""
+        schedule = io.StringIO(
+            "room,date,start,end,title,user\n"
+            "Test Room,2025-09-02,10:00,11:00,First,member\n"
+            "Other Room,2025-09-02,10:00,11:00,Second,\n"
+            "Test Room,2025-09-02,10:30,11:30,Clashes with first,\n"
+            "Test Room,2025-09-01,09:30,10:30,Clashes with existing,member\n"
+            "Test Room,2025-09-02,11:00,12:00,Third,\n"
+        )
+        with mock.patch('base.importer.BATCH_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            result = import_reservations(schedule, self.staff)
+        reservation_queries = [query['sql'].split()[0] for query in queries if 'base_reservation' in query['sql']]
+        # The second batch holds only clashes
+        self.assertEqual(reservation_queries, ['SELECT', 'INSERT', 'SELECT', 'SELECT', 'INSERT'])
+        self.assertEqual(result.errors[0], (4, "Overlaps row 2 in the same file"))
+        self.assertIn("already booked", result.errors[1][1])
+        self.assertEqual([reservation.title for reservation in result.created], ["First", "Second", "Third"])
+
+    def test_endpoint_reports_a_concurrent_booking(self):
+        """A slot taken while importing rolls the file back with a message instead of an error page"""
+        self.client.login(username='admin', password='testpass123')
+        upload = SimpleUploadedFile('term.csv', b"room,date,start,end,title\nTest Room,2025-09-03,09:00,10:00,Uploaded\n")
+        with mock.patch('base.views.import_schedule', side_effect=IntegrityError):
+            response = self.client.post(reverse('import-reservations'), {'schedule': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("nothing was imported", [str(message) for message in response.context['messages']][0])
+
+    def test_ical_import(self):
+        """VEVENTs are imported with LOCATION as the room and attendees as participants"""
+        schedule = io.StringIO(
+            "BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nSUMMARY:Design review\\, part 1\r\n"
+            "LOCATION:Other Room\r\nDTSTART:20250902T130000\r\nDTEND:20250902T140000\r\n"
+            "ATTENDEE;CN=Guest:mailto:guest@example.com\r\nDESCRIPTION:Long desc\r\n ription\r\n"
+            "END:VEVENT\r\nBEGIN:VEVENT\r\nSUMMARY:No room\r\nDTSTART:20250902T130000\r\n"
+            "DTEND:20250902T140000\r\nEND:VEVENT\r\nEND:VCALENDAR\r\n"
+        )
+        result = import_reservations(schedule, self.staff, 'ics')
+        self.assertEqual(result.errors, [(11, "Unknown room ''")])
+        reservation = Reservation.objects.get(title="Design review, part 1")
+        self.assertEqual((reservation.room, reservation.start_time), (self.other_room, time(13, 0)))
+        self.assertEqual((reservation.participants_emails, reservation.description), ('guest@example.com', 'Long description'))
+
+    def test_command_and_staff_endpoint(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as schedule:
+            schedule.write("room,date,start,end,title\nTest Room,2025-09-03,09:00,10:00,From command\n")
+        out = io.StringIO()
+        call_command('import_reservations', schedule.name, user='admin', dry_run=True, stdout=out)
+        self.assertIn("Dry run: 1 reservations imported", out.getvalue())
+        self.assertFalse(Reservation.objects.filter(title="From command").exists())
+
+        self.client.login(username='admin', password='testpass123')
+        upload = SimpleUploadedFile('term.csv', b"room,date,start,end,title\nTest Room,2025-09-03,09:00,10:00,Uploaded\n")
+        response = self.client.post(reverse('import-reservations'), {'schedule': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Reservation.objects.filter(title="Uploaded", user=self.staff).exists())
+
+
+class RecurringReservationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.room = Room.objects.create(name="Test Room", capacity=10)
+        # A Monday well ahead so that every occurrence is upcoming
+        self.start = date.today() + timedelta(days=7 - date.today().weekday() + 7)
+
+    def reservation(self, day=None, start_time=time(9, 0), end_time=time(10, 0)):
+        return Reservation(
+            room=self.room, user=self.user, title="Standup", date=day or self.start,
+            start_time=start_time, end_time=end_time, participant_count=3
+        )
+
+    def test_weekly_series_with_count(self):
+        """All occurrences are checked with one query and stored with one insert"""
+        with CaptureQueriesContext(connection) as queries:
+            series, occurrences = create_series(self.reservation(), 'weekly', count=4)
+        reservation_queries = [query['sql'].split()[0] for query in queries if '"base_reservation"' in query['sql']]
+        self.assertEqual(reservation_queries, ['SELECT', 'INSERT'])
+        self.assertEqual(
+            list(series.occurrences.order_by('date').values_list('date', flat=True)),
+            [self.start + timedelta(weeks=week) for week in range(4)],
+        )
+        self.assertTrue(series.is_finished())
+
+    def test_conflict_books_nothing(self):
+        Reservation.objects.create(
+            room=self.room, user=self.user, title="Taken", date=self.start + timedelta(days=2),
+            start_time=time(9, 30), end_time=time(10, 30), participant_count=2
+        )
+        with self.assertRaises(SeriesConflict) as raised:
+            create_series(self.reservation(), 'daily', until=self.start + timedelta(days=4))
+        self.assertEqual(raised.exception.dates, [self.start + timedelta(days=2)])
+        self.assertFalse(ReservationSeries.objects.exists())
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_open_series_is_expanded_to_the_horizon(self):
+        series, occurrences = create_series(self.reservation(), 'monthly')
+        self.assertEqual(series.materialized_until, date.today() + timedelta(days=180))
+        Reservation.objects.create(
+            room=self.room, user=self.user, title="Taken", date=self.start + timedelta(weeks=1),
+            start_time=time(9, 0), end_time=time(10, 0), participant_count=2
+        )
+        series.frequency = 'weekly'
+        series.materialized_until = self.start
+        added, skipped = extend_series(series, self.start + timedelta(weeks=3))
+        self.assertEqual(skipped, [self.start + timedelta(weeks=1)])
+        self.assertEqual([occurrence.date for occurrence in added], [self.start + timedelta(weeks=2), self.start + timedelta(weeks=3)])
+
+    def test_update_and_cancel_touch_upcoming_occurrences_at_once(self):
+        series, occurrences = create_series(self.reservation(), 'weekly', count=5)
+        with CaptureQueriesContext(connection) as queries:
+            update_series(series, title="Planning", start_time=time(14, 0), end_time=time(15, 0))
+        writes = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "base_reservation"')]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(set(series.occurrences.values_list('title', 'start_time')), {("Planning", time(14, 0))})
+
+        Reservation.objects.create(
+            room=self.room, user=self.user, title="Taken", date=self.start,
+            start_time=time(16, 0), end_time=time(17, 0), participant_count=2
+        )
+        with self.assertRaises(SeriesConflict):
+            update_series(series, start_time=time(16, 0), end_time=time(17, 0))
+
+        self.assertEqual(cancel_series(series), 5)
+        self.assertFalse(ReservationSeries.objects.filter(id=series.id).exists())
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_cancel_series_is_one_batch(self):
+        """Cancelling costs the same queries for 3 or 30 occurrences"""
+        costs = []
+        for count in (3, 30):
+            series, _ = create_series(self.reservation(self.start + timedelta(days=count)), 'daily', count=count)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(cancel_series(series), count)
+            costs.append(len(queries))
+        self.assertEqual(costs[0], costs[1])
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_create_series_view(self):
+        TimeSlot.objects.create(start_time=time(9, 0), end_time=time(10, 0))
+        invalidate_slot_catalog()
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.post(reverse('create-reservation', args=[self.room.id]), {
+            'title': "Standup", 'date': self.start.isoformat(), 'time_slot': '09:00-10:00',
+            'participant_count': 3, 'participants_emails': '', 'description': '',
+            'repeat': 'weekly', 'repeat_count': 3,
+        })
+        self.assertEqual(response.status_code, 302)
+        series = ReservationSeries.objects.get()
+        self.assertEqual(series.occurrences.count(), 3)
+
+        User.objects.create_user(username='other', password='testpass123')
+        self.client.login(username='other', password='testpass123')
+        self.client.post(reverse('cancel-series', args=[series.id]))
+        self.assertEqual(series.occurrences.count(), 3)
+
+class BatchReservationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='planner', password='testpass123')
+        self.rooms = [Room.objects.create(name=f"Room {number}", capacity=10) for number in range(3)]
+        self.day = date.today() + timedelta(days=7)
+        self.client.login(username='planner', password='testpass123')
+
+    def items(self):
+        return [
+            {'room': room.id, 'date': (self.day + timedelta(days=offset)).isoformat(),
+             'start': '09:00', 'end': '12:00', 'title': "Offsite", 'participant_count': 5}
+            for room in self.rooms for offset in range(3)
+        ]
+
+    def post(self, items, key=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(
+            reverse('batch-reservations'), json.dumps({'reservations': items}),
+            content_type='application/json', **headers
+        )
+
+    def test_batch_is_booked_with_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(self.items())
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['reservations']), 9)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "base_reservation"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Reservation.objects.filter(user=self.user).count(), 9)
+
+    def test_any_conflict_books_nothing(self):
+        Reservation.objects.create(
+            room=self.rooms[2], user=self.user, title="Taken", date=self.day + timedelta(days=1),
+            start_time=time(11, 0), end_time=time(13, 0), participant_count=2
+        )
+        items = self.items() + [{'room': self.rooms[0].id, 'date': self.day.isoformat(),
+                                 'start': '10:00', 'end': '11:00', 'title': "Double"}]
+        response = self.post(items)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [7, 9])
+        self.assertEqual(response.json()['errors'][1]['error'], "Overlaps item 0 of the same batch")
+        self.assertEqual(Reservation.objects.count(), 1)
+
+        response = self.post([{'room': 'Nowhere', 'date': self.day.isoformat(), 'start': '09:00', 'end': '10:00', 'title': 'x'}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_retry_with_idempotency_key_replays_the_result(self):
+        first = self.post(self.items(), key='offsite-2025')
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.post(self.items(), key='offsite-2025')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertFalse([query for query in queries if 'base_reservation' in query['sql']])
+        self.assertEqual(Reservation.objects.count(), 9)
+
+        self.assertEqual(self.post(self.items()[:1], key='offsite-2025').status_code, 422)
+
+class AttendeeConflictTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='organizer', email='Boss@Example.com', password='testpass123')
+        self.room = Room.objects.create(name="Test Room", capacity=10)
+        self.other_room = Room.objects.create(name="Other Room", capacity=10)
+        self.day = date.today() + timedelta(days=3)
+        self.meeting = Reservation.objects.create(
+            room=self.other_room, user=self.user, title="Existing", date=self.day,
+            start_time=time(10, 0), end_time=time(11, 0), participant_count=3,
+            participants_emails="ann@example.com, Bob@example.com"
+        )
+
+    def test_index_follows_participants(self):
+        self.assertEqual(
+            sorted(self.meeting.attendees.values_list('email', flat=True)),
+            ['ann@example.com', 'bob@example.com', 'boss@example.com'],
+        )
+        self.meeting.participants_emails = "carol@example.com"
+        self.meeting.save()
+        self.assertEqual(
+            sorted(self.meeting.attendees.values_list('email', flat=True)),
+            ['boss@example.com', 'carol@example.com'],
+        )
+
+    def test_index_left_alone_when_attendees_unchanged(self):
+        """Edits that cannot change the attendees write no attendee rows"""
+        meeting = Reservation.objects.get(pk=self.meeting.pk)
+        for save in (
+            lambda: meeting.save(update_fields=['reminder_sent']),
+            lambda: meeting.save(),
+        ):
+            meeting.title = "Renamed"
+            with CaptureQueriesContext(connection) as queries:
+                save()
+            self.assertFalse([query for query in queries if '"base_attendee"' in query['sql']])
+
+        meeting.participants_emails = "ann@example.com"
+        meeting.save()
+        self.assertEqual(
+            sorted(meeting.attendees.values_list('email', flat=True)),
+            ['ann@example.com', 'boss@example.com'],
+        )
+
+    def test_whole_invite_list_in_one_query(self):
+        invitees = [f"person{number}@example.com" for number in range(400)] + ["BOB@example.com"]
+        with self.assertNumQueries(1):
+            conflicts = attendee_conflicts(invitees, [self.day], time(10, 30), time(11, 30))
+        self.assertEqual(conflicts, {'bob@example.com': [(self.day, time(10, 0), time(11, 0), "Other Room")]})
+        self.assertEqual(attendee_conflicts(invitees, [self.day], time(11, 0), time(12, 0)), {})
+
+    def test_booking_flow_and_api_report_conflicts(self):
+        self.client.login(username='organizer', password='testpass123')
+        response = self.client.get(reverse('attendee-conflicts'), {
+            'emails': 'ann@example.com,dave@example.com', 'date': self.day.isoformat(), 'start': '09:30', 'end': '10:30',
+        })
+        self.assertEqual(list(response.json()['conflicts']), ['ann@example.com'])
+
+        TimeSlot.objects.create(start_time=time(10, 0), end_time=time(11, 0))
+        invalidate_slot_catalog()
+        response = self.client.post(reverse('create-reservation', args=[self.room.id]), {
+            'title': "Clash", 'date': self.day.isoformat(), 'time_slot': '10:00-11:00',
+            'participant_count': 2, 'participants_emails': 'ann@example.com', 'description': '',
+        }, follow=True)
+        warnings = [str(message) for message in response.context['messages'] if message.level_tag == 'warning']
+        self.assertEqual(len(warnings), 1)
+        self.assertIn("ann@example.com (Other Room", warnings[0])
+        self.assertEqual(Attendee.objects.filter(email='ann@example.com').count(), 2)
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='organizer', password='testpass123')
+        self.small = Room.objects.create(name="Small", capacity=4, has_projector=True)
+        self.large = Room.objects.create(name="Large", capacity=20, has_projector=True)
+        self.plain = Room.objects.create(name="Plain", capacity=20)
+        for hour in range(9, 17):
+            TimeSlot.objects.create(start_time=time(hour, 0), end_time=time(hour + 1, 0))
+        invalidate_slot_catalog()
+        self.day = date.today() + timedelta(days=2)
+        self.morning = datetime.combine(date.today(), time(0, 0))
+
+    def book(self, room, start_time, end_time, emails='', day=None):
+        return Reservation.objects.create(
+            room=room, user=self.user, title="Busy", date=day or self.day,
+            start_time=start_time, end_time=end_time, participant_count=1, participants_emails=emails
+        )
+
+    def test_free_runs(self):
+        self.assertEqual(free_runs(0b0111101, 3), 0b0001100)
+        self.assertEqual(free_runs(0b1111, 1), 0b1111)
+
+    def test_earliest_time_suits_room_and_invitees(self):
+        self.book(self.small, time(9, 0), time(10, 0))
+        self.book(self.plain, time(9, 0), time(10, 30), emails='ann@example.com')
+        recommendations = recommend_slots(
+            self.day, self.day, 90, ['ann@example.com'], min_capacity=3, equipment=['projector'], limit=3, now=self.morning,
+        )
+        # Ann is busy until 10:30, the slots start on the hour; Small fits best at 11:00
+        self.assertEqual(
+            [(item['name'], item['start'], item['end']) for item in recommendations],
+            [("Small", '11:00', '12:30'), ("Large", '11:00', '12:30'), ("Small", '12:00', '13:30')],
+        )
+
+    def test_no_time_in_the_window(self):
+        self.book(self.large, time(0, 0), time(23, 59), emails='bob@example.com')
+        self.assertEqual(recommend_slots(self.day, self.day, 30, ['bob@example.com'], now=self.morning), [])
+        self.assertEqual(recommend_slots(self.day, self.day, 30, min_capacity=50, now=self.morning), [])
+
+    def test_bitmaps_are_cached_per_day_outside_l1(self):
+        self.book(self.small, time(9, 0), time(10, 0))
+        recommend_slots(self.day, self.day + timedelta(days=2), 60, now=self.morning)
+        misses = catalog_cache.stats()['misses']
+        # An overlapping window loads only its one new day
+        with self.assertNumQueries(1):
+            recommend_slots(self.day + timedelta(days=1), self.day + timedelta(days=3), 60, now=self.morning)
+        self.assertEqual(catalog_cache.stats()['misses'], misses + 1)
+        self.assertFalse([key for key in catalog_cache.local if key[0] == RESERVATIONS])
+
+        self.book(self.small, time(11, 0), time(12, 0))
+        recommendations = recommend_slots(self.day, self.day, 60, min_capacity=3, equipment=['projector'],
+                                          limit=2, now=self.morning)
+        self.assertEqual([(item['name'], item['start']) for item in recommendations],
+                         [("Large", '09:00'), ("Small", '10:00')])
+
+    def test_api(self):
+        self.client.login(username='organizer', password='testpass123')
+        response = self.client.get(reverse('recommend-times'), {
+            'start': self.day.isoformat(), 'duration': 60, 'equipment': 'projector', 'capacity': 10, 'limit': 1,
+        })
+        self.assertEqual(response.json()['recommendations'][0]['name'], "Large")
+        response = self.client.get(reverse('recommend-times'), {'start': self.day.isoformat(), 'equipment': 'piano'})
+        self.assertEqual(response.status_code, 400)
+
+class WaitlistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='testpass123')
+        self.first = User.objects.create_user(username='first', email='first@example.com', password='testpass123')
+        self.second = User.objects.create_user(username='second', password='testpass123')
+        self.room = Room.objects.create(name="Popular Room", capacity=10)
+        self.day = date.today() + timedelta(days=1)
+        self.reservation = Reservation.objects.create(
+            room=self.room, user=self.owner, title="Booked", date=self.day,
+            start_time=time(10, 0), end_time=time(11, 0), participant_count=2
+        )
+
+    def join(self, user):
+        self.client.login(username=user.username, password='testpass123')
+        return self.client.post(reverse('join-waitlist', args=[self.room.id]), {
+            'date': self.day.isoformat(), 'start': '10:00', 'end': '11:00',
+        }, follow=True)
+
+    def test_queue_positions(self):
+        self.join(self.first)
+        response = self.join(self.second)
+        self.assertIn("number 2 on the waitlist", str(list(response.context['messages'])[0]))
+        response = self.join(self.second)
+        self.assertIn("already on the waitlist", str(list(response.context['messages'])[0]))
+        self.assertEqual(WaitlistEntry.objects.count(), 2)
+
+    def test_cancellation_promotes_first_in_line(self):
+        self.join(self.first)
+        self.join(self.second)
+        self.client.login(username='owner', password='testpass123')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('cancel-reservation', args=[self.reservation.id]))
+
+        promoted = Reservation.objects.get(room=self.room, date=self.day)
+        self.assertEqual((promoted.user, promoted.start_time), (self.first, time(10, 0)))
+        first_entry = WaitlistEntry.objects.get(user=self.first)
+        self.assertEqual((first_entry.status, first_entry.reservation), (WaitlistEntry.PROMOTED, promoted))
+        self.assertEqual(WaitlistEntry.objects.get(user=self.second).status, WaitlistEntry.WAITING)
+
+    def test_free_time_needs_no_waitlist(self):
+        self.reservation.delete()
+        self.client.login(username='first', password='testpass123')
+        response = self.client.post(reverse('join-waitlist', args=[self.room.id]), {
+            'date': self.day.isoformat(), 'start': '10:00', 'end': '11:00',
+        })
+        self.assertTrue(response['Location'].startswith(reverse('create-reservation', args=[self.room.id])))
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+class ReservationSpanTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='host', password='testpass123')
+        self.room = Room.objects.create(name="Test Room", capacity=10)
+
+    def book(self, day, start_time, end_time):
+        return Reservation.objects.create(
+            room=self.room, user=self.user, title="Meeting", date=day,
+            start_time=start_time, end_time=end_time, participant_count=2
+        )
+
+    @override_settings(TIME_ZONE='Asia/Tehran')
+    def test_span_is_aware_in_the_configured_zone(self):
+        reservation = self.book(date(2025, 6, 1), time(9, 0), time(10, 30))
+        self.assertEqual(reservation.starts_at, timezone.make_aware(datetime(2025, 6, 1, 5, 30), timezone.get_fixed_timezone(0)))
+        self.assertEqual(reservation.ends_at - reservation.starts_at, timedelta(minutes=90))
+
+        late = self.book(date(2025, 6, 1), time(23, 0), time(1, 0))
+        self.assertEqual(late.ends_at - late.starts_at, timedelta(hours=2))
+        self.assertFalse(self.room.is_available(date(2025, 6, 2), time(0, 0), time(0, 30)))
+        self.assertNotIn((time(0, 0), time(1, 0)), self.room.get_available_time_slots(date(2025, 6, 2)))
+
+        # UTC times of imported events become local wall-clock times
+        import_reservations(io.StringIO(
+            "BEGIN:VEVENT\r\nSUMMARY:Imported\r\nLOCATION:Test Room\r\n"
+            "DTSTART:20250603T053000Z\r\nDTEND:20250603T063000Z\r\nEND:VEVENT\r\n"
+        ), self.user, 'ics')
+        imported = Reservation.objects.get(title="Imported")
+        self.assertEqual((imported.start_time, imported.starts_at), (time(9, 0), timezone.make_aware(datetime(2025, 6, 3, 5, 30), timezone.get_fixed_timezone(0))))
+
+    def test_overnight_meeting_blocks_the_next_morning(self):
+        """Every conflict check sees a meeting that runs past midnight"""
+        self.book(date(2025, 6, 1), time(23, 0), time(1, 0))
+        morning = (time(0, 0), time(0, 30))
+        self.assertEqual(conflicting_dates(self.room, [date(2025, 6, 2), date(2025, 6, 3)], *morning), {date(2025, 6, 2)})
+
+        result = import_reservations(io.StringIO(
+            "room,date,start,end,title\n"
+            "Test Room,2025-06-02,00:00,00:30,Too early\n"
+        ), self.user, dry_run=True)
+        self.assertIn("already booked on 2025-06-01 23:00-01:00", result.errors[0][1])
+
+        busy = busy_intervals([self.room.id], datetime(2025, 6, 2), datetime(2025, 6, 3))
+        self.assertEqual(busy[self.room.id], [['2025-06-02T00:00', '2025-06-02T01:00']])
+
+        columns = build_timeline(date(2025, 6, 2), 1)['reservations']
+        self.assertEqual((columns['day'], columns['start'], columns['end']), ([-1], [1380], [60]))
+
+    def test_overnight_meeting_holds_invitees_rooms_and_waitlist(self):
+        """Invitee checks, recommendation bitmaps and waitlist promotion see a meeting past midnight"""
+        day = timezone.localdate() + timedelta(days=3)
+        next_day = day + timedelta(days=1)
+        Reservation.objects.create(
+            room=self.room, user=self.user, title="Launch", date=day, start_time=time(23, 0), end_time=time(1, 0),
+            participant_count=2, participants_emails='ann@example.com'
+        )
+        self.assertEqual(
+            attendee_conflicts(['ann@example.com'], [next_day], time(0, 30), time(1, 30)),
+            {'ann@example.com': [(day, time(23, 0), time(1, 0), "Test Room")]},
+        )
+        self.assertEqual(room_bitmaps(next_day, next_day)[self.room.id], (1 << 60) - 1)
+
+        later = self.book(next_day, time(1, 0), time(2, 0))
+        guest = User.objects.create_user(username='guest', password='testpass123')
+        for start_time in (time(0, 30), time(1, 0)):
+            WaitlistEntry.objects.create(room=self.room, user=guest, date=next_day, title="Waiting",
+                                         start_time=start_time, end_time=time(2, 0))
+        later.delete()
+        promoted = promote_waitlist(self.room, next_day, time(1, 0), time(2, 0))
+        # The 00:30 entry would overlap the launch, the 01:00 one fits
+        self.assertEqual([reservation.start_time for reservation in promoted], [time(1, 0)])
+
+    @override_settings(TIME_ZONE='Pacific/Kiritimati')
+    def test_status_follows_the_configured_zone(self):
+        """The status is right even when the server clock runs in another zone"""
+        now = local_now()
+        if now.time() < time(0, 30) or now.time() > time(23, 29):
+            self.skipTest("too close to midnight")
+        self.book(now.date(), (now - timedelta(minutes=30)).time(), (now + timedelta(minutes=30)).time())
+        status = self.room.refresh_current_status()
+        self.assertEqual(status['status'], 'occupied')
+        self.assertEqual(status['expires'], status['reservation'].ends_at)
+
+    def test_calendar_is_one_range_query(self):
+        monday = timezone.localdate() + timedelta(days=7)
+        for offset in range(7):
+            self.book(monday + timedelta(days=offset), time(9, 0), time(10, 0))
+        self.book(monday + timedelta(days=7), time(9, 0), time(10, 0))
+        self.client.login(username='host', password='testpass123')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('room-calendar', args=[self.room.id]), {'start_date': monday.isoformat()})
+        self.assertEqual(sum(len(day) for day in response.context['reservations_by_date'].values()), 7)
+        reservation_queries = [query['sql'] for query in queries if 'FROM "base_reservation"' in query['sql']]
+        self.assertEqual(len(reservation_queries), 1)
+        self.assertIn('"starts_at" >=', reservation_queries[0])
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite syntax")
+class QueryPlanTests(TestCase):
+    """
+    Runs the hot paths of views.py, models.py and consumers.py and fails if
+    any filtered query on a large table would scan the whole table.
+    """
+    HOT_TABLES = ('base_reservation', 'base_chatmessage')
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='staff', email='staff@example.com', password='testpass123', is_staff=True)
+        self.room = Room.objects.create(name="Test Room", capacity=10)
+        today = timezone.localdate()
+        for offset in range(-2, 3):
+            self.reservation = Reservation.objects.create(
+                room=self.room, user=self.user, title="Meeting", date=today + timedelta(days=offset),
+                start_time=time(9, 0), end_time=time(10, 0), participant_count=2
+            )
+        ChatMessage.objects.create(reservation=self.reservation, user=self.user, message="hi", sequence=1)
+        self.client.login(username='staff', password='testpass123')
+
+    def full_scans(self, queries):
+        scan = re.compile(r'SCAN (TABLE )?"?(%s)"?( |$)' % '|'.join(self.HOT_TABLES))
+        found = []
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or ' WHERE ' not in sql:
+                continue  # listing or counting everything scans by definition
+            if not any(f'"{table}"' in sql for table in self.HOT_TABLES):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+            if any(scan.match(step) for step in plan):
+                found.append(f"{sql}\n    {plan}")
+        return found
+
+    def assertIndexed(self, run):
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        self.assertFalse(self.full_scans(queries), "\n".join(self.full_scans(queries)))
+
+    def test_view_queries(self):
+        today = timezone.localdate().isoformat()
+        second_page = keyset_page(Reservation.objects.all(), ADMIN_RESERVATION_ORDER, per_page=2).next_cursor
+        for url in (
+            reverse('home'),
+            reverse('room-detail', args=[self.room.id]),
+            reverse('room-calendar', args=[self.room.id]),
+            reverse('room-kiosk', args=[self.room.id]),
+            reverse('user-reservations'),
+            reverse('user-reservations') + '?status=past',
+            reverse('profile'),
+            reverse('admin-dashboard'),
+            reverse('admin-reservations') + f'?room={self.room.id}&user=staff&date_from=2020-01-01',
+            reverse('admin-reservations') + f'?after={second_page}',
+            reverse('admin-reservations') + f'?room={self.room.id}&after={second_page}',
+            reverse('room-timeline') + f'?date={today}&days=7',
+            reverse('room-freebusy') + f'?rooms={self.room.id}&start={today}',
+            reverse('room-calendar-feed', args=[room_feed_token(self.room)]),
+            reverse('user-calendar-feed', args=[user_feed_token(self.user)]),
+            reverse('recommend-times') + f'?start={today}&duration=60&capacity=2',
+        ):
+            with self.subTest(url=url):
+                cache.clear()
+                responses = []
+                self.assertIndexed(lambda: responses.append(self.client.get(url)))
+                self.assertEqual(responses[0].status_code, 200)
+        self.assertIndexed(send_reservation_reminders)
+
+    def test_model_queries(self):
+        day = timezone.localdate() + timedelta(days=1)
+        self.assertIndexed(lambda: self.room.is_available(day, time(9, 0), time(10, 0)))
+        self.assertIndexed(self.room.refresh_current_status)
+        self.assertIndexed(lambda: self.room.get_available_time_slots(day))
+
+    def test_consumer_queries(self):
+        consumer = ChatConsumer()
+        consumer.reservation_id = self.reservation.id
+        self.assertIndexed(lambda: async_to_sync(consumer.get_messages)(self.reservation))
+        self.assertIndexed(lambda: async_to_sync(consumer.get_messages_since)(0, 1))
+
+    def test_detects_a_scan(self):
+        """The check itself notices a query no index can serve"""
+        with CaptureQueriesContext(connection) as queries:
+            list(Reservation.objects.filter(title="Meeting"))
+        self.assertEqual(len(self.full_scans(queries)), 1)
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.room = Room.objects.create(name="Test Room", capacity=10)
+        self.annex = Room.objects.create(name="Annex", capacity=10)
+        today = timezone.localdate()
+        for offset in range(12):
+            for hour in (9, 11):
+                Reservation.objects.create(
+                    room=self.room if hour == 9 else self.annex, user=self.staff if offset % 2 else self.other,
+                    title="Meeting", date=today + timedelta(days=offset),
+                    start_time=time(hour, 0), end_time=time(hour + 1, 0), participant_count=2
+                )
+        self.client.login(username='staff', password='testpass123')
+
+    def walk(self, url, params=None):
+        """Follow Next links from the first page; returns every page's ids"""
+        pages = []
+        params = dict(params or {})
+        while True:
+            page = self.client.get(url, params).context['reservations']
+            pages.append([reservation.id for reservation in page])
+            if not page.has_next():
+                return pages
+            params['after'] = page.next_cursor
+
+    def test_pages_cover_the_ordering(self):
+        expected = list(Reservation.objects.order_by('-date', 'start_time', 'id').values_list('id', flat=True))
+        pages = self.walk(reverse('admin-reservations'))
+        self.assertEqual([len(page) for page in pages], [10, 10, 4])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_previous_returns_the_same_page(self):
+        first = self.client.get(reverse('admin-reservations')).context['reservations']
+        second = self.client.get(reverse('admin-reservations'), {'after': first.next_cursor}).context['reservations']
+        self.assertTrue(second.has_previous())
+        back = self.client.get(reverse('admin-reservations'), {'before': second.previous_cursor}).context['reservations']
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_deep_page_is_one_limit_query(self):
+        first = self.client.get(reverse('user-reservations')).context['reservations']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('user-reservations'), {'after': first.next_cursor})
+        self.assertEqual(len(response.context['reservations']), 2)
+        reservation_queries = [query['sql'] for query in queries if 'FROM "base_reservation"' in query['sql']]
+        self.assertEqual(len(reservation_queries), 1)
+        self.assertIn('LIMIT 11', reservation_queries[0])
+        self.assertNotIn('OFFSET', reservation_queries[0])
+        self.assertNotIn('COUNT(', reservation_queries[0])
+        self.assertIn('"base_room"', reservation_queries[0])  # select_related
+
+    def test_filters(self):
+        today = timezone.localdate()
+        response = self.client.get(reverse('admin-reservations'), {
+            'room': self.annex.id, 'user': 'staff',
+            'date_from': (today + timedelta(days=2)).isoformat(), 'date_to': (today + timedelta(days=7)).isoformat(),
+        })
+        page = response.context['reservations']
+        self.assertEqual([(r.room, r.user, r.date) for r in page], [
+            (self.annex, self.staff, today + timedelta(days=offset)) for offset in (7, 5, 3)
+        ])
+        self.assertEqual(page.total, 3)
+        self.assertIn('user=staff', response.context['query'])
+
+    def test_invalid_input_falls_back(self):
+        response = self.client.get(reverse('admin-reservations'), {'after': 'not-a-cursor', 'date_from': 'soon'})
+        self.assertEqual(len(response.context['reservations']), 10)
+        self.assertEqual(response.context['reservations'].total, 24)
+
+    def test_total_is_capped(self):
+        page = keyset_page(Reservation.objects.all(), ('date', 'start_time', 'id'), count_limit=5)
+        self.assertEqual((page.total, page.total_capped), (5, True))
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username='root', password='testpass123', email='root@example.com')
+        self.room = Room.objects.create(name="Test Room", capacity=10)
+        self.client.login(username='root', password='testpass123')
+
+    def book(self, count):
+        """``count`` more reservations, each by a new user with a message and a waitlist entry"""
+        today = timezone.localdate()
+        for _ in range(count):
+            n = Reservation.objects.count()
+            user = User.objects.create_user(username=f'user{n}')
+            reservation = Reservation.objects.create(
+                room=self.room, user=user, title="Meeting", date=today + timedelta(days=n),
+                start_time=time(9, 0), end_time=time(10, 0), participant_count=2
+            )
+            ChatMessage.objects.create(reservation=reservation, user=user, message="hello")
+            WaitlistEntry.objects.create(room=self.room, user=user, date=reservation.date,
+                                         start_time=time(9, 0), end_time=time(10, 0), title="Waiting")
+
+    def changelist_queries(self, model, params=None):
+        url = reverse(f'admin:base_{model._meta.model_name}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries]
+
+    def test_no_per_row_queries(self):
+        for model in (Reservation, ChatMessage, WaitlistEntry):
+            with self.subTest(model=model.__name__):
+                self.book(2)
+                few = len(self.changelist_queries(model))
+                self.book(5)
+                self.assertEqual(len(self.changelist_queries(model)), few)
+
+    def test_counts_are_capped(self):
+        self.book(3)
+        for model in (Reservation, ChatMessage):
+            with self.subTest(model=model.__name__):
+                counts = [sql for sql in self.changelist_queries(model) if 'COUNT(' in sql]
+                self.assertEqual(len(counts), 1)
+                self.assertIn('LIMIT', counts[0])
+
+    def test_short_search_is_ignored(self):
+        self.book(3)
+        response = self.client.get(reverse('admin:base_reservation_changelist'), {'q': 'Me'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.client.get(reverse('admin:base_reservation_changelist'), {'q': 'Meet'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.client.get(reverse('admin:base_reservation_changelist'), {'q': 'Standup'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+    def test_change_form_does_not_list_users(self):
+        self.book(3)
+        reservation = Reservation.objects.first()
+        response = self.client.get(reverse('admin:base_reservation_change', args=[reservation.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, f'<option value="{reservation.user_id}"')
+        self.assertContains(response, 'vForeignKeyRawIdAdminField')
+
+class StatCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.member = User.objects.create_user(username='member', password='testpass123')
+        self.room = Room.objects.create(name="Test Room", capacity=10)
+        self.other_room = Room.objects.create(name="Other Room", capacity=10)
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def book(self, user, day, hour=9, room=None):
+        return Reservation.objects.create(
+            room=room or self.room, user=user, title="Meeting", date=day,
+            start_time=time(hour, 0), end_time=time(hour + 1, 0), participant_count=2
+        )
+
+    def assertCounted(self):
+        self.assertEqual(rebuild_counters(), {})
+
+    def test_save_edit_and_delete(self):
+        first = self.book(self.member, self.day)
+        self.book(self.staff, self.day, hour=11)
+        self.assertEqual(counter_values(TOTAL, day_key(self.day), user_key(self.member.id)), [2, 2, 1])
+        first.date = self.day + timedelta(days=1)
+        first.room = self.other_room
+        with CaptureQueriesContext(connection) as queries:
+            first.save()
+        # The old values come from the instance, not from another query
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT') and '"base_reservation"' in query['sql']])
+        self.assertEqual(counter_values(day_key(self.day), room_key(self.other_room.id)), [1, 1])
+        first.reminder_sent = True
+        with CaptureQueriesContext(connection) as queries:
+            first.save(update_fields=['reminder_sent'])
+        self.assertFalse([query for query in queries if 'base_statcounter' in query['sql']])
+        first.delete()
+        self.assertEqual(counter_values(TOTAL, room_key(self.other_room.id)), [1, 0])
+        self.assertCounted()
+
+    def test_total_is_summed_over_shards(self):
+        """Bookings move one random shard of the total; a shard may go negative"""
+        with mock.patch('base.counters.random.choice', return_value=total_key(3)):
+            first = self.book(self.member, self.day)
+            self.book(self.staff, self.day, hour=11)
+        with mock.patch('base.counters.random.choice', return_value=total_key(7)):
+            Reservation.objects.get(pk=first.pk).delete()
+        self.assertEqual(counter_values(total_key(3), total_key(7), TOTAL), [2, -1, 1])
+        self.assertCounted()
+        self.assertEqual(counter_values(total_key(0), total_key(3), TOTAL), [1, 0, 1])
+
+    def test_bulk_paths(self):
+        import_reservations(io.StringIO(
+            "room,date,start,end,title,user\n"
+            f"Test Room,{self.day},13:00,14:00,Lecture,member\n"
+            f"Other Room,{self.day},13:00,14:00,Seminar,member\n"
+        ), self.staff)
+        self.client.login(username='member', password='testpass123')
+        self.client.post(reverse('batch-reservations'), json.dumps({'reservations': [
+            {'room': self.other_room.id, 'date': self.day.isoformat(), 'start': '15:00', 'end': '16:00', 'title': "Batch"},
+        ]}), content_type='application/json')
+        series, occurrences = create_series(
+            Reservation(room=self.room, user=self.member, title="Weekly", date=self.day,
+                        start_time=time(9, 0), end_time=time(10, 0), participant_count=2),
+            'weekly', count=4,
+        )
+        self.assertEqual(counter_values(TOTAL, user_key(self.member.id)), [7, 7])
+        self.assertCounted()
+        update_series(series, room=self.other_room)
+        self.assertEqual(counter_values(room_key(self.other_room.id)), [6])
+        cancel_series(series)
+        self.assertEqual(counter_values(TOTAL), [3])
+        self.assertCounted()
+
+    def test_promotion_moves_the_booking_to_the_next_user(self):
+        reservation = self.book(self.staff, self.day)
+        WaitlistEntry.objects.create(room=self.room, user=self.member, date=self.day,
+                                     start_time=time(9, 0), end_time=time(10, 0), title="Waiting")
+        self.client.login(username='staff', password='testpass123')
+        self.client.post(reverse('cancel-reservation', args=[reservation.id]))
+        self.assertEqual(counter_values(TOTAL, user_key(self.staff.id), user_key(self.member.id)), [1, 0, 1])
+        self.assertCounted()
+
+    def test_dashboards_read_counters(self):
+        self.book(self.member, timezone.localdate())
+        self.book(self.member, self.day)
+        self.client.login(username='staff', password='testpass123')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin-dashboard'))
+        self.assertEqual((response.context['total_reservations'], response.context['today_reservations']), (2, 1))
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+        self.client.login(username='member', password='testpass123')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('profile'))
+        self.assertEqual(response.context['total_reservations'], 2)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+
+    def test_rebuild_command_repairs_drift(self):
+        self.book(self.member, self.day)
+        StatCounter.objects.filter(key__in=TOTAL_KEYS).update(value=0)
+        StatCounter.objects.update_or_create(key=total_key(5), defaults={'value': 42})
+        StatCounter.objects.filter(key=user_key(self.member.id)).delete()
+        out = io.StringIO()
+        call_command('rebuild_counters', stdout=out)
+        self.assertIn(f"{TOTAL}: 42 -> 1", out.getvalue())
+        self.assertIn("2 corrected", out.getvalue())
+        self.assertEqual(counter_values(TOTAL, user_key(self.member.id)), [1, 1])
+        self.assertCounted()
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class StatusSchedulerRunTests(TransactionTestCase):
+    async def test_boundary_pushes_status(self):
+        """A reservation starting soon flips the room to occupied on time"""
+        now = skip_near_midnight(self)
+        cache.clear()
+        user = await database_sync_to_async(User.objects.create_user)(username='host', password='testpass123')
+        room = await database_sync_to_async(Room.objects.create)(name="Test Room", capacity=10)
+        subscriber = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/rooms/")
+        await subscriber.connect()
+
+        scheduler = BoundaryScheduler()
+        task = asyncio.ensure_future(scheduler.run())
+        await asyncio.sleep(0.2)
+
+        await database_sync_to_async(Reservation.objects.create)(
+            room=room, user=user, title="Standup", date=now.date(),
+            start_time=(now + timedelta(seconds=1)).time(), end_time=(now + timedelta(minutes=30)).time(),
+            participant_count=2
+        )
+        created = await subscriber.receive_json_from()
+        self.assertEqual(created['status'], 'free')
+        self.assertEqual(created['next_reservation']['title'], 'Standup')
+
+        started = await subscriber.receive_json_from(timeout=3)
+        self.assertEqual(started['status'], 'occupied')
+        self.assertEqual((await database_sync_to_async(room.get_current_status)())['status'], 'occupied')
+
+        task.cancel()
+        await subscriber.disconnect()
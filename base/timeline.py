@@ -0,0 +1,56 @@
+# base/timeline.py
+from datetime import timedelta
+
+from .models import Reservation, Room
+from .utils import day_bounds
+
+# Longest range one timeline request may cover
+MAX_TIMELINE_DAYS = 31
+
+
+def minute_of_day(value):
+    return value.hour * 60 + value.minute
+
+
+def build_timeline(start, days):
+    """
+    All rooms' reservations from ``start`` for ``days`` days, one query.
+
+    Reservations are encoded as parallel arrays instead of one object per
+    booking: entry i is reservation ``id[i]`` in room ``rooms.id[room[i]]``
+    on day ``start + day[i]`` from minute ``start[i]`` to ``end[i]``. An end
+    before the start continues into the next day, so a meeting that began
+    the evening before the range shows up with day -1.
+    """
+    window_start, _ = day_bounds(start)
+    _, window_end = day_bounds(start + timedelta(days=days - 1))
+    rows = list(Reservation.objects.filter(starts_at__lt=window_end, ends_at__gt=window_start).order_by(
+    ).values_list('room_id', 'date', 'start_time', 'end_time', 'id'))
+    # Sorted here: an ORDER BY date would lead SQLite to walk a date index
+    # end to end instead of seeking the (starts_at, ends_at) range
+    rows.sort(key=lambda row: (row[1], row[0], row[2]))
+
+    rooms = Room.cached_list()
+    room_index = {room.id: index for index, room in enumerate(rooms)}
+    if any(row[0] not in room_index for row in rows):
+        # Room added in another worker that this one has not noticed yet
+        rooms = list(Room.objects.all())
+        room_index = {room.id: index for index, room in enumerate(rooms)}
+
+    columns = {'room': [], 'day': [], 'start': [], 'end': [], 'id': []}
+    for room_id, day, start_time, end_time, reservation_id in rows:
+        columns['room'].append(room_index[room_id])
+        columns['day'].append((day - start).days)
+        columns['start'].append(minute_of_day(start_time))
+        columns['end'].append(minute_of_day(end_time))
+        columns['id'].append(reservation_id)
+
+    return {
+        'start': start.isoformat(),
+        'days': days,
+        'rooms': {
+            'id': [room.id for room in rooms],
+            'name': [room.name for room in rooms],
+        },
+        'reservations': columns,
+    }
@@ -0,0 +1,52 @@
+# base/timeslots.py
+from collections import namedtuple
+from types import MappingProxyType
+
+from .caching import TIMESLOTS, catalog_cache, warmup
+from .models import TimeSlot
+
+# value is the "HH:MM-HH:MM" form choice, label the text shown for it and the
+# minute offsets count from midnight for cheap overlap checks.
+Slot = namedtuple('Slot', ['start', 'end', 'value', 'label', 'start_minute', 'end_minute'])
+
+
+class SlotCatalog:
+    """Immutable, pre-parsed list of the active time slots"""
+
+    def __init__(self, slots):
+        self.slots = tuple(slots)
+        self.by_value = MappingProxyType({slot.value: slot for slot in self.slots})
+        self.choices = tuple((slot.value, slot.label) for slot in self.slots)
+
+    def __reduce__(self):
+        # Stored in the shared cache tier; rebuild the lookups on load
+        return (SlotCatalog, (self.slots,))
+
+    @classmethod
+    def load(cls):
+        rows = TimeSlot.objects.filter(is_active=True).order_by('start_time').values_list('start_time', 'end_time')
+        return cls(
+            Slot(
+                start=start_time,
+                end=end_time,
+                value=f"{start_time.strftime('%H:%M')}-{end_time.strftime('%H:%M')}",
+                label=f"{start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')}",
+                start_minute=start_time.hour * 60 + start_time.minute,
+                end_minute=end_time.hour * 60 + end_time.minute,
+            )
+            for start_time, end_time in rows
+        )
+
+    def get(self, value):
+        return self.by_value.get(value)
+
+
+@warmup
+def slot_catalog():
+    """The active time slots, rebuilt only after a TimeSlot changed"""
+    return catalog_cache.get_or_set(TIMESLOTS, 'catalog', SlotCatalog.load)
+
+
+def invalidate_slot_catalog():
+    """Make every process rebuild its catalog on next use"""
+    catalog_cache.bump(TIMESLOTS)
@@ -5,15 +5,29 @@ urlpatterns = [
     path('', views.home, name="home"),
     path('room/<str:pk>/', views.room_detail, name="room-detail"),
     path('room/<str:room_id>/calendar/', views.room_calendar, name="room-calendar"),
+    path('room/calendar/<str:token>.ics', views.room_calendar_feed, name="room-calendar-feed"),
+    path('calendar/<str:token>.ics', views.user_calendar_feed, name="user-calendar-feed"),
+    path('room/<int:pk>/kiosk/', views.room_kiosk, name="room-kiosk"),
+    path('api/recommend/', views.recommend_times, name='recommend-times'),
+    path('api/attendees/conflicts/', views.attendee_availability, name='attendee-conflicts'),
+    path('api/reservations/batch/', views.batch_reservations, name='batch-reservations'),
+    path('api/freebusy/', views.room_freebusy, name="room-freebusy"),
+    path('rooms/status/stream/', views.room_status_stream, name="room-status-stream"),
     
     # Reservation routes
     path('room/<str:room_id>/reserve/', views.create_reservation, name="create-reservation"),
     path('my-reservations/', views.user_reservations, name="user-reservations"),
     path('cancel-reservation/<int:reservation_id>/', views.cancel_reservation, name='cancel-reservation'),
+    path('room/<int:room_id>/waitlist/', views.join_waitlist, name='join-waitlist'),
+    path('waitlist/<int:entry_id>/leave/', views.leave_waitlist, name='leave-waitlist'),
+    path('series/<int:series_id>/edit/', views.edit_series, name='edit-series'),
+    path('series/<int:series_id>/cancel/', views.cancel_series_view, name='cancel-series'),
     
     # Admin routes
     path('admin-dashboard/', views.admin_dashboard, name="admin-dashboard"),
     path('admin-reservations/', views.admin_reservations, name="admin-reservations"),
+    path('admin-reservations/import/', views.import_reservations, name="import-reservations"),
+    path('api/timeline/', views.room_timeline, name="room-timeline"),
     path('room-management/', views.room_management, name="room-management"),
     path('create-room/', views.create_room, name="create-room"),
     path('update-room/<str:pk>/', views.update_room, name="update-room"),
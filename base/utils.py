@@ -1,7 +1,9 @@
 # base/utils.py
 import threading
+from datetime import datetime, time, timedelta
 from django.core.mail import send_mail
 from django.conf import settings
+from django.utils import timezone
 import logging
 
 logger = logging.getLogger(__name__)
@@ -35,4 +37,23 @@ def send_email_in_background(subject, message_content, recipient_list, reservati
     """
     تابعی برای شروع ارسال ایمیل در یک ترد جداگانه.
     """
-    EmailThread(subject, message_content, recipient_list, reservation_id=reservation_id).start()
\ No newline at end of file
+    EmailThread(subject, message_content, recipient_list, reservation_id=reservation_id).start()
+
+
+def local_now():
+    """
+    Current wall-clock time in settings.TIME_ZONE as a naive datetime, the
+    form the date/start_time/end_time fields of a reservation are kept in.
+    Unlike datetime.now() it does not depend on the server's own timezone.
+    """
+    return timezone.localtime().replace(tzinfo=None)
+
+
+def aware(day, moment=time.min):
+    """A local date and wall-clock time as an aware datetime"""
+    return timezone.make_aware(datetime.combine(day, moment), timezone.get_default_timezone())
+
+
+def day_bounds(day):
+    """Aware start of ``day`` and of the next day"""
+    return aware(day), aware(day + timedelta(days=1))
@@ -1,48 +1,69 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.http import require_POST
 from django.db.models import Q
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.core.mail import send_mail
 from django.conf import settings
 from datetime import datetime, date, timedelta
-from .models import Room, Reservation, ChatMessage
-from .forms import RoomForm, UserCreateForm, ReservationForm
-from django.db import models
+from .models import Room, Reservation, ReservationSeries, WaitlistEntry, ChatMessage
+from .forms import RoomForm, UserCreateForm, ReservationForm, ReservationFilterForm, SeriesForm
+from .recurrence import SeriesConflict, cancel_series, create_series, update_series
+from django.db import models, transaction, IntegrityError
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync, sync_to_async
 from django.contrib.auth.tokens import default_token_generator
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode, http_date, quote_etag
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.core.cache import cache
+from django.utils import timezone
 from django.utils.encoding import force_bytes
 from django.contrib.sites.shortcuts import get_current_site
+import asyncio
+import hashlib
+import io
 import json
 from django.utils.safestring import mark_safe
 from django.core.serializers.json import DjangoJSONEncoder
 import logging
 logger = logging.getLogger(__name__)
 
-from .utils import send_email_in_background
+from .utils import day_bounds, local_now, send_email_in_background
+from .roomstatus import ROOM_STATUS_GROUP, reservation_summary
+from .caching import RESERVATIONS, ROOMS, catalog_cache
+from .timeline import MAX_TIMELINE_DAYS, build_timeline
+from .ical import (
+    feed_response, room_feed, room_feed_token, room_from_feed_token, user_feed, user_feed_token, user_from_feed_token,
+)
+from .importer import import_reservations as import_schedule
+from .freebusy import MAX_FREEBUSY_DAYS, MAX_FREEBUSY_ROOMS, busy_intervals, parse_window
+from .batch import MAX_BATCH_SIZE, book_batch, fingerprint
+from .recommend import EQUIPMENT, MAX_RECOMMEND_DAYS, MAX_RECOMMENDATIONS, recommend_slots
+from .waitlist import position, promote_waitlist
+from .pagination import COUNT_LIMIT, filter_query, keyset_page
+from .counters import TOTAL, counter_values, day_key, user_key
+from .attendees import MAX_ATTENDEE_LOOKUP, attendee_conflicts, describe_conflicts, parse_emails
 
 
 
 def home(request):
-    # Query all rooms
-    rooms = Room.objects.all()
+    # All rooms, from the catalog cache
+    rooms = Room.cached_list()
     
-    # Add current status to each room
-    for room in rooms:
-        room.current_status = room.get_current_status()
+    # Add current status to each room (room markup itself is fragment cached)
+    Room.attach_current_status(rooms)
     
     # Get upcoming reservations for the logged-in user
     upcoming_reservations = []
     if request.user.is_authenticated:
         upcoming_reservations = Reservation.objects.filter(
             user=request.user,
-            date__gte=datetime.now().date()
+            date__gte=timezone.localdate()
         ).order_by('date', 'start_time')[:3]
 
     context = {
@@ -58,7 +79,7 @@ def room_detail(request, pk):
     current_status = room.get_current_status()
     
     # Get today's date
-    today = datetime.now().date()
+    today = timezone.localdate()
     
     # Get available time slots for today
     available_slots = room.get_available_time_slots(today)
@@ -99,7 +120,7 @@ def room_calendar(request, room_id):
     room = get_object_or_404(Room, id=room_id)
     
     # Get date range (default: current week)
-    today = datetime.now().date()
+    today = timezone.localdate()
     start_date = request.GET.get('start_date', today.isoformat())
     
     try:
@@ -110,12 +131,14 @@ def room_calendar(request, room_id):
     # Generate date range (7 days)
     dates = [start_date + timedelta(days=i) for i in range(7)]
     
-    # Get reservations for the room in this date range
+    # Get reservations for the room in this date range (one index range scan)
+    week_start, _ = day_bounds(dates[0])
+    _, week_end = day_bounds(dates[-1])
     reservations = Reservation.objects.filter(
         room=room,
-        date__gte=dates[0],
-        date__lte=dates[-1]
-    ).order_by('date', 'start_time')
+        starts_at__gte=week_start,
+        starts_at__lt=week_end
+    ).select_related('user').order_by('starts_at')
     
     # Format reservations by date for easier template rendering
     reservation_by_date = {}
@@ -133,9 +156,159 @@ def room_calendar(request, room_id):
         'prev_week': (dates[0] - timedelta(days=7)).isoformat(),
         'next_week': (dates[0] + timedelta(days=7)).isoformat(),
         'today': today.isoformat(),
+        'calendar_feed_url': request.build_absolute_uri(reverse('room-calendar-feed', args=[room_feed_token(room)])),
     }
     return render(request, 'base/room_calendar.html', context)
 
+@login_required
+@staff_member_required
+def room_timeline(request):
+    """All rooms' reservations for a day or a range of days, as columnar JSON"""
+    try:
+        start = date.fromisoformat(request.GET['date']) if 'date' in request.GET else timezone.localdate()
+        days = int(request.GET.get('days', 1))
+    except ValueError:
+        return JsonResponse({'error': 'Expected date=YYYY-MM-DD and an integer days'}, status=400)
+    if not 1 <= days <= MAX_TIMELINE_DAYS:
+        return JsonResponse({'error': f'days must be between 1 and {MAX_TIMELINE_DAYS}'}, status=400)
+
+    # Any room or reservation change bumps one of these versions, so the
+    # ETag is checked without touching the database
+    key = f'timeline:{catalog_cache.version(ROOMS)}:{catalog_cache.version(RESERVATIONS)}:{start}:{days}'
+    etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+
+    body = catalog_cache.get_or_set(
+        RESERVATIONS, key,
+        lambda: json.dumps(build_timeline(start, days), separators=(',', ':')),
+    )
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def room_freebusy(request):
+    """Merged busy intervals of many rooms in a time window, for calendar sync"""
+    try:
+        room_ids = sorted({int(room_id) for room_id in request.GET.get('rooms', '').split(',') if room_id})
+        start, end = parse_window(request.GET['start'], request.GET.get('end'))
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Expected rooms=1,2,3, start and optionally end as ISO dates or datetimes'}, status=400)
+    if not room_ids or len(room_ids) > MAX_FREEBUSY_ROOMS:
+        return JsonResponse({'error': f'Ask for between 1 and {MAX_FREEBUSY_ROOMS} rooms'}, status=400)
+    if not start < end <= start + timedelta(days=MAX_FREEBUSY_DAYS):
+        return JsonResponse({'error': f'The window must be positive and at most {MAX_FREEBUSY_DAYS} days'}, status=400)
+
+    # Cached per (room set, window) until any reservation changes
+    rooms_hash = hashlib.md5(','.join(map(str, room_ids)).encode()).hexdigest()
+    key = f'freebusy:{catalog_cache.version(RESERVATIONS)}:{rooms_hash}:{start.isoformat()}:{end.isoformat()}'
+    etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+
+    body = catalog_cache.get_or_set(RESERVATIONS, key, lambda: json.dumps({
+        'start': start.isoformat(timespec='minutes'),
+        'end': end.isoformat(timespec='minutes'),
+        'busy': busy_intervals(room_ids, start, end),
+    }, separators=(',', ':')))
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+def room_calendar_feed(request, token):
+    """iCalendar feed of all reservations of a room"""
+    # Like the user feed: the signed token stands in for a login
+    room = get_object_or_404(Room, id=room_from_feed_token(token))
+    return feed_response(request, room_feed(room), room.name)
+
+def user_calendar_feed(request, token):
+    """iCalendar feed of the meetings a user booked or is invited to"""
+    # Calendar apps cannot log in, the signed token in the URL identifies the user
+    user = get_object_or_404(User, id=user_from_feed_token(token))
+    return feed_response(request, user_feed(user), f"{user.username}'s meetings")
+
+@login_required
+def attendee_availability(request):
+    """Which of the given people already have a meeting in a time range"""
+    try:
+        emails = parse_emails(request.GET['emails'])
+        day = date.fromisoformat(request.GET['date'])
+        start_time = datetime.strptime(request.GET['start'], '%H:%M').time()
+        end_time = datetime.strptime(request.GET['end'], '%H:%M').time()
+        exclude = [int(request.GET['exclude'])] if request.GET.get('exclude') else []
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Expected emails=a@x,b@y, date=YYYY-MM-DD, start and end as HH:MM'}, status=400)
+    if not emails or len(emails) > MAX_ATTENDEE_LOOKUP:
+        return JsonResponse({'error': f'Ask for between 1 and {MAX_ATTENDEE_LOOKUP} emails'}, status=400)
+    if end_time <= start_time:
+        return JsonResponse({'error': 'end must be after start'}, status=400)
+
+    conflicts = attendee_conflicts(emails, [day], start_time, end_time, exclude)
+    return JsonResponse({
+        'conflicts': {
+            email: [
+                {'date': busy_day.isoformat(), 'start': busy_start.strftime('%H:%M'),
+                 'end': busy_end.strftime('%H:%M'), 'room': room_name}
+                for busy_day, busy_start, busy_end, room_name in busy
+            ]
+            for email, busy in conflicts.items()
+        },
+    })
+
+@login_required
+def recommend_times(request):
+    """Earliest times when a suitable room and all invitees are free"""
+    try:
+        first_day = date.fromisoformat(request.GET['start'])
+        last_day = date.fromisoformat(request.GET['end']) if request.GET.get('end') else first_day + timedelta(days=13)
+        duration = int(request.GET.get('duration', 60))
+        min_capacity = int(request.GET.get('capacity', 1))
+        limit = int(request.GET.get('limit', 10))
+        emails = parse_emails(request.GET.get('emails', ''))
+        equipment = [name for name in request.GET.get('equipment', '').split(',') if name]
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Expected start=YYYY-MM-DD and optionally end, duration, capacity, equipment, emails and limit'}, status=400)
+    if not first_day <= last_day < first_day + timedelta(days=MAX_RECOMMEND_DAYS):
+        return JsonResponse({'error': f'The window must cover between 1 and {MAX_RECOMMEND_DAYS} days'}, status=400)
+    if not 1 <= duration <= 24 * 60 or not 1 <= limit <= MAX_RECOMMENDATIONS:
+        return JsonResponse({'error': f'duration is in minutes, at most one day; limit is at most {MAX_RECOMMENDATIONS}'}, status=400)
+    unknown = set(equipment) - set(EQUIPMENT)
+    if unknown:
+        return JsonResponse({'error': f'Unknown equipment {", ".join(sorted(unknown))}; use {", ".join(EQUIPMENT)}'}, status=400)
+    if len(emails) > MAX_ATTENDEE_LOOKUP:
+        return JsonResponse({'error': f'Ask for at most {MAX_ATTENDEE_LOOKUP} emails'}, status=400)
+
+    return JsonResponse({'recommendations': recommend_slots(
+        first_day, last_day, duration, emails, min_capacity, equipment, limit,
+    )})
+
+@login_required
+@require_POST
+def batch_reservations(request):
+    """Book many rooms and days at once from JSON, all or nothing"""
+    try:
+        payload = json.loads(request.body)
+        items = payload['reservations']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected {"reservations": [...]}'}, status=400)
+    if not isinstance(items, list) or not 1 <= len(items) <= MAX_BATCH_SIZE:
+        return JsonResponse({'error': f'Send between 1 and {MAX_BATCH_SIZE} reservations'}, status=400)
+    key = request.headers.get('Idempotency-Key', '').strip()
+    if len(key) > 255:
+        return JsonResponse({'error': 'Idempotency-Key is limited to 255 characters'}, status=400)
+
+    status, body, replayed = book_batch(request.user, items, key or None, fingerprint(payload))
+    response = JsonResponse(body, status=status)
+    if replayed:
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
 @login_required
 def create_reservation(request, room_id):
     room = get_object_or_404(Room, id=room_id)
@@ -169,15 +342,36 @@ def create_reservation(request, room_id):
             reservation.room = room
             reservation.user = request.user
             
-            time_slot_form = form.cleaned_data.get('time_slot') # تغییر نام متغیر
-            if not time_slot_form and 'time_slot' in initial_data:
-                time_slot_form = initial_data['time_slot']
-                
-            start_time_str, end_time_str = time_slot_form.split('-')
-            reservation.start_time = datetime.strptime(start_time_str, '%H:%M').time()
-            reservation.end_time = datetime.strptime(end_time_str, '%H:%M').time()
+            # زمان‌ها قبلا در فرم از کاتالوگ اسلات‌ها خوانده شده‌اند
+            reservation.start_time = start_time_form
+            reservation.end_time = end_time_form
             
-            reservation.save()
+            repeat = form.cleaned_data.get('repeat')
+            if repeat:
+                # همه تکرارها با یک کوئری بررسی و یکجا ذخیره می‌شوند
+                try:
+                    series, occurrences = create_series(
+                        reservation, repeat,
+                        until=form.cleaned_data.get('repeat_until'),
+                        count=form.cleaned_data.get('repeat_count'),
+                    )
+                except SeriesConflict as e:
+                    messages.error(request, f'The room is already booked on {e.display()}. The series was not created.')
+                    return render(request, 'base/reservation_form.html', {'form': form, 'room': room})
+                reservation = occurrences[0]
+            else:
+                occurrences = [reservation]
+                reservation.save()
+            
+            # دعوت‌شدگانی که در همان زمان جلسه دیگری دارند (یک کوئری روی ایندکس ایمیل‌ها)
+            busy = attendee_conflicts(
+                parse_emails(reservation.participants_emails) + [request.user.email],
+                [occurrence.date for occurrence in occurrences],
+                reservation.start_time, reservation.end_time,
+                exclude=[occurrence.id for occurrence in occurrences],
+            )
+            if busy:
+                messages.warning(request, f'Some invitees already have a meeting at that time: {describe_conflicts(busy)}')
             
             logger.info(f"========= SENDING MEETING CREATION NOTIFICATION (via Thread) FOR RESERVATION {reservation.id} =========")
             
@@ -225,27 +419,42 @@ def create_reservation(request, room_id):
     return render(request, 'base/reservation_form.html', context)
 
 
+# Orderings end in id so that every row has a distinct cursor
+USER_RESERVATION_ORDER = ('date', 'start_time', 'id')
+ADMIN_RESERVATION_ORDER = ('-date', 'start_time', 'id')
+
+
 @login_required
 def user_reservations(request):
-    reservations = Reservation.objects.filter(user=request.user).order_by('date', 'start_time')
+    reservations = Reservation.objects.filter(user=request.user).select_related('room')
     
     # Filter by status (upcoming, past)
     status = request.GET.get('status', 'upcoming')
-    today = datetime.now().date()
+    today = timezone.localdate()
     
     if status == 'past':
         reservations = reservations.filter(date__lt=today)
     else:  # upcoming
         reservations = reservations.filter(date__gte=today)
     
-    # Pagination
-    paginator = Paginator(reservations, 10)  # Show 10 reservations per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    filters = ReservationFilterForm(request.GET)
+    del filters.fields['user']
+    reservations = filters.filter(reservations)
+    
+    # صفحه‌بندی با cursor به جای OFFSET، تا صفحه‌های دور هم سریع باشند
+    page = keyset_page(
+        reservations, USER_RESERVATION_ORDER,
+        after=request.GET.get('after'), before=request.GET.get('before'),
+    )
     
     context = {
-        'reservations': page_obj,
+        'reservations': page,
         'status': status,
+        'filters': filters,
+        'query': filter_query(request, 'status', 'room', 'date_from', 'date_to'),
+        'waitlist': WaitlistEntry.objects.filter(
+            user=request.user, status=WaitlistEntry.WAITING, date__gte=today
+        ).select_related('room').order_by('date', 'start_time'),
     }
     return render(request, 'base/user_reservations.html', context)
 
@@ -259,8 +468,13 @@ def cancel_reservation(request, reservation_id):
         return redirect('home')
     
     if request.method == 'POST':
-        reservation.delete()
+        # آزاد شدن زمان و واگذاری آن به اولین نفر صف انتظار در یک تراکنش
+        with transaction.atomic():
+            reservation.delete()
+            promoted = promote_waitlist(reservation.room, reservation.date, reservation.start_time, reservation.end_time)
         messages.success(request, 'Reservation cancelled successfully!')
+        if promoted:
+            messages.info(request, 'The time was given to the next person on the waitlist.')
         
         # Redirect based on user type
         if request.user.is_staff:
@@ -275,22 +489,92 @@ def cancel_reservation(request, reservation_id):
     
     return render(request, 'base/delete.html', context)
 
+@login_required
+@require_POST
+def join_waitlist(request, room_id):
+    room = get_object_or_404(Room, id=room_id)
+    try:
+        day = date.fromisoformat(request.POST['date'])
+        start_time = datetime.strptime(request.POST['start'], '%H:%M').time()
+        end_time = datetime.strptime(request.POST['end'], '%H:%M').time()
+    except (KeyError, ValueError):
+        messages.error(request, 'Invalid waitlist request.')
+        return redirect('room-calendar', room_id=room.id)
+    
+    if end_time <= start_time or datetime.combine(day, end_time) <= local_now():
+        messages.error(request, 'You cannot wait for a time that has passed.')
+        return redirect('room-calendar', room_id=room.id)
+    if room.is_available(day, start_time, end_time):
+        # زمان آزاد است، نیازی به صف نیست
+        return redirect(f"{reverse('create-reservation', args=[room.id])}?date={day}&start={start_time:%H:%M}&end={end_time:%H:%M}")
+    
+    try:
+        with transaction.atomic():
+            entry = WaitlistEntry.objects.create(
+                room=room, user=request.user, date=day, start_time=start_time, end_time=end_time,
+                title=request.POST.get('title') or f"Meeting of {request.user.username}",
+            )
+    except IntegrityError:
+        messages.info(request, 'You are already on the waitlist for this time.')
+    else:
+        messages.success(request, f'You are number {position(entry)} on the waitlist. We will email you if the room frees up.')
+    return redirect(f"{reverse('room-calendar', args=[room.id])}?start_date={day}")
+
+@login_required
+@require_POST
+def leave_waitlist(request, entry_id):
+    entry = get_object_or_404(WaitlistEntry, id=entry_id, user=request.user, status=WaitlistEntry.WAITING)
+    entry.delete()
+    messages.success(request, 'You left the waitlist.')
+    return redirect('user-reservations')
+
+@login_required
+def edit_series(request, series_id):
+    series = get_object_or_404(ReservationSeries, id=series_id)
+    
+    if request.user != series.user and not request.user.is_staff:
+        messages.error(request, "You don't have permission to edit this series.")
+        return redirect('home')
+    
+    form = SeriesForm(request.POST or None, instance=series)
+    if request.method == 'POST' and form.is_valid():
+        changes = {field: form.cleaned_data[field] for field in form.Meta.fields + ['start_time', 'end_time']}
+        try:
+            update_series(series, **changes)
+        except SeriesConflict as e:
+            messages.error(request, f'The room is already booked on {e.display()} at that time.')
+        else:
+            messages.success(request, 'All upcoming meetings of the series were updated.')
+            return redirect('user-reservations')
+    
+    return render(request, 'base/series_form.html', {'form': form, 'series': series})
+
+@login_required
+def cancel_series_view(request, series_id):
+    series = get_object_or_404(ReservationSeries, id=series_id)
+    
+    if request.user != series.user and not request.user.is_staff:
+        messages.error(request, "You don't have permission to cancel this series.")
+        return redirect('home')
+    
+    if request.method == 'POST':
+        cancelled = cancel_series(series)
+        messages.success(request, f'Series cancelled, {cancelled} upcoming meetings removed.')
+        return redirect('admin-reservations' if request.user.is_staff else 'user-reservations')
+    
+    return render(request, 'base/delete.html', {'obj': series, 'type': 'series'})
+
 # Admin Views
 @login_required
 @staff_member_required
 def admin_dashboard(request):
     rooms = Room.objects.all()
     
-    # Count total reservations
-    total_reservations = Reservation.objects.count()
-    
-    # Count today's reservations
-    today = datetime.now().date()
-    today_reservations = Reservation.objects.filter(date=today).count()
+    # Total and today's reservations, read from the counters table
+    total_reservations, today_reservations = counter_values(TOTAL, day_key(timezone.localdate()))
     
-    # Add current status to each room
-    for room in rooms:
-        room.current_status = room.get_current_status()
+    # Add current status to each room (room markup itself is fragment cached)
+    Room.attach_current_status(rooms)
     
     context = {
         'rooms': rooms,
@@ -301,24 +585,46 @@ def admin_dashboard(request):
 
 @login_required
 @staff_member_required
-def admin_reservations(request):
-    reservations_list = Reservation.objects.all().order_by('-date', 'start_time')
+def import_reservations(request):
+    """Bulk import a CSV or iCalendar schedule"""
+    result = None
+    if request.method == 'POST':
+        upload = request.FILES.get('schedule')
+        if upload is None:
+            messages.error(request, 'Please choose a CSV or .ics file to import.')
+        else:
+            file_format = 'ics' if upload.name.lower().endswith('.ics') else 'csv'
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            try:
+                result = import_schedule(stream, request.user, file_format, dry_run='dry_run' in request.POST)
+            except IntegrityError:
+                # رزروی که همزمان ثبت شده با یکی از ردیف‌ها تداخل دارد
+                messages.error(request, 'Someone booked one of these slots while the file was being imported, so nothing was imported. Please try again.')
+            else:
+                if result.created:
+                    messages.success(request, result.summary())
+                else:
+                    messages.warning(request, result.summary())
     
-    # Pagination
-    paginator = Paginator(reservations_list, 10)  # Show 10 reservations per page
-    page = request.GET.get('page')
+    return render(request, 'base/import_reservations.html', {'result': result})
+
+@login_required
+@staff_member_required
+def admin_reservations(request):
+    filters = ReservationFilterForm(request.GET)
+    reservations = filters.filter(Reservation.objects.select_related('room', 'user'))
     
-    try:
-        reservations = paginator.page(page)
-    except PageNotAnInteger:
-        # If page is not an integer, deliver first page
-        reservations = paginator.page(1)
-    except EmptyPage:
-        # If page is out of range, deliver last page of results
-        reservations = paginator.page(paginator.num_pages)
+    # صفحه‌بندی با cursor؛ تعداد کل فقط تا COUNT_LIMIT شمرده می‌شود
+    page = keyset_page(
+        reservations, ADMIN_RESERVATION_ORDER,
+        after=request.GET.get('after'), before=request.GET.get('before'),
+        count_limit=COUNT_LIMIT,
+    )
     
     context = {
-        'reservations': reservations,
+        'reservations': page,
+        'filters': filters,
+        'query': filter_query(request, 'room', 'user', 'date_from', 'date_to'),
     }
     
     return render(request, 'base/admin_reservations.html', context)
@@ -379,9 +685,9 @@ def send_reservation_reminders(): #
     It will then dispatch email sending to background threads.
     """
     logger.info("========= STARTING EMAIL REMINDER PROCESS (Dispatching to Threads) =========")
-    logger.info(f"Current time: {datetime.now()}")
+    logger.info(f"Current time: {local_now()}")
     
-    tomorrow = datetime.now().date() + timedelta(days=1) #
+    tomorrow = timezone.localdate() + timedelta(days=1) #
     logger.info(f"Looking for reservations on: {tomorrow}")
     
     upcoming_reservations = Reservation.objects.filter( #
@@ -588,6 +894,56 @@ async def whiteboard_update(request):
         return JsonResponse({"status": "success"})
     return JsonResponse({"status": "error"}, status=400)
 
+async def room_status_stream(request):
+    """Server-Sent Events fallback for the ws/rooms/ status channel"""
+    channel_layer = get_channel_layer()
+    channel = await channel_layer.new_channel()
+    await channel_layer.group_add(ROOM_STATUS_GROUP, channel)
+
+    async def events():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(channel_layer.receive(channel), 15)
+                except asyncio.TimeoutError:
+                    # Keep proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: room_status\ndata: {json.dumps(event)}\n\n"
+        finally:
+            await channel_layer.group_discard(ROOM_STATUS_GROUP, channel)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def room_kiosk(request, pk):
+    """Compact now/next feed polled by the tablets outside each room"""
+    # Neither the session nor the user is touched, so a poll is one cache
+    # lookup and the response sets no cookies and can be shared by proxies
+    current_status = cache.get(Room.status_cache_key(pk))
+    if current_status is None:
+        room = get_object_or_404(Room, id=pk)
+        current_status = room.refresh_current_status()
+
+    expires = current_status['expires']
+    body = json.dumps({
+        'room_id': pk,
+        'status': current_status['status'],
+        'now': reservation_summary(current_status.get('reservation')),
+        'next': reservation_summary(current_status.get('next_reservation')),
+        'until': timezone.localtime(expires).strftime('%Y-%m-%dT%H:%M'),
+    })
+
+    # Fresh until the next start/end boundary, after that tablets revalidate
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = quote_etag(hashlib.md5(body.encode()).hexdigest())
+    response['Expires'] = http_date(expires.timestamp())
+    patch_cache_control(response, public=True, max_age=max(0, int((expires - timezone.now()).total_seconds())))
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
 @login_required
 def profile(request):
     user = request.user
@@ -595,22 +951,23 @@ def profile(request):
     # Get user's reservations
     upcoming_reservations = Reservation.objects.filter(
         user=user,
-        date__gte=datetime.now().date()
+        date__gte=timezone.localdate()
     ).order_by('date', 'start_time')[:5]
     
     past_reservations = Reservation.objects.filter(
         user=user,
-        date__lt=datetime.now().date()
+        date__lt=timezone.localdate()
     ).order_by('-date', 'start_time')[:5]
     
-    # Count total reservations
-    total_reservations = Reservation.objects.filter(user=user).count()
+    # Count total reservations (kept in the counters table)
+    total_reservations = counter_values(user_key(user.id))[0]
     
     context = {
         'user': user,
         'upcoming_reservations': upcoming_reservations,
         'past_reservations': past_reservations,
         'total_reservations': total_reservations,
+        'calendar_feed_url': request.build_absolute_uri(reverse('user-calendar-feed', args=[user_feed_token(user)])),
     }
     
     return render(request, 'base/profile.html', context)
@@ -0,0 +1,91 @@
+# base/waitlist.py
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Reservation, WaitlistEntry
+from .utils import send_email_in_background
+
+logger = logging.getLogger(__name__)
+
+
+def position(entry):
+    """1-based place of a waiting entry in its room and day's queue"""
+    ahead = WaitlistEntry.objects.filter(
+        room_id=entry.room_id, date=entry.date, status=WaitlistEntry.WAITING,
+        start_time__lt=entry.end_time, end_time__gt=entry.start_time,
+    ).filter(Q(created__lt=entry.created) | Q(created=entry.created, id__lt=entry.id))
+    return ahead.count() + 1
+
+
+def notify_promoted(reservation):
+    if not reservation.user.email:
+        return
+    send_email_in_background(
+        f"✅ You got {reservation.room.name}: {reservation.title}",
+        f"""
+        Good news!
+
+        A booking was cancelled and your waitlist request was confirmed:
+
+        📍 {reservation.room.name}
+        📆 {reservation.date}
+        ⏰ {reservation.start_time.strftime('%H:%M')} - {reservation.end_time.strftime('%H:%M')}
+
+        If you no longer need the room, please cancel the reservation so the next person can have it.
+        """,
+        [reservation.user.email],
+        reservation_id=reservation.id,
+    )
+
+
+def promote_waitlist(room, day, start_time, end_time):
+    """
+    Book a freed interval for the entries waiting on it, first come first
+    served, skipping entries that no longer fit. Intervals are compared as
+    aware spans, so bookings across midnight are seen on either day. Runs in
+    the caller's transaction; the promoted users are emailed after the commit.
+    """
+    now = timezone.now()
+    freed_start, freed_end = Reservation.span(day, start_time, end_time)
+    if freed_end <= now:
+        return []
+    # Entries of the day before or after can reach into a span across midnight
+    candidates = WaitlistEntry.objects.select_for_update().select_related('user').filter(
+        room=room, date__range=(day - timedelta(days=1), day + timedelta(days=1)), status=WaitlistEntry.WAITING,
+    ).order_by('created', 'id')
+    waiting = []
+    for entry in candidates:
+        span = Reservation.span(entry.date, entry.start_time, entry.end_time)
+        if span[0] < freed_end and span[1] > freed_start:
+            waiting.append((entry, span))
+    if not waiting:
+        return []
+
+    booked = list(Reservation.objects.filter(
+        room=room,
+        starts_at__lt=max(ends_at for _, (_, ends_at) in waiting),
+        ends_at__gt=min(starts_at for _, (starts_at, _) in waiting),
+    ).values_list('starts_at', 'ends_at'))
+
+    promoted = []
+    for entry, (starts_at, ends_at) in waiting:
+        if ends_at <= now or entry.participant_count > room.capacity:
+            continue
+        if any(busy_start < ends_at and busy_end > starts_at for busy_start, busy_end in booked):
+            continue
+        reservation = Reservation.objects.create(
+            room=room, user=entry.user, title=entry.title, date=entry.date,
+            start_time=entry.start_time, end_time=entry.end_time, participant_count=entry.participant_count,
+        )
+        entry.status = WaitlistEntry.PROMOTED
+        entry.reservation = reservation
+        entry.save(update_fields=['status', 'reservation'])
+        booked.append((starts_at, ends_at))
+        promoted.append(reservation)
+        logger.info(f"Waitlist entry {entry.id} promoted to reservation {reservation.id}")
+        transaction.on_commit(lambda reservation=reservation: notify_promoted(reservation))
+    return promoted
@@ -8,8 +8,13 @@ import base.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
 
+django_asgi_app = get_asgi_application()
+
+from base.caching import warm_up  # noqa: E402 - needs the app registry
+warm_up()
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AllowedHostsOriginValidator(
         AuthMiddlewareStack(
             URLRouter(
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 # تنظیم متغیر محیطی پیش‌فرض برای تنظیمات جنگو برای برنامه Celery
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
@@ -16,6 +17,13 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
+@worker_process_init.connect
+def warm_catalog_cache(**kwargs):
+    # پر کردن کش کاتالوگ (اتاق‌ها، اسلات‌ها) هنگام شروع هر worker
+    from base.caching import warm_up
+    warm_up()
+
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
\ No newline at end of file
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -151,12 +152,64 @@ DEFAULT_FROM_EMAIL = 'sumohast@gmail.com'  # ایمیل فرستنده
 ASGI_APPLICATION = 'myproject.asgi.application'
 
 # myproject/settings.py
+# Each meeting's groups live on one shard, picked by consistent hashing of the
+# reservation ID. Add more Redis instances to 'shards' to spread the load;
+# keep existing NAMEs unchanged so only a fraction of meetings move.
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'BACKEND': 'base.layers.ShardedChannelLayer',
         'CONFIG': {
-            "hosts": [('localhost', 6379)], 
+            'shards': [
+                {
+                    'NAME': 'redis-6379',
+                    'BACKEND': 'channels_redis.core.RedisChannelLayer',
+                    'CONFIG': {
+                        "hosts": [('localhost', 6379)],
+                    },
+                },
+            ],
         },
     },
 }
 
+# Shared cache for room status, rendered room cards, the chat event log and
+# the drain flag. Every web and worker process must see the same cache, so a
+# deployment with more than one process sets CACHE_URL to a Redis database,
+# e.g. redis://localhost:6379/1. Unset (or locmem://) falls back to the
+# per-process local memory cache, enough for runserver and the tests.
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if not CACHE_URL or CACHE_URL.startswith('locmem://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'meetroom',
+        }
+    }
+
+# Catalog data (rooms, time slots) is also kept in a per-process LRU of this
+# many entries in front of the shared cache. Other workers notice an
+# invalidation within CATALOG_CACHE_L1_TTL seconds.
+CATALOG_CACHE_L1_SIZE = int(os.environ.get('CATALOG_CACHE_L1_SIZE', 1024))
+CATALOG_CACHE_L1_TTL = float(os.environ.get('CATALOG_CACHE_L1_TTL', 5))
+
+# Recurring reservations are stored this many days ahead; run
+# `manage.py extend_series` daily to add occurrences as the window moves.
+RECURRENCE_HORIZON_DAYS = 180
+
+# Maximum number of ephemeral (typing / cursor / raise hand) broadcasts per
+# second for a single meeting group. Values are coalesced per sender between
+# broadcasts and never stored in the database. The limit is kept by each worker
+# process, so a meeting whose participants are spread over N workers can see
+# up to N * EPHEMERAL_MAX_RATE broadcasts per second.
+EPHEMERAL_MAX_RATE = 10
+
+# Seconds over which `manage.py drain_realtime` spreads WebSocket closes and
+# client reconnects during a deploy.
+REALTIME_DRAIN_WINDOW = 30
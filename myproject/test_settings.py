@@ -0,0 +1,12 @@
+# myproject/test_settings.py
+# python manage.py test --settings=myproject.test_settings
+from .settings import *  # noqa: F401,F403
+
+# The test suite runs without a Redis server
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+# Tests clear the shared cache between cases, the LRU must notice at once
+CATALOG_CACHE_L1_TTL = 0
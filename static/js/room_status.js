@@ -0,0 +1,35 @@
+// static/js/room_status.js
+
+// Subscribes to room status changes pushed by the server (ws/rooms/), falling
+// back to Server-Sent Events when WebSockets are not available. `onStatus` is
+// called with {room_id, status, reservation, next_reservation} for every change.
+function subscribeRoomStatus(sseUrl, onStatus) {
+    if (!('WebSocket' in window)) {
+        const source = new EventSource(sseUrl);
+        source.addEventListener('room_status', (event) => onStatus(JSON.parse(event.data)));
+        return;
+    }
+
+    const protocol = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
+    let reconnectHinted = false;
+
+    function connect() {
+        const socket = new WebSocket(`${protocol}${window.location.host}/ws/rooms/`);
+        socket.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            if (data.type === 'room_status') {
+                onStatus(data);
+            } else if (data.type === 'reconnect') {
+                reconnectHinted = true;
+            }
+        };
+        socket.onclose = () => {
+            // A draining server already spread our close time, otherwise back off a little
+            const delay = reconnectHinted ? Math.random() * 500 : 2000 + Math.random() * 3000;
+            reconnectHinted = false;
+            setTimeout(connect, delay);
+        };
+    }
+
+    connect();
+}